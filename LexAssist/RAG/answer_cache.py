@@ -0,0 +1,178 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+# seconds between checks of the published index generation
+FINGERPRINT_INTERVAL = 1.0
+
+# section numbers ("43", "66a") and Act names ("it act", "contract act"):
+# questions differing only in these are close in embedding space but have
+# different answers
+KEY_TERM = re.compile(r"\b(?:\d+[a-z]{0,2}|[a-z]+(?= act\b))")
+
+
+def normalize_question(question):
+    """Case, whitespace and trailing punctuation do not change the answer."""
+    return re.sub(r"\s+", " ", question.lower()).strip().rstrip("?.!").strip()
+
+
+def key_terms(question):
+    """Numbers and Act names a semantic match must share with the question."""
+    return frozenset(KEY_TERM.findall(normalize_question(question)))
+
+
+class AnswerCache:
+    """
+    Answer cache in front of run_query.
+
+    A question is answered from the cache when its normalized text matches a
+    cached one exactly, or when its embedding lies within max_distance
+    (cosine distance) of a cached question that cites the same section
+    numbers and Acts (max_distance=0 turns that semantic layer off). Entries
+    expire after ttl seconds
+    and the least recently used entry is dropped once max_entries is
+    reached. The whole cache is cleared whenever fingerprint() changes, i.e.
+    when a new index generation is published.
+    """
+
+    def __init__(self, embed, fingerprint, max_entries=1000, ttl=3600.0,
+                 max_distance=0.05):
+        self.embed = embed
+        self.fingerprint = fingerprint
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance
+
+        self._entries = OrderedDict()
+        self._matrix = None
+        self._matrix_keys = []
+        self._matrix_terms = []
+        self._lock = threading.Lock()
+        self._fingerprint = fingerprint()
+        self._checked_at = time.monotonic()
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.saved_seconds = 0.0
+
+    def _check_fingerprint(self):
+        now = time.monotonic()
+        if now - self._checked_at < FINGERPRINT_INTERVAL:
+            return
+        self._checked_at = now
+        current = self.fingerprint()
+        if current != self._fingerprint:
+            self._fingerprint = current
+            self._entries.clear()
+            self._matrix = None
+            self.invalidations += 1
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl
+        expired = [key for key, entry in self._entries.items() if entry["created"] < cutoff]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+
+    def _semantic_match(self, vector, terms):
+        if self._matrix is None:
+            self._matrix_keys = [
+                key for key, entry in self._entries.items() if entry["vector"] is not None
+            ]
+            self._matrix_terms = [self._entries[key]["terms"] for key in self._matrix_keys]
+            self._matrix = (
+                np.vstack([self._entries[key]["vector"] for key in self._matrix_keys])
+                if self._matrix_keys else np.empty((0, len(vector)), dtype=np.float32)
+            )
+        if not len(self._matrix_keys):
+            return None
+
+        similarities = self._matrix @ vector
+        # "section 43" must never be answered with "section 44"
+        for i, entry_terms in enumerate(self._matrix_terms):
+            if entry_terms != terms:
+                similarities[i] = -np.inf
+        best = int(np.argmax(similarities))
+        if 1.0 - float(similarities[best]) <= self.max_distance:
+            return self._matrix_keys[best]
+        return None
+
+    def get(self, question, vector=None):
+        """
+        Return (answer, vector). answer is None on a miss; vector is the
+        normalized question embedding to hand back to put(). Pass vector when
+        the question has already been embedded.
+        """
+        key = normalize_question(question)
+        with self._lock:
+            self._check_fingerprint()
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                self.saved_seconds += entry["seconds"]
+                return entry["answer"], entry["vector"]
+
+        if self.max_distance <= 0:
+            vector = None
+        else:
+            if vector is None:
+                vector = self.embed(question)
+            vector = np.array(vector, dtype=np.float32)
+            vector /= max(float(np.linalg.norm(vector)), 1e-12)
+
+        with self._lock:
+            match = self._semantic_match(vector, key_terms(question)) if vector is not None else None
+            if match is not None and match in self._entries:
+                self._entries.move_to_end(match)
+                entry = self._entries[match]
+                self.semantic_hits += 1
+                self.saved_seconds += entry["seconds"]
+                return entry["answer"], vector
+
+            self.misses += 1
+        return None, vector
+
+    def put(self, question, answer, vector=None, seconds=0.0):
+        """Cache an answer; seconds is what computing it cost, for the stats."""
+        key = normalize_question(question)
+        with self._lock:
+            self._entries[key] = {
+                "answer": answer,
+                "vector": vector,
+                "terms": key_terms(question),
+                "seconds": seconds,
+                "created": time.monotonic(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self):
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            lookups = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "lookups": lookups,
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "latency_saved_seconds": round(self.saved_seconds, 3),
+                "invalidations": self.invalidations,
+            }
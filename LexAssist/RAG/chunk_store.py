@@ -0,0 +1,335 @@
+import json
+import mmap
+import os
+import shutil
+import struct
+from array import array
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+from vector_index import (
+    DEFAULT_EF_SEARCH,
+    DEFAULT_NPROBE,
+    index_filename,
+    search,
+    set_search_params,
+)
+
+
+# layout of one index generation inside legal_faiss_db/
+CURRENT_FILE = "CURRENT"
+INDEX_FILE = "index.faiss"
+
+# the pickled LangChain store, at the top of legal_faiss_db/, that
+# generations replace; data_ingestion.py removes it once it has built one
+LEGACY_FILES = ("index.pkl", "index.faiss")
+MANIFEST_FILE = "manifest.json"
+TEXT_FILE = "chunks.text"
+OFFSETS_FILE = "chunks.offsets.npy"
+PAGES_FILE = "chunks.page.npy"
+SOURCES_FILE = "chunks.source.npy"
+META_FILE = "chunks.json"
+
+
+def current_generation(db_dir):
+    """Return the directory of the published index generation, or None."""
+    try:
+        with open(os.path.join(db_dir, CURRENT_FILE), encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(db_dir, name) if name else None
+
+
+def new_generation(db_dir):
+    """Create and return an empty directory for the next index generation."""
+    os.makedirs(db_dir, exist_ok=True)
+    numbers = [
+        int(name[4:]) for name in os.listdir(db_dir)
+        if name.startswith("gen-") and name[4:].isdigit()
+    ]
+    path = os.path.join(db_dir, f"gen-{max(numbers, default=0) + 1:06d}")
+    os.makedirs(path)
+    return path
+
+
+def publish_generation(db_dir, gen_dir):
+    """
+    Atomically point CURRENT at gen_dir.
+
+    The generation it replaces is kept, since running workers may still have
+    it mapped; anything older, or left behind by an interrupted run, is removed.
+    """
+    previous = current_generation(db_dir)
+
+    tmp_path = os.path.join(db_dir, CURRENT_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(os.path.basename(gen_dir))
+    os.replace(tmp_path, os.path.join(db_dir, CURRENT_FILE))
+
+    keep = {os.path.basename(gen_dir)}
+    if previous is not None:
+        keep.add(os.path.basename(previous))
+
+    for name in os.listdir(db_dir):
+        if name.startswith("gen-") and name not in keep:
+            # open memory maps can keep files busy on Windows, try again next run
+            shutil.rmtree(os.path.join(db_dir, name), ignore_errors=True)
+
+
+def unpublish(db_dir):
+    path = os.path.join(db_dir, CURRENT_FILE)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def read_index_mmap(path):
+    """Open a FAISS index without copying its vectors into process memory."""
+    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+
+    # newer faiss releases can also map the codes of flat and HNSW indexes,
+    # IVF indexes only support mapping their inverted lists
+    mmap_codes = getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+    if mmap_codes:
+        try:
+            return faiss.read_index(path, flags | mmap_codes)
+        except RuntimeError:
+            pass
+    return faiss.read_index(path, flags)
+
+
+class FlatIndexWriter:
+    """
+    Append float32 vectors to an index.faiss file as they are computed.
+
+    The file has the layout faiss.write_index gives an IndexFlatL2, so it is
+    read back with read_index_mmap, but vectors go straight to disk instead of
+    accumulating in an in-memory index. The header, which holds the vector
+    count, is written on close.
+    """
+
+    # fourcc, d, ntotal, two unused fields, is_trained, metric type, float count
+    HEADER = struct.Struct("<4siqqq?iQ")
+
+    def __init__(self, path):
+        self.path = path
+        self.d = None
+        self.ntotal = 0
+        self._file = open(path + ".tmp", "w+b")
+        self._file.write(b"\0" * self.HEADER.size)
+
+    def append(self, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.d is None:
+            self.d = vectors.shape[1]
+        self._file.write(vectors.tobytes())
+        self.ntotal += len(vectors)
+
+    def vector(self, row):
+        """Read back a vector already appended."""
+        self._file.flush()
+        return np.fromfile(
+            self.path + ".tmp", dtype=np.float32, count=self.d,
+            offset=self.HEADER.size + row * self.d * 4
+        )
+
+    def close(self):
+        """Finish the file; returns False, and writes nothing, when it is empty."""
+        if self.d is None:
+            self._file.close()
+            os.remove(self.path + ".tmp")
+            return False
+
+        self._file.seek(0)
+        self._file.write(self.HEADER.pack(
+            b"IxF2", self.d, self.ntotal, 1 << 20, 1 << 20, True,
+            faiss.METRIC_L2, self.ntotal * self.d
+        ))
+        self._file.close()
+        os.replace(self.path + ".tmp", self.path)
+        return True
+
+
+class ChunkStore:
+    """
+    Read-only columnar chunk store: one UTF-8 text blob plus offset, page and
+    source arrays, all memory-mapped.
+
+    Opening a store only maps the files, so it costs the same for any corpus
+    size, and every worker process shares the same pages in the OS cache.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(os.path.join(path, META_FILE), encoding="utf-8") as f:
+            self.sources = json.load(f)["sources"]
+
+        self.offsets = np.load(os.path.join(path, OFFSETS_FILE), mmap_mode="r")
+        self.pages = np.load(os.path.join(path, PAGES_FILE), mmap_mode="r")
+        self.source_ids = np.load(os.path.join(path, SOURCES_FILE), mmap_mode="r")
+
+        self._text_file = open(os.path.join(path, TEXT_FILE), "rb")
+        if os.fstat(self._text_file.fileno()).st_size:
+            self._text = mmap.mmap(self._text_file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._text = b""
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def text(self, row):
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return self._text[start:end].decode("utf-8")
+
+    def metadata(self, row):
+        return {
+            "source": self.sources[int(self.source_ids[row])],
+            "page": int(self.pages[row]),
+            "row": int(row),
+        }
+
+    def document(self, row):
+        return Document(page_content=self.text(row), metadata=self.metadata(row))
+
+    def close(self):
+        if isinstance(self._text, mmap.mmap):
+            self._text.close()
+        self._text_file.close()
+
+
+class ChunkStoreWriter:
+    """Append chunks to a new ChunkStore directory, one row at a time."""
+
+    def __init__(self, path):
+        self.path = path
+        self.offsets = array("Q", [0])
+        self.pages = array("i")
+        self.source_ids = array("i")
+        self.sources = []
+        self._source_index = {}
+        self._text_file = open(os.path.join(path, TEXT_FILE), "wb")
+
+    def __len__(self):
+        return len(self.pages)
+
+    def _source_id(self, source):
+        if source not in self._source_index:
+            self._source_index[source] = len(self.sources)
+            self.sources.append(source)
+        return self._source_index[source]
+
+    def append(self, text, metadata):
+        data = text.encode("utf-8")
+        self._text_file.write(data)
+        self.offsets.append(self.offsets[-1] + len(data))
+        self.pages.append(int(metadata.get("page", 0)))
+        self.source_ids.append(self._source_id(metadata["source"]))
+
+    def copy_rows(self, store, start, end):
+        """Copy rows [start, end) of another store without decoding the text."""
+        if end <= start:
+            return
+        first, last = int(store.offsets[start]), int(store.offsets[end])
+        self._text_file.write(store._text[first:last])
+
+        offsets = np.asarray(store.offsets[start + 1:end + 1], dtype=np.int64)
+        offsets += self.offsets[-1] - first
+        self.offsets.frombytes(offsets.astype(np.uint64).tobytes())
+        self.pages.frombytes(np.asarray(store.pages[start:end], dtype=np.int32).tobytes())
+
+        # source ids are renumbered for this store
+        old_ids = np.asarray(store.source_ids[start:end], dtype=np.int32)
+        remap = {int(i): self._source_id(store.sources[int(i)]) for i in np.unique(old_ids)}
+        lookup = np.zeros(max(remap) + 1, dtype=np.int32)
+        for old_id, new_id in remap.items():
+            lookup[old_id] = new_id
+        self.source_ids.frombytes(lookup[old_ids].tobytes())
+
+    def close(self):
+        self._text_file.close()
+        np.save(os.path.join(self.path, OFFSETS_FILE), np.frombuffer(self.offsets, dtype=np.uint64))
+        np.save(os.path.join(self.path, PAGES_FILE), np.frombuffer(self.pages, dtype=np.int32))
+        np.save(os.path.join(self.path, SOURCES_FILE), np.frombuffer(self.source_ids, dtype=np.int32))
+        with open(os.path.join(self.path, META_FILE), "w", encoding="utf-8") as f:
+            json.dump({"count": len(self), "sources": self.sources}, f)
+
+
+class MmapVectorStore:
+    """
+    Memory-mapped replacement for the LangChain FAISS store.
+
+    Row i of the FAISS index is row i of the ChunkStore, so a search hit maps
+    straight to its text and metadata. Only the methods run_query uses are
+    provided.
+    """
+
+    def __init__(self, index, chunks, embeddings, exact_index=None):
+        self.index = index
+        self.chunks = chunks
+        self.embeddings = embeddings
+        self.exact_index = exact_index if exact_index is not None else index
+
+    @classmethod
+    def load(cls, db_dir, embeddings, index_type="flat",
+             nprobe=DEFAULT_NPROBE, ef_search=DEFAULT_EF_SEARCH):
+        gen_dir = current_generation(db_dir)
+        if gen_dir is None:
+            if any(os.path.exists(os.path.join(db_dir, name)) for name in LEGACY_FILES):
+                raise FileNotFoundError(
+                    f"{db_dir} holds a pre-generation index.pkl, "
+                    "run data_ingestion.py once to migrate it"
+                )
+            raise FileNotFoundError(
+                f"No index found in {db_dir}, run data_ingestion.py first"
+            )
+        exact_index = read_index_mmap(os.path.join(gen_dir, INDEX_FILE))
+
+        index = exact_index
+        ann_path = os.path.join(gen_dir, index_filename(index_type))
+        if index_type != "flat":
+            if os.path.exists(ann_path):
+                index = read_index_mmap(ann_path)
+                set_search_params(index, nprobe=nprobe, ef_search=ef_search)
+            else:
+                print(
+                    f"Warning: no {index_type} index in {gen_dir}, "
+                    "using the exact flat index"
+                )
+
+        return cls(index, ChunkStore(gen_dir), embeddings, exact_index)
+
+    def set_search_params(self, nprobe=DEFAULT_NPROBE, ef_search=DEFAULT_EF_SEARCH):
+        set_search_params(self.index, nprobe=nprobe, ef_search=ef_search)
+
+    def similarity_search_with_score_by_vectors(self, embeddings, k=4):
+        """Search a matrix of query vectors at once, one hit list per query."""
+        if not len(embeddings):
+            return []
+        distances, rows = search(
+            self.index, embeddings, k, exact_index=self.exact_index
+        )
+        return [
+            [
+                (self.chunks.document(row), float(distance))
+                for distance, row in zip(query_distances, query_rows)
+                if row != -1
+            ]
+            for query_distances, query_rows in zip(distances, rows)
+        ]
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4):
+        return self.similarity_search_with_score_by_vectors([embedding], k)[0]
+
+    def distances(self, embedding, rows):
+        """Exact L2 distances from embedding to the given rows."""
+        vectors = np.vstack([self.exact_index.reconstruct(int(row)) for row in rows])
+        query = np.asarray(embedding, dtype=np.float32)
+        return ((vectors - query) ** 2).sum(axis=1).tolist()
+
+    def similarity_search_with_score(self, query, k=4):
+        return self.similarity_search_with_score_by_vector(
+            self.embeddings.embed_query(query), k
+        )
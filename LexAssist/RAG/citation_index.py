@@ -0,0 +1,231 @@
+import json
+import os
+import re
+from bisect import bisect_left
+
+from chunk_store import ChunkStore
+
+
+# (act, section) and (act, chapter) -> chunk rows, inside an index generation
+CITATIONS_FILE = "citations.json"
+
+# rows fetched for one citation, a long chapter is cut after this many
+MAX_SECTION_ROWS = 8
+MAX_CHAPTER_ROWS = 12
+
+# rows looked at together to tell the table of contents from the body
+CONTENTS_WINDOW = 10
+
+# "43. Penalty and compensation ..." at the start of a line, amended sections
+# carry footnote markers: "1[66A. Punishment ...", "43. 6[Penalty ..."
+SECTION_HEADING = re.compile(
+    r"(?m)^(?:\d{1,2}\[)?\W{0,3}(\d{1,3})([A-Z]{0,2})\.\s*(?:\d{0,2}\[)?([A-Z][a-z]\S*)"
+)
+CHAPTER_HEADING = re.compile(r"(?m)^\s*CHAPTER\s+([IVXLC]+|\d+)([A-Z]?)\s*$")
+ACT_TITLE = re.compile(r"THE\s+([A-Z][A-Z ]+?)\s+ACT,?\s*(\d{4})")
+
+# footnotes are numbered like sections ("2. Subs. by Act 10 of 2009")
+FOOTNOTE_WORDS = {"Subs", "Ins", "See", "Omitted", "Rep", "Added", "Vide", "The", "Cl"}
+
+# citations in a question: "section 66A", "sec. 43", "s. 10", "chapter IX";
+# abbreviations need their dot and possessives are not citations ("a firm's 3 partners")
+SECTION_CITATION = re.compile(r"(?<!['\u2019])\b(?:section|sec\.|s\.)\s*(\d{1,3})([a-z]{0,2})\b")
+CHAPTER_CITATION = re.compile(r"\bchapter\s+([ivxlc]+|\d+)([a-z]?)\b")
+
+# "... of the Companies Act": an Act is named, known to the index or not
+NAMED_ACT = re.compile(r" (?!(?:the|this|that|said|an|a) act )[a-z]+ act ")
+
+ROMAN = {"i": 1, "v": 5, "x": 10, "l": 50, "c": 100}
+
+
+def roman_to_int(text):
+    if text.isdigit():
+        return int(text)
+    values = [ROMAN[c] for c in text.lower()]
+    return sum(-v if v < nxt else v for v, nxt in zip(values, values[1:] + [0]))
+
+
+def normalize(text):
+    return " " + " ".join(re.findall(r"[a-z0-9]+", text.lower())) + " "
+
+
+def act_aliases(source, title):
+    """Names a question may use for an Act: full title, short title, acronym, file name."""
+    stem = os.path.splitext(os.path.basename(source))[0]
+    stem = normalize(re.sub(r"\(?\d{4}\)?", " ", stem)).strip()
+    aliases = {stem}
+    if title:
+        words = title.lower().split()
+        aliases.update({
+            " ".join(words) + " act",
+            " ".join(words),
+            "".join(w[0] for w in words) + " act",
+        })
+        # "indian contract act" is usually just "contract act"
+        if len(words) > 1:
+            aliases.add(" ".join(words[1:]) + " act")
+    return sorted(a for a in aliases if a)
+
+
+def _increasing(headings):
+    """
+    Longest run of headings whose numbers increase in row order.
+
+    The table of contents, footnotes and cross references also look like
+    headings; the body of an Act is the longest increasing sequence.
+    """
+    tails, tail_ids, previous = [], [], [None] * len(headings)
+    for i, (key, _) in enumerate(headings):
+        pos = bisect_left(tails, key)
+        previous[i] = tail_ids[pos - 1] if pos else None
+        if pos == len(tails):
+            tails.append(key)
+            tail_ids.append(i)
+        else:
+            tails[pos] = key
+            tail_ids[pos] = i
+
+    chosen = []
+    i = tail_ids[-1] if tail_ids else None
+    while i is not None:
+        chosen.append(headings[i])
+        i = previous[i]
+    return chosen[::-1]
+
+
+def _ranges(headings, last_row, max_rows):
+    """Map each heading to the rows up to, and including, the next heading's row."""
+    ranges = {}
+    for i, ((number, suffix), row) in enumerate(headings):
+        end = headings[i + 1][1] if i + 1 < len(headings) else last_row
+        ranges[f"{number}{suffix}"] = [row, min(end, row + max_rows - 1)]
+    return ranges
+
+
+def _skip_contents(store, rows):
+    """
+    Drop the leading "arrangement of sections" of an Act.
+
+    The table of contents lists several headings per row, the body rarely
+    one; the contents end where a window of rows averages less than one.
+    """
+    counts = [
+        sum(not _is_footnote(m) for m in SECTION_HEADING.finditer(store.text(row)))
+        for row in rows
+    ]
+    start = 0
+    while start < len(counts) and sum(counts[start:start + CONTENTS_WINDOW]) >= CONTENTS_WINDOW:
+        start += 1
+    return rows[start:]
+
+
+def _is_footnote(match):
+    return match.group(3).rstrip(".") in FOOTNOTE_WORDS
+
+
+def _find_headings(store, rows, pattern, number_of, skip=None):
+    found, seen = [], set()
+    for row in rows:
+        for match in pattern.finditer(store.text(row)):
+            if skip and skip(match):
+                continue
+            key = (number_of(match.group(1)), match.group(2).upper())
+            # chunk overlap repeats a heading at the start of the next row
+            if (key, row - 1) in seen:
+                continue
+            seen.add((key, row))
+            found.append((key, row))
+    return found
+
+
+def build_citation_index(gen_dir):
+    """Parse section and chapter headings of every Act in the chunk store."""
+    store = ChunkStore(gen_dir)
+
+    by_source = {}
+    for row in range(len(store)):
+        by_source.setdefault(int(store.source_ids[row]), []).append(row)
+
+    acts, sections, chapters = [], {}, {}
+    for source_id, rows in sorted(by_source.items()):
+        source = store.sources[source_id]
+        match = ACT_TITLE.search(" ".join(store.text(row) for row in rows[:3]))
+        title = match.group(1).strip() if match else None
+
+        act = len(acts)
+        acts.append({"source": source, "title": title, "aliases": act_aliases(source, title)})
+
+        body = _skip_contents(store, rows)
+        found = _find_headings(store, body, SECTION_HEADING, int, skip=_is_footnote)
+        for number, span in _ranges(_increasing(found), rows[-1], MAX_SECTION_ROWS).items():
+            sections[f"{act}:{number}"] = span
+
+        found = _find_headings(store, body, CHAPTER_HEADING, roman_to_int)
+        for number, span in _ranges(_increasing(found), rows[-1], MAX_CHAPTER_ROWS).items():
+            chapters[f"{act}:{number}"] = span
+    store.close()
+
+    path = os.path.join(gen_dir, CITATIONS_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"acts": acts, "sections": sections, "chapters": chapters}, f)
+    os.replace(path + ".tmp", path)
+    print(f"Indexed {len(sections)} sections and {len(chapters)} chapters of {len(acts)} Acts")
+
+
+def has_citation_index(gen_dir):
+    return os.path.exists(os.path.join(gen_dir, CITATIONS_FILE))
+
+
+class CitationIndex:
+    """Direct (act, section) and (act, chapter) lookup of chunk rows."""
+
+    def __init__(self, gen_dir):
+        with open(os.path.join(gen_dir, CITATIONS_FILE), encoding="utf-8") as f:
+            data = json.load(f)
+        self.acts = data["acts"]
+        self.tables = {"section": data["sections"], "chapter": data["chapters"]}
+
+    def find_act(self, normalized_question):
+        """Index of the Act named in the question, preferring the longest name."""
+        best, best_len = None, 0
+        for act, info in enumerate(self.acts):
+            for alias in info["aliases"]:
+                if f" {alias} " in normalized_question and len(alias) > best_len:
+                    best, best_len = act, len(alias)
+        return best
+
+    def lookup(self, question):
+        """
+        Return (act title or source, kind, number, rows) when the question
+        cites exactly one section or chapter that is in the index, else None.
+        """
+        text = question.lower()
+        citations = [
+            ("section", f"{int(m.group(1))}{m.group(2).upper()}")
+            for m in SECTION_CITATION.finditer(text)
+        ] + [
+            ("chapter", f"{roman_to_int(m.group(1))}{m.group(2).upper()}")
+            for m in CHAPTER_CITATION.finditer(text)
+        ]
+        if len(set(citations)) != 1:
+            return None
+        kind, number = citations[0]
+        table = self.tables[kind]
+
+        normalized = normalize(question)
+        act = self.find_act(normalized)
+        if act is None:
+            # an Act the index does not have: leave it to retrieval
+            if NAMED_ACT.search(normalized):
+                return None
+            # no Act named: only answer when a single Act has that number
+            candidates = [a for a in range(len(self.acts)) if f"{a}:{number}" in table]
+            if len(candidates) != 1:
+                return None
+            act = candidates[0]
+
+        span = table.get(f"{act}:{number}")
+        if span is None:
+            return None
+        info = self.acts[act]
+        return info["title"] or info["source"], kind, number, range(span[0], span[1] + 1)
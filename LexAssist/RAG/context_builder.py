@@ -0,0 +1,135 @@
+import re
+
+from tokens import count_tokens
+
+
+# shortest shared text treated as splitter overlap rather than a coincidence
+MIN_OVERLAP_CHARS = 8
+
+# share of a passage's word shingles already in the context that makes it a
+# near-duplicate (repealed text quoted twice, the same clause in two Acts)
+DUPLICATE_SHINGLES = 0.8
+SHINGLE_WORDS = 3
+
+WORD = re.compile(r"\w+")
+
+
+def overlap_length(previous, text):
+    """Length of the longest suffix of previous that text starts with."""
+    for n in range(min(len(previous), len(text)), MIN_OVERLAP_CHARS - 1, -1):
+        if previous.endswith(text[:n]):
+            return n
+    return 0
+
+
+def shingles(text):
+    words = WORD.findall(text.lower())
+    if len(words) < SHINGLE_WORDS:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+class Passage:
+    """Consecutive chunk rows of one page, with the splitter overlap removed."""
+
+    def __init__(self, doc, rank):
+        self.source = doc.metadata.get("source")
+        self.page = doc.metadata.get("page")
+        self.first = self.last = doc.metadata.get("row")
+        self.rank = rank
+        self.text = doc.page_content
+
+    def follows(self, doc):
+        return (
+            self.last is not None
+            and doc.metadata.get("row") == self.last + 1
+            and doc.metadata.get("source") == self.source
+            and doc.metadata.get("page") == self.page
+        )
+
+    def append(self, doc, rank):
+        text = doc.page_content
+        n = overlap_length(self.text, text)
+        self.text += text[n:] if n else "\n" + text
+        self.last = doc.metadata.get("row")
+        self.rank = min(self.rank, rank)
+
+
+def merge_adjacent(results):
+    """
+    Group the hits into passages of consecutive rows.
+
+    A passage ranks as its best hit; hits without a row stay on their own.
+    """
+    ranked = list(enumerate(doc for doc, _ in results))
+    ranked.sort(key=lambda hit: (
+        str(hit[1].metadata.get("source")),
+        hit[1].metadata.get("row", -1),
+    ))
+
+    passages, seen = [], set()
+    for rank, doc in ranked:
+        row = doc.metadata.get("row")
+        if row is not None:
+            # the same row can come back from FAISS and BM25 fusion
+            if (doc.metadata.get("source"), row) in seen:
+                continue
+            seen.add((doc.metadata.get("source"), row))
+        if passages and passages[-1].follows(doc):
+            passages[-1].append(doc, rank)
+        else:
+            passages.append(Passage(doc, rank))
+    return passages
+
+
+def truncate(text, token_budget):
+    """Leading lines of text that fit token_budget, at least part of one."""
+    kept, used = [], 0
+    for line in text.split("\n"):
+        tokens = count_tokens(line)
+        if used + tokens > token_budget:
+            break
+        kept.append(line)
+        used += tokens
+    if kept:
+        return "\n".join(kept)
+    words = text.split(" ")
+    while len(words) > 1 and count_tokens(" ".join(words)) > token_budget:
+        words = words[:max(1, len(words) * 3 // 4)]
+    return " ".join(words)
+
+
+def assemble_context(results, token_budget):
+    """
+    Prompt context for the (Document, distance) hits of one question.
+
+    Adjacent rows of a page are merged and their overlap dropped, passages
+    mostly repeating one already kept are skipped, then passages are kept by
+    rank while they fit token_budget and written in document order.
+    """
+    passages = merge_adjacent(results)
+
+    kept, used, seen = [], 0, set()
+    for passage in sorted(passages, key=lambda p: p.rank):
+        grams = shingles(passage.text)
+        if grams and len(grams & seen) >= DUPLICATE_SHINGLES * len(grams):
+            continue
+
+        tokens = count_tokens(passage.text)
+        if used + tokens > token_budget:
+            if kept:
+                # a shorter passage further down may still fit
+                continue
+            passage.text = truncate(passage.text, token_budget)
+            tokens = count_tokens(passage.text)
+
+        kept.append(passage)
+        used += tokens
+        seen |= grams
+
+    # documents in the order of their best passage, passages in page order
+    source_rank = {}
+    for passage in kept:
+        source_rank.setdefault(passage.source, passage.rank)
+    kept.sort(key=lambda p: (source_rank[p.source], p.first if p.first is not None else -1))
+    return "\n\n".join(p.text for p in kept)
@@ -1,39 +1,575 @@
-from langchain_community.document_loaders import DirectoryLoader, PyMuPDFLoader
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from langchain_community.document_loaders import PyMuPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
+import faiss
 
-#data loading
+from chunk_store import (
+    ChunkStore,
+    ChunkStoreWriter,
+    FlatIndexWriter,
+    INDEX_FILE,
+    LEGACY_FILES,
+    MANIFEST_FILE,
+    current_generation,
+    new_generation,
+    publish_generation,
+    read_index_mmap,
+    unpublish,
+)
+from embedding_backends import (
+    EMBEDDING_BACKEND,
+    EMBEDDING_BACKENDS,
+    embedding_model_id,
+    load_embeddings,
+)
+from embedding_cache import cached_embeddings, DEFAULT_CACHE_PATH, DEFAULT_MAX_MB
+from citation_index import build_citation_index, has_citation_index
+from lexical_index import build_lexical_index, has_lexical_index, lexical_index_outdated
+from vector_index import (
+    INDEX_TYPES,
+    build_index,
+    evaluate,
+    index_filename,
+    sample_queries,
+    write_index,
+)
 
-DATA_DIR = "data"
+# Get the directory where this script is located
+RAG_DIR = os.path.dirname(os.path.abspath(__file__))
 
-loader = DirectoryLoader(
-    path=DATA_DIR,
-    glob="**/*.pdf",
-    loader_cls=PyMuPDFLoader
-)
+DATA_DIR = os.path.join(RAG_DIR, "data")
+DB_DIR = os.path.join(RAG_DIR, "legal_faiss_db")
 
-documents = loader.load()
+CHUNK_SIZE = 250
+CHUNK_OVERLAP = 50
 
-print(f"Loaded {len(documents)} pages from PDFs")
+# chunks embedded and appended to the index per batch
+DEFAULT_BATCH_SIZE = 256
 
-#Splitting into chunks
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=250,
-    chunk_overlap=50
-)
+# similarity cutoff used by query.py, checked by the --report comparison
+SIMILARITY_THRESHOLD = 2.3
 
-chunks = text_splitter.split_documents(documents)
+# rows copied at a time from the previous generation
+COPY_BATCH = 65536
 
-print(f"Created {len(chunks)} text chunks")
+# bump whenever the chunk store or manifest layout changes
+MANIFEST_VERSION = 3
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def text_sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+def scan_pdfs(data_dir):
+    """Return {relative path: content hash} for every PDF under data_dir."""
+    files = {}
+    for root, _, names in os.walk(data_dir):
+        for name in names:
+            if name.lower().endswith(".pdf"):
+                path = os.path.join(root, name)
+                rel_path = os.path.relpath(path, data_dir).replace(os.sep, "/")
+                files[rel_path] = file_sha256(path)
+    return dict(sorted(files.items()))
+
+
+def manifest_settings(backend=EMBEDDING_BACKEND):
+    # any change here invalidates every stored chunk, so switching the
+    # embedding backend re-embeds the whole corpus
+    return {
+        "version": MANIFEST_VERSION,
+        "model": embedding_model_id(backend),
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+    }
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, path):
+    # write to a temp file first so a crash never leaves half a manifest
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def load_and_split(data_dir, rel_path, text_splitter):
+    """Parse one PDF and split it into chunks with stable ids."""
+    pages = PyMuPDFLoader(os.path.join(data_dir, rel_path)).load()
+
+    # keep the same "data/<file>" source format DirectoryLoader produced
+    source = f"{os.path.basename(data_dir)}/{rel_path}"
+    for page in pages:
+        page.metadata["source"] = source
+
+    return text_splitter.split_documents(pages)
+
+
+def diff_files(current, previous):
+    """Split the corpus into added, changed, removed and unchanged files."""
+    added = [p for p in current if p not in previous]
+    removed = [p for p in previous if p not in current]
+    changed = [
+        p for p in current
+        if p in previous and previous[p]["sha256"] != current[p]
+    ]
+    unchanged = [
+        p for p in current
+        if p in previous and previous[p]["sha256"] == current[p]
+    ]
+    return added, changed, removed, unchanged
+
+
+def reuse_rows(manifest_files):
+    """Yield (chunk hash, row) of every vector in the previous generation."""
+    for entry in manifest_files.values():
+        start = entry["rows"][0]
+        for offset, chunk_hash in enumerate(entry["hashes"]):
+            yield chunk_hash, start + offset
+
+
+def _init_worker():
+    # each worker process builds its own splitter once
+    global _worker_splitter
+    _worker_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP
+    )
+
+
+def _split_file(data_dir, rel_path):
+    return load_and_split(data_dir, rel_path, _worker_splitter)
+
+
+def iter_split_files(data_dir, rel_paths, workers=1):
+    """
+    Yield (rel_path, chunks) for each PDF, in rel_paths order.
+
+    With more than one worker the PDFs are parsed and chunked in a process
+    pool. Results are handed out in submission order as soon as they are
+    ready, and at most two files per worker are in flight, so memory stays
+    bounded while the embedding stage consumes them.
+    """
+    if workers <= 1 or len(rel_paths) <= 1:
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=CHUNK_SIZE,
+            chunk_overlap=CHUNK_OVERLAP
+        )
+        for rel_path in rel_paths:
+            yield rel_path, load_and_split(data_dir, rel_path, text_splitter)
+        return
+
+    workers = min(workers, len(rel_paths))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        pending = deque()
+        remaining = iter(rel_paths)
+
+        for rel_path in islice(remaining, 2 * workers):
+            pending.append((rel_path, executor.submit(_split_file, data_dir, rel_path)))
+
+        while pending:
+            rel_path, future = pending.popleft()
+            chunks = future.result()
+
+            for next_path in islice(remaining, 1):
+                pending.append(
+                    (next_path, executor.submit(_split_file, data_dir, next_path))
+                )
+
+            yield rel_path, chunks
+
+
+class StreamingIndexer:
+    """
+    Write a new index generation: a flat FAISS index and a ChunkStore whose
+    rows line up one to one.
+
+    New chunks are embedded in fixed-size batches and their vectors are
+    appended to index.faiss on disk as each batch completes, so only the
+    current batch is held in memory. Texts that are already indexed, in the
+    previous generation or an earlier batch, are copied from their stored
+    vector instead of being embedded again; which hashes have a vector, and
+    where, is kept in a scratch SQLite table rather than a dict.
+    """
+
+    # vector locations in the scratch table
+    OLD, NEW = 0, 1
+
+    def __init__(self, gen_dir, embeddings, old_index, old_rows, batch_size):
+        self.writer = ChunkStoreWriter(gen_dir)
+        self.vectors = FlatIndexWriter(os.path.join(gen_dir, INDEX_FILE))
+        self.embeddings = embeddings
+        self.old_index = old_index
+        self.index = None
+        self.batch_size = max(1, batch_size)
+        self.batch = []
+        self.next_row = 0
+        # chunks of parsed files, and rows copied from the previous generation
+        self.parsed = 0
+        self.copied = 0
+        self.embedded = 0
+        self.embed_seconds = 0.0
+        self.started = time.perf_counter()
+
+        # chunk hash -> (OLD or NEW, row) of an existing vector
+        self._known_path = os.path.join(gen_dir, "known.sqlite3")
+        self.known = sqlite3.connect(self._known_path)
+        self.known.execute("PRAGMA journal_mode=OFF")
+        self.known.execute("PRAGMA synchronous=OFF")
+        self.known.execute(
+            "CREATE TABLE known (hash TEXT PRIMARY KEY, location INTEGER, row INTEGER)"
+        )
+        if old_index is not None:
+            # the first row holding a text wins, like dict.setdefault
+            self.known.executemany(
+                "INSERT OR IGNORE INTO known VALUES (?, ?, ?)",
+                ((chunk_hash, self.OLD, row) for chunk_hash, row in old_rows)
+            )
+
+    def _lookup(self, hashes):
+        found = {}
+        hashes = list(hashes)
+        # stay under SQLite's bound parameter limit
+        for first in range(0, len(hashes), 500):
+            part = hashes[first:first + 500]
+            found.update(
+                (h, (location, row)) for h, location, row in self.known.execute(
+                    f"SELECT hash, location, row FROM known WHERE hash IN ({','.join('?' * len(part))})",
+                    part
+                )
+            )
+        return found
+
+    def add(self, hashes, chunks):
+        """Queue chunks and return the rows they will occupy."""
+        start = self.next_row
+        for item in zip(hashes, chunks):
+            self.batch.append(item)
+            self.next_row += 1
+            if len(self.batch) >= self.batch_size:
+                self.flush()
+        return [start, self.next_row]
+
+    def copy(self, old_store, old_index, start, end):
+        """Copy rows [start, end) of the previous generation unchanged."""
+        self.flush()
+        new_start = self.next_row
+        for first in range(start, end, COPY_BATCH):
+            last = min(first + COPY_BATCH, end)
+            self.vectors.append(old_index.reconstruct_n(first, last - first))
+            self.writer.copy_rows(old_store, first, last)
+        self.next_row += end - start
+        self.copied += end - start
+        return [new_start, self.next_row]
+
+    def flush(self):
+        if not self.batch:
+            return
+        batch, self.batch = self.batch, []
+        first_row = len(self.writer)
+        known = self._lookup({h for h, _ in batch})
+
+        # embed each distinct missing text once
+        missing = {}
+        for chunk_hash, chunk in batch:
+            if chunk_hash not in known:
+                missing.setdefault(chunk_hash, chunk.page_content)
+
+        vectors = {}
+        if missing:
+            started = time.perf_counter()
+            computed = self.embeddings.embed_documents(list(missing.values()))
+            self.embed_seconds += time.perf_counter() - started
+            vectors = dict(zip(missing, computed))
+            self.embedded += len(missing)
+
+        for chunk_hash, (location, row) in known.items():
+            if location == self.OLD:
+                vectors[chunk_hash] = self.old_index.reconstruct(row)
+            else:
+                vectors[chunk_hash] = self.vectors.vector(row)
+
+        self.vectors.append([vectors[chunk_hash] for chunk_hash, _ in batch])
+        for chunk_hash, chunk in batch:
+            self.writer.append(chunk.page_content, chunk.metadata)
+
+        # later duplicates of these texts are copied from the new index
+        self.known.executemany(
+            "INSERT OR IGNORE INTO known VALUES (?, ?, ?)",
+            ((chunk_hash, self.NEW, first_row + offset) for offset, (chunk_hash, _) in enumerate(batch))
+        )
+
+        self.parsed += len(batch)
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        print(f"Indexed {self.total} chunks ({self.total / elapsed:.1f} chunks/s)")
+
+    @property
+    def total(self):
+        return self.parsed + self.copied
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        self.known.close()
+        os.remove(self._known_path)
+        if self.vectors.close():
+            # mapped, so building an approximate index does not load it either
+            self.index = read_index_mmap(self.vectors.path)
+
+
+def remove_legacy_index(db_dir):
+    """Delete the pickled store of the pre-generation layout, now replaced."""
+    for name in LEGACY_FILES:
+        path = os.path.join(db_dir, name)
+        if os.path.isfile(path):
+            os.remove(path)
+            print(f"Removed legacy {name}")
+
+
+def build_ann_index(gen_dir, flat_index, index_type, nlist=None, report=False):
+    """Build the approximate index next to the flat one and optionally compare them."""
+    if index_type == "flat":
+        return
+
+    started = time.perf_counter()
+    index = build_index(flat_index, index_type, nlist=nlist)
+    write_index(index, gen_dir, index_type)
+    print(f"Built {index_type} index in {time.perf_counter() - started:.1f}s")
+
+    if report:
+        result = evaluate(
+            flat_index,
+            index,
+            sample_queries(flat_index),
+            threshold=SIMILARITY_THRESHOLD
+        )
+        print(f"{index_type} vs flat: {json.dumps(result)}")
+
+
+def ingest(data_dir=DATA_DIR, db_dir=DB_DIR, full=False, workers=1,
+           batch_size=DEFAULT_BATCH_SIZE, use_cache=True, index_type="flat",
+           nlist=None, report=False, backend=EMBEDDING_BACKEND):
+    """
+    Bring the index in db_dir up to date with the PDFs in data_dir.
+
+    Returns counts and timings of the run when a new generation was
+    published, else None.
+    """
+    current = scan_pdfs(data_dir)
+    print(f"Found {len(current)} PDFs in {data_dir}")
+
+    old_gen = current_generation(db_dir)
+    manifest = None
+    if old_gen is not None:
+        manifest = load_manifest(os.path.join(old_gen, MANIFEST_FILE))
+
+    rebuild = (
+        full
+        or manifest is None
+        or manifest.get("settings") != manifest_settings(backend)
+    )
+    previous = {} if rebuild else manifest["files"]
+
+    added, changed, removed, unchanged = diff_files(current, previous)
+    print(
+        f"{len(added)} added, {len(changed)} changed, "
+        f"{len(removed)} removed, {len(unchanged)} unchanged"
+    )
+
+    if not rebuild and not (added or changed or removed):
+        ann_path = os.path.join(old_gen, index_filename(index_type))
+        if index_type != "flat" and not os.path.exists(ann_path):
+            # nothing to re-embed, just add the requested index type
+            flat_index = faiss.read_index(os.path.join(old_gen, INDEX_FILE))
+            build_ann_index(old_gen, flat_index, index_type, nlist, report)
+        if not has_lexical_index(old_gen) or lexical_index_outdated(old_gen):
+            # generations written before the BM25 index existed, or its tokenizer changed
+            build_lexical_index(old_gen)
+        if not has_citation_index(old_gen):
+            build_citation_index(old_gen)
+        print("FAISS vector store is up to date")
+        return
+
+    embeddings = load_embeddings(backend)
+    if use_cache:
+        embeddings = cached_embeddings(embeddings, embedding_model_id(backend))
+
+    # the previous generation is only read, through memory maps
+    old_store = old_index = None
+    if not rebuild:
+        old_store = ChunkStore(old_gen)
+        old_index = read_index_mmap(os.path.join(old_gen, INDEX_FILE))
+
+    gen_dir = new_generation(db_dir)
+    indexer = StreamingIndexer(
+        gen_dir, embeddings, old_index, reuse_rows(previous), batch_size
+    )
+
+    # files are written in sorted order, so an incremental run produces the
+    # same layout as a full rebuild; unchanged files are copied, not re-embedded
+    to_parse = [p for p in current if p not in unchanged]
+    parsed = iter_split_files(data_dir, to_parse, workers)
+
+    keep = set(unchanged)
+    files = {}
+    for rel_path, file_hash in current.items():
+        if rel_path in keep:
+            start, end = previous[rel_path]["rows"]
+            rows = indexer.copy(old_store, old_index, start, end)
+            files[rel_path] = dict(previous[rel_path], rows=rows)
+            continue
+
+        parsed_path, chunks = next(parsed)
+        assert parsed_path == rel_path
+        hashes = [text_sha256(chunk.page_content) for chunk in chunks]
+        rows = indexer.add(hashes, chunks)
+        files[rel_path] = {"sha256": file_hash, "hashes": hashes, "rows": rows}
+
+    indexer.close()
+
+    elapsed = max(time.perf_counter() - indexer.started, 1e-9)
+    print(
+        f"Created {indexer.parsed} text chunks from {len(to_parse)} PDFs, "
+        f"copied {indexer.copied} unchanged chunks ({indexer.total} in the index)"
+    )
+    print(
+        f"Embedded {indexer.embedded} chunks, "
+        f"reused {indexer.parsed - indexer.embedded} existing embeddings"
+    )
+    print(
+        f"Throughput: {indexer.total / elapsed:.1f} chunks/s overall, "
+        f"{indexer.embedded / max(indexer.embed_seconds, 1e-9):.1f} chunks/s embedding"
+    )
+
+    cache = getattr(embeddings, "cache", None)
+    if cache is not None:
+        print(f"Embedding cache: {cache.hits} hits, {cache.misses} misses")
+
+    removed_rows = sum(
+        previous[p]["rows"][1] - previous[p]["rows"][0] for p in changed + removed
+    )
+    print(f"Dropped {removed_rows} stale chunks from the previous index")
+
+    if old_store is not None:
+        old_store.close()
+
+    if indexer.index is None:
+        # corpus is empty, nothing left to serve
+        shutil.rmtree(gen_dir, ignore_errors=True)
+        unpublish(db_dir)
+        print("No chunks to index, FAISS vector store removed")
+        return
+
+    build_ann_index(gen_dir, indexer.index, index_type, nlist, report)
+    build_lexical_index(gen_dir)
+    build_citation_index(gen_dir)
+
+    save_manifest(
+        {"settings": manifest_settings(backend), "files": files},
+        os.path.join(gen_dir, MANIFEST_FILE)
+    )
+
+    # readers switch over only once the whole generation is on disk
+    publish_generation(db_dir, gen_dir)
+    remove_legacy_index(db_dir)
+
+    print(f"FAISS vector store saved successfully ({os.path.basename(gen_dir)})")
+
+    return {
+        "generation": os.path.basename(gen_dir),
+        "files": len(current),
+        "parsed_files": len(to_parse),
+        "chunks": indexer.total,
+        "parsed_chunks": indexer.parsed,
+        "copied_chunks": indexer.copied,
+        "embedded": indexer.embedded,
+        "seconds": round(time.perf_counter() - indexer.started, 3),
+        "embed_seconds": round(indexer.embed_seconds, 3),
+    }
 
-#embeddings
-embeddings = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2"
-)
 
-#creating FAISS vector store
-vectorstore = FAISS.from_documents(chunks, embeddings)
-vectorstore.save_local("legal_faiss_db")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build or incrementally update the legal FAISS vector store"
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="ignore the manifest and rebuild the index from scratch"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("INGEST_WORKERS", os.cpu_count() or 1)),
+        help="processes used to parse and chunk PDFs (1 disables the pool)"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=int(os.getenv("INGEST_BATCH_SIZE", DEFAULT_BATCH_SIZE)),
+        help="chunks embedded and appended to the index per batch"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help=f"do not read or write the embedding cache ({DEFAULT_CACHE_PATH}, "
+             f"{DEFAULT_MAX_MB:g} MB)"
+    )
+    parser.add_argument(
+        "--index-type",
+        choices=INDEX_TYPES,
+        default=os.getenv("INDEX_TYPE", "flat"),
+        help="approximate index built next to the exact flat index"
+    )
+    parser.add_argument(
+        "--nlist",
+        type=int,
+        default=None,
+        help="inverted lists for ivf_flat/ivf_pq (default about 4*sqrt(chunks))"
+    )
+    parser.add_argument(
+        "--report",
+        action="store_true",
+        help="print recall and latency of the approximate index against flat"
+    )
+    parser.add_argument(
+        "--embedding-backend",
+        choices=EMBEDDING_BACKENDS,
+        default=EMBEDDING_BACKEND,
+        help="torch, or the int8 ONNX export (run embedding_backends.py --export first)"
+    )
+    args = parser.parse_args()
 
-print("FAISS vector store saved successfully")
+    ingest(
+        full=args.full,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        use_cache=not args.no_cache,
+        index_type=args.index_type,
+        nlist=args.nlist,
+        report=args.report,
+        backend=args.embedding_backend
+    )
@@ -0,0 +1,173 @@
+import argparse
+import os
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+# Get the directory where this script is located
+RAG_DIR = os.path.dirname(os.path.abspath(__file__))
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+# torch runs the model through HuggingFaceEmbeddings, onnx runs an int8
+# quantized export of it on ONNX Runtime without importing torch
+EMBEDDING_BACKENDS = ("torch", "onnx")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", os.path.join(RAG_DIR, "onnx_model"))
+ONNX_FP32_FILE = "model.onnx"
+ONNX_INT8_FILE = "model.int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+
+# sentence-transformers truncates all-MiniLM-L6-v2 inputs to 256 tokens
+MAX_SEQ_LENGTH = 256
+
+# texts per ONNX Runtime call
+ONNX_BATCH_SIZE = 32
+
+
+def embedding_model_id(backend=EMBEDDING_BACKEND, model_name=EMBEDDING_MODEL):
+    """
+    Name of the encoder, used to key cached vectors and in the ingestion
+    manifest. The quantized model gives slightly different vectors, so it
+    gets its own name.
+    """
+    if backend == "torch":
+        return model_name
+    return f"{model_name}#onnx-int8"
+
+
+def mean_pool(hidden, mask):
+    # average the token vectors, ignoring padding, then L2-normalize
+    # like the Normalize layer of the sentence-transformers pipeline
+    mask = mask[..., None].astype(np.float32)
+    pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+    norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+    return pooled / np.clip(norms, 1e-12, None)
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    all-MiniLM-L6-v2 exported to ONNX with int8 dynamic quantization.
+
+    Needs only onnxruntime and tokenizers at query time. Tokenization,
+    mean pooling and normalization follow the sentence-transformers
+    pipeline, so vectors stay compatible with an index built by the torch
+    backend.
+    """
+
+    def __init__(self, model_dir=ONNX_MODEL_DIR, model_file=ONNX_INT8_FILE, threads=None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        path = os.path.join(model_dir, model_file)
+        if not os.path.exists(path):
+            raise FileNotFoundError(
+                f"No ONNX model at {path}, run embedding_backends.py --export first"
+            )
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(
+            path, options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(MAX_SEQ_LENGTH)
+        self.tokenizer.enable_padding()
+
+    def _encode(self, texts):
+        vectors = []
+        for first in range(0, len(texts), ONNX_BATCH_SIZE):
+            encoded = self.tokenizer.encode_batch(texts[first:first + ONNX_BATCH_SIZE])
+            ids = np.array([e.ids for e in encoded], dtype=np.int64)
+            mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+
+            feeds = {"input_ids": ids, "attention_mask": mask}
+            if "token_type_ids" in self.input_names:
+                feeds["token_type_ids"] = np.zeros_like(ids)
+
+            hidden = self.session.run(None, feeds)[0]
+            vectors.append(mean_pool(hidden, mask))
+        return np.vstack(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
+
+    def embed_documents(self, texts):
+        return self._encode(list(texts)).tolist()
+
+    def embed_query(self, text):
+        return self._encode([text])[0].tolist()
+
+
+def load_embeddings(backend=EMBEDDING_BACKEND, model_name=EMBEDDING_MODEL):
+    """Return the embedding model for backend, without the on-disk cache."""
+    if backend == "onnx":
+        return OnnxEmbeddings()
+    if backend == "torch":
+        # importing langchain_huggingface pulls in torch, only do it when needed
+        from langchain_huggingface import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(model_name=model_name)
+    raise ValueError(f"Unknown embedding backend: {backend}")
+
+
+def export_onnx(model_name=EMBEDDING_MODEL, model_dir=ONNX_MODEL_DIR, opset=17):
+    """
+    Export model_name to ONNX and quantize its weights to int8.
+
+    Needs torch and transformers, once; the exported model does not.
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(model_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    tokenizer.save_pretrained(model_dir)
+
+    model = AutoModel.from_pretrained(model_name).eval()
+    sample = tokenizer(["an example legal question"], return_tensors="pt")
+    names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+
+    class HiddenStates(torch.nn.Module):
+        # pass inputs by name, the positional order of forward() varies by version
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(names, inputs))).last_hidden_state
+
+    dynamic = {name: {0: "batch", 1: "sequence"} for name in names + ["last_hidden_state"]}
+
+    fp32_path = os.path.join(model_dir, ONNX_FP32_FILE)
+    int8_path = os.path.join(model_dir, ONNX_INT8_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            HiddenStates(),
+            tuple(sample[name] for name in names),
+            fp32_path,
+            input_names=names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic,
+            opset_version=opset,
+            dynamo=False,
+        )
+
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    print(f"Exported {model_name} to {fp32_path} and {int8_path}")
+    return int8_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the ONNX embedding backend")
+    parser.add_argument("--export", action="store_true", help="export and quantize the model")
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    parser.add_argument("--model-dir", default=ONNX_MODEL_DIR)
+    args = parser.parse_args()
+
+    if args.export:
+        export_onnx(args.model, args.model_dir)
+    else:
+        parser.print_help()
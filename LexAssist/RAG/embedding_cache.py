@@ -0,0 +1,253 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+# Get the directory where this script is located
+RAG_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH",
+    os.path.join(RAG_DIR, "embedding_cache.sqlite3")
+)
+
+# cache size limit in megabytes, 0 disables the cache
+DEFAULT_MAX_MB = float(os.getenv("EMBEDDING_CACHE_MAX_MB", "512"))
+
+# rows are evicted down to this fraction of the limit so eviction is rare
+EVICT_TO = 0.9
+
+# hits only update last_used in memory; the updates are written with the next
+# put_many, or once TOUCH_BATCH are pending, so a cache hit never waits on a
+# write. An entry used within TOUCH_SECONDS is not touched again
+TOUCH_SECONDS = 60.0
+TOUCH_BATCH = 256
+
+# SQLite caps the number of bound parameters per statement
+_SQL_BATCH = 500
+
+
+class EmbeddingCache:
+    """
+    On-disk map of (model, text hash) -> float32 vector stored as SQLite blobs.
+
+    Entries are evicted least recently used first once the stored vectors
+    exceed max_bytes, with last_used kept to within TOUCH_SECONDS. The
+    database runs in WAL mode so ingestion and several query workers can
+    share one file.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.max_bytes = int(max_bytes)
+        self.hits = 0
+        self.misses = 0
+        # key -> time of its latest use, not yet written to last_used
+        self._touches = {}
+        self._connect()
+        self._bytes = self._stored_bytes()
+
+    def _connect(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key BLOB PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            ) WITHOUT ROWID
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+        )
+        self._conn.commit()
+
+    def _after_fork(self):
+        # a SQLite connection must not be used across fork(), e.g. when a
+        # gunicorn preload_app master opened it, so each process opens its own
+        if self._pid != os.getpid():
+            self._connect()
+
+    @staticmethod
+    def key(namespace, text):
+        return hashlib.sha256(f"{namespace}\0{text}".encode("utf-8")).digest()
+
+    def _stored_bytes(self):
+        row = self._conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+        ).fetchone()
+        return row[0]
+
+    def get_many(self, keys):
+        """Return {key: vector} for the keys that are cached."""
+        self._after_fork()
+        found = {}
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(keys), _SQL_BATCH):
+                part = keys[i:i + _SQL_BATCH]
+                marks = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector, last_used FROM embeddings WHERE key IN ({marks})",
+                    part
+                ).fetchall()
+                for key, blob, last_used in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+                    if now - last_used >= TOUCH_SECONDS:
+                        self._touches[key] = now
+
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+            if len(self._touches) >= TOUCH_BATCH:
+                self._write_touches()
+                self._conn.commit()
+        return found
+
+    def _write_touches(self):
+        if self._touches:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                [(used, key) for key, used in self._touches.items()]
+            )
+            self._touches.clear()
+
+    def put_many(self, items):
+        """Store (key, vector) pairs and evict old entries if over the limit."""
+        now = time.time()
+        rows = [
+            (key, np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for key, vector in items
+        ]
+        if not rows:
+            return
+
+        self._after_fork()
+        with self._lock:
+            # pending touches go in the same transaction, before any eviction
+            self._write_touches()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+            self._bytes += sum(len(blob) for _, blob, _ in rows)
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # recount first, other processes may have written or evicted
+        self._bytes = self._stored_bytes()
+        target = int(self.max_bytes * EVICT_TO)
+        if self._bytes <= target:
+            return
+
+        excess = self._bytes - target
+        rows = self._conn.execute(
+            "SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_used"
+        )
+        victims = []
+        for key, size in rows:
+            victims.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        rows.close()
+
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", victims)
+        self._conn.commit()
+        self._bytes = self._stored_bytes()
+
+    def stats(self):
+        self._after_fork()
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return {
+            "entries": count,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def close(self):
+        with self._lock:
+            self._write_touches()
+            self._conn.commit()
+            self._conn.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wrap a LangChain embedding model with an EmbeddingCache.
+
+    Each distinct text is embedded at most once per model, so boilerplate
+    repeated across statutes and re-runs after a chunking change are served
+    from disk. Query and document embeddings are cached separately because
+    some models encode them differently.
+    """
+
+    def __init__(self, underlying, model_name, cache=None):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.cache = cache if cache is not None else EmbeddingCache()
+
+    def _embed(self, kind, texts, compute):
+        keys = [EmbeddingCache.key(f"{self.model_name}\0{kind}", text) for text in texts]
+        found = self.cache.get_many(list(dict.fromkeys(keys)))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+
+        if missing:
+            computed = compute(list(missing.values()))
+            new_items = list(zip(missing, computed))
+            self.cache.put_many(new_items)
+            found.update(
+                (key, np.asarray(vector, dtype=np.float32)) for key, vector in new_items
+            )
+
+        return [found[key].tolist() for key in keys]
+
+    def embed_documents(self, texts):
+        return self._embed("document", texts, self.underlying.embed_documents)
+
+    def embed_query(self, text):
+        return self._embed(
+            "query",
+            [text],
+            lambda texts: [self.underlying.embed_query(t) for t in texts]
+        )[0]
+
+    def embed_queries(self, texts):
+        """
+        Embed many queries, computing the uncached ones in one batch.
+
+        MiniLM encodes queries and documents the same way, so the batch goes
+        through embed_documents.
+        """
+        return self._embed("query", texts, self.underlying.embed_documents)
+
+
+def cached_embeddings(underlying, model_name, path=DEFAULT_CACHE_PATH,
+                      max_mb=DEFAULT_MAX_MB):
+    """Return underlying wrapped in a cache, or unchanged if the cache is disabled."""
+    if max_mb <= 0:
+        return underlying
+    return CachedEmbeddings(
+        underlying,
+        model_name,
+        EmbeddingCache(path, max_bytes=max_mb * 1024 * 1024)
+    )
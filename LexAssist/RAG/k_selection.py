@@ -0,0 +1,70 @@
+import re
+
+import numpy as np
+
+
+# selectors that decide k locally instead of asking the LLM
+LOCAL_SELECTORS = ("score_gap", "heuristic")
+
+# words that signal a question needs several provisions to answer
+BROAD_TERMS = {
+    "all", "any", "compare", "comparison", "conditions", "difference",
+    "differences", "exception", "exceptions", "list", "procedure",
+    "process", "requirements", "rights", "steps", "types", "versus", "vs",
+}
+
+# words that signal a single definition or provision is enough
+NARROW_TERMS = {"define", "definition", "meaning", "means", "section", "what"}
+
+
+def select_k_by_score_gap(distances, min_k=2, default_k=5, min_gap=0.05):
+    """
+    Cut a ranked hit list at its largest distance jump.
+
+    distances are ascending FAISS distances for the top hits. The cut is
+    made after at least min_k hits; when no jump is larger than min_gap the
+    hits are too evenly spread to tell, and default_k is used.
+    """
+    n = len(distances)
+    if n <= min_k:
+        return n
+
+    gaps = np.diff(np.asarray(distances, dtype=np.float32))[min_k - 1:]
+    best = int(np.argmax(gaps))
+    if gaps[best] < min_gap:
+        return min(default_k, n)
+    return best + min_k
+
+
+def question_features(question):
+    words = re.findall(r"[a-z0-9]+", question.lower())
+    clauses = 1 + len(re.findall(r"[,;]|\b(?:and|or|but|whether)\b", question.lower()))
+    return {
+        "words": len(words),
+        "clauses": clauses,
+        "broad": sum(word in BROAD_TERMS for word in words),
+        "narrow": sum(word in NARROW_TERMS for word in words),
+    }
+
+
+def select_k_heuristic(question, max_k=20):
+    """
+    Pick k from simple question features, mirroring the k_prompt guidelines:
+    simple factual questions get 2-3 chunks, multi-part ones up to 20.
+    """
+    f = question_features(question)
+    score = (
+        0.15 * f["words"]
+        + 2.0 * (f["clauses"] - 1)
+        + 3.0 * f["broad"]
+        - 1.0 * f["narrow"]
+    )
+    if score < 1.5:
+        k = 3
+    elif score < 4:
+        k = 6
+    elif score < 8:
+        k = 12
+    else:
+        k = 18
+    return max(1, min(k, max_k))
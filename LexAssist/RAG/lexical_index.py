@@ -0,0 +1,160 @@
+import json
+import os
+import re
+import time
+from array import array
+
+import numpy as np
+
+from chunk_store import ChunkStore
+
+
+# layout of the BM25 index inside an index generation
+LEXICAL_META_FILE = "lexical.json"
+LEXICAL_OFFSETS_FILE = "lexical.offsets.npy"
+LEXICAL_ROWS_FILE = "lexical.rows.npy"
+LEXICAL_TF_FILE = "lexical.tf.npy"
+LEXICAL_LENGTHS_FILE = "lexical.length.npy"
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# rank constant of reciprocal rank fusion
+RRF_K = 60
+
+# bumped when tokenization changes, older indexes are rebuilt by ingestion
+LEXICAL_VERSION = 2
+
+# section numbers such as "66A" stay one token
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# "it" is not a stopword: lowercased, it is the "IT" of the IT Act
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does",
+    "for", "from", "how", "i", "if", "in", "is", "my", "of",
+    "on", "or", "our", "say", "says", "should", "that", "the", "their",
+    "there", "this", "to", "under", "was", "we", "what", "when", "which",
+    "who", "will", "with", "you",
+}
+
+
+def tokenize(text):
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+
+def has_lexical_index(gen_dir):
+    return os.path.exists(os.path.join(gen_dir, LEXICAL_META_FILE))
+
+
+def lexical_index_outdated(gen_dir):
+    """True when gen_dir's BM25 index was built by an older tokenizer."""
+    with open(os.path.join(gen_dir, LEXICAL_META_FILE), encoding="utf-8") as f:
+        return json.load(f).get("version", 1) != LEXICAL_VERSION
+
+
+def build_lexical_index(gen_dir):
+    """
+    Build the BM25 inverted index for every row of the chunk store in gen_dir.
+
+    Postings are stored per term as consecutive (row, term frequency) runs
+    in flat arrays, so a lookup is two array slices. The metadata file is
+    written last and marks the index as complete.
+    """
+    started = time.perf_counter()
+    store = ChunkStore(gen_dir)
+
+    vocab = {}
+    term_ids, rows, freqs = array("i"), array("i"), array("H")
+    lengths = np.zeros(len(store), dtype=np.uint32)
+
+    for row in range(len(store)):
+        tokens = tokenize(store.text(row))
+        lengths[row] = len(tokens)
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, count in counts.items():
+            term_ids.append(vocab.setdefault(token, len(vocab)))
+            rows.append(row)
+            freqs.append(min(count, 65535))
+    store.close()
+
+    term_ids = np.frombuffer(term_ids, dtype=np.int32)
+    # stable sort keeps each posting list in row order
+    order = np.argsort(term_ids, kind="stable")
+    offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(term_ids, minlength=len(vocab)), out=offsets[1:])
+
+    np.save(os.path.join(gen_dir, LEXICAL_OFFSETS_FILE), offsets)
+    np.save(os.path.join(gen_dir, LEXICAL_ROWS_FILE), np.frombuffer(rows, dtype=np.int32)[order])
+    np.save(os.path.join(gen_dir, LEXICAL_TF_FILE), np.frombuffer(freqs, dtype=np.uint16)[order])
+    np.save(os.path.join(gen_dir, LEXICAL_LENGTHS_FILE), lengths)
+
+    meta_path = os.path.join(gen_dir, LEXICAL_META_FILE)
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({
+            "version": LEXICAL_VERSION,
+            "count": len(lengths),
+            "avg_length": float(lengths.mean()) if len(lengths) else 0.0,
+            "terms": list(vocab),
+        }, f)
+    os.replace(meta_path + ".tmp", meta_path)
+
+    print(
+        f"Built BM25 index: {len(vocab)} terms, {len(term_ids)} postings "
+        f"in {time.perf_counter() - started:.1f}s"
+    )
+
+
+class LexicalIndex:
+    """Memory-mapped BM25 index over the rows of one chunk store."""
+
+    def __init__(self, gen_dir, k1=BM25_K1, b=BM25_B):
+        with open(os.path.join(gen_dir, LEXICAL_META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        self.terms = {term: i for i, term in enumerate(meta["terms"])}
+        self.count = meta["count"]
+
+        self.offsets = np.load(os.path.join(gen_dir, LEXICAL_OFFSETS_FILE), mmap_mode="r")
+        self.rows = np.load(os.path.join(gen_dir, LEXICAL_ROWS_FILE), mmap_mode="r")
+        self.freqs = np.load(os.path.join(gen_dir, LEXICAL_TF_FILE), mmap_mode="r")
+
+        # per-row length normalization of the BM25 denominator, computed once
+        lengths = np.load(os.path.join(gen_dir, LEXICAL_LENGTHS_FILE))
+        avg_length = max(meta["avg_length"], 1e-9)
+        self.k1 = k1
+        self.norms = (k1 * (1 - b + b * lengths / avg_length)).astype(np.float32)
+
+    def search(self, query, k=10):
+        """Return up to k (row, BM25 score) pairs, best first."""
+        found_rows, found_scores = [], []
+        for token in set(tokenize(query)):
+            term = self.terms.get(token)
+            if term is None:
+                continue
+            start, end = int(self.offsets[term]), int(self.offsets[term + 1])
+            rows = np.asarray(self.rows[start:end])
+            freqs = np.asarray(self.freqs[start:end], dtype=np.float32)
+
+            idf = np.log(1 + (self.count - (end - start) + 0.5) / ((end - start) + 0.5))
+            found_rows.append(rows)
+            found_scores.append(idf * freqs * (self.k1 + 1) / (freqs + self.norms[rows]))
+
+        if not found_rows:
+            return []
+
+        rows, inverse = np.unique(np.concatenate(found_rows), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(found_scores))
+        top = np.argpartition(-scores, k)[:k] if len(scores) > k else np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(rows[i]), float(scores[i])) for i in top]
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Merge ranked row lists; each list adds 1 / (k + rank) to a row's score."""
+    scores = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking):
+            scores[row] = scores.get(row, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=lambda row: -scores[row])
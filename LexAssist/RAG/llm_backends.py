@@ -0,0 +1,160 @@
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import time
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+from k_selection import select_k_heuristic
+from tokens import count_tokens
+
+
+# groq - the hosted Groq API
+# openai - any OpenAI-compatible server (vLLM, llama.cpp, Ollama) at OPENAI_BASE_URL
+# fake - FakeChatModel, deterministic replies with simulated latency, no network
+LLM_BACKENDS = ("groq", "openai", "fake")
+LLM_BACKEND = os.getenv("LLM_BACKEND", "groq")
+
+LLM_MODEL = os.getenv("LLM_MODEL", "llama-3.1-8b-instant")
+LLM_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", "256"))
+
+# API key are read securely from environment
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "http://localhost:8000/v1")
+# local servers usually accept any key
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "not-needed")
+
+# fake backend: time to first token is log-normal around FAKE_LLM_LATENCY_MS
+# (FAKE_LLM_LATENCY_SIGMA=0 makes it constant), then tokens arrive at
+# FAKE_LLM_TOKENS_PER_SECOND
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "300"))
+FAKE_LLM_LATENCY_SIGMA = float(os.getenv("FAKE_LLM_LATENCY_SIGMA", "0.25"))
+FAKE_LLM_TOKENS_PER_SECOND = float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "250"))
+FAKE_LLM_SEED = int(os.getenv("FAKE_LLM_SEED", "0"))
+
+# what follows "Question:" / "User question:" in the prompts of query.py
+QUESTION = re.compile(r"(?:User question|Question):\s*\n(.*?)(?:\n\s*\n|\s*$)", re.S)
+SENTENCE = re.compile(r"(?<=[.;:])\s+")
+WORD = re.compile(r"\s*\S+\s*")
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Local stand-in for the Groq model, for load tests and offline runs.
+
+    Replies depend only on the prompt: the k prompt gets select_k_heuristic's
+    k, the rewrite prompt gets the question back, the plan prompt gets both
+    as JSON and the answer prompt gets the leading sentences of its context.
+    Only the timing is random, from a seeded generator.
+    """
+
+    latency_ms: float = FAKE_LLM_LATENCY_MS
+    latency_sigma: float = FAKE_LLM_LATENCY_SIGMA
+    tokens_per_second: float = FAKE_LLM_TOKENS_PER_SECOND
+    max_tokens: int = LLM_MAX_TOKENS
+    seed: int = FAKE_LLM_SEED
+
+    _random: random.Random = PrivateAttr()
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._random = random.Random(self.seed)
+
+    @property
+    def _llm_type(self):
+        return "fake"
+
+    def first_token_seconds(self):
+        jitter = math.exp(self.latency_sigma * self._random.gauss(0, 1)) if self.latency_sigma else 1.0
+        return self.latency_ms * jitter / 1000
+
+    def token_seconds(self, text):
+        if self.tokens_per_second <= 0:
+            return 0.0
+        return count_tokens(text) / self.tokens_per_second
+
+    def reply(self, prompt):
+        found = QUESTION.findall(prompt)
+        question = found[-1].strip() if found else prompt.strip()
+
+        if "single integer" in prompt:
+            return str(select_k_heuristic(question))
+        if "JSON object" in prompt:
+            return json.dumps({"query": question, "k": select_k_heuristic(question)})
+        if "preparing a search query" in prompt:
+            return question
+
+        start, end = prompt.find("Context:"), prompt.rfind("Question:")
+        if start < 0 or end <= start:
+            return "I don't know"
+        context = " ".join(prompt[start + len("Context:"):end].split())
+        if not context:
+            return "I don't know"
+
+        answer, used = [], 0
+        for sentence in SENTENCE.split(context):
+            tokens = count_tokens(sentence)
+            if answer and used + tokens > self.max_tokens:
+                break
+            answer.append(sentence)
+            used += tokens
+        return " ".join(answer)
+
+    def _pieces(self, text):
+        # stream word by word, like a tokenizer would in spirit; each word
+        # keeps the whitespace around it so the pieces join back to text
+        return WORD.findall(text)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        text = self.reply(messages[-1].content)
+        time.sleep(self.first_token_seconds() + self.token_seconds(text))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        text = self.reply(messages[-1].content)
+        await asyncio.sleep(self.first_token_seconds() + self.token_seconds(text))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.first_token_seconds())
+        for piece in self._pieces(self.reply(messages[-1].content)):
+            time.sleep(self.token_seconds(piece))
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            if run_manager:
+                run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.first_token_seconds())
+        for piece in self._pieces(self.reply(messages[-1].content)):
+            await asyncio.sleep(self.token_seconds(piece))
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            if run_manager:
+                await run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+
+
+def load_llm(backend=LLM_BACKEND, model=LLM_MODEL, max_tokens=LLM_MAX_TOKENS):
+    """Return the chat model for backend, with temperature 0 where it applies."""
+    if backend == "groq":
+        from langchain_groq import ChatGroq
+        return ChatGroq(api_key=GROQ_API_KEY, model=model, temperature=0, max_tokens=max_tokens)
+    if backend == "openai":
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(
+            base_url=OPENAI_BASE_URL,
+            api_key=OPENAI_API_KEY,
+            model=model,
+            temperature=0,
+            max_tokens=max_tokens
+        )
+    if backend == "fake":
+        return FakeChatModel(max_tokens=max_tokens)
+    raise ValueError(f"Unknown LLM backend: {backend}")
@@ -0,0 +1,161 @@
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+
+
+# upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+# upper bounds of the token count histogram buckets
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096)
+
+# stage -> milliseconds of the request being traced, when trace() is active
+_trace = contextvars.ContextVar("rag_trace", default=None)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, values)) + "}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels, in the Prometheus text format."""
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help, tuple(labels), buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {k: (list(v[0]), v[1], v[2]) for k, v in sorted(self._series.items())}
+        for values, (counts, total, count) in series.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), counts):
+                cumulative += n
+                labels = _labels(self.labels + ("le",), values + (bound,))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels(self.labels, values)
+            lines.append(f"{self.name}_sum{labels} {total:.6f}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        lines += [f"{self.name}{_labels(self.labels, k)} {v}" for k, v in values]
+        return lines
+
+
+stage_seconds = Histogram("rag_stage_seconds", "Time spent in each query stage", ["stage"])
+stage_errors = Counter("rag_stage_errors_total", "Query stages that raised", ["stage"])
+query_seconds = Histogram("rag_query_seconds", "End-to-end query time", ["path"])
+query_outcomes = Counter("rag_queries_total", "Answered queries by outcome", ["outcome"])
+prompt_tokens = Histogram("rag_prompt_tokens", "Approximate prompt tokens per answer call", buckets=TOKEN_BUCKETS)
+completion_tokens = Histogram("rag_completion_tokens", "Approximate tokens per generated answer", buckets=TOKEN_BUCKETS)
+http_seconds = Histogram("http_request_seconds", "HTTP request time", ["route", "status"])
+
+REGISTRY = [
+    stage_seconds, stage_errors, query_seconds, query_outcomes,
+    prompt_tokens, completion_tokens, http_seconds,
+]
+
+
+class span:
+    """
+    Time a block as one query stage.
+
+    The duration goes to rag_stage_seconds and, inside trace(), to the
+    request's timings; an exception is counted in rag_stage_errors_total.
+    """
+
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, kind, error, tb):
+        record(self.stage, time.perf_counter() - self.started)
+        if kind is not None:
+            stage_errors.inc(self.stage)
+        return False
+
+
+def record(stage, seconds):
+    stage_seconds.observe(seconds, stage)
+    timings = _trace.get()
+    if timings is not None:
+        # a stage can run more than once per request, e.g. two chain calls
+        key = f"{stage}_ms"
+        timings[key] = round(timings.get(key, 0.0) + seconds * 1000, 3)
+
+
+def note(key, value):
+    """Add a non-timing value (token counts, cache hits) to the current trace."""
+    timings = _trace.get()
+    if timings is not None:
+        timings[key] = value
+
+
+class trace:
+    """
+    Collect the spans of one request into a dict:
+
+        with trace() as timings:
+            answer = run_query(question)
+
+    asyncio.to_thread and langchain's executors copy the context, so spans
+    on their threads land in the same dict.
+    """
+
+    def __enter__(self):
+        self.timings = {}
+        self._token = _trace.set(self.timings)
+        self._started = time.perf_counter()
+        return self.timings
+
+    def __exit__(self, kind, error, tb):
+        self.timings["total_ms"] = round((time.perf_counter() - self._started) * 1000, 3)
+        _trace.reset(self._token)
+        return False
+
+
+def render(extra=()):
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    lines += list(extra)
+    return "\n".join(lines) + "\n"
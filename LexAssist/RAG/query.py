@@ -1,46 +1,221 @@
+import asyncio
+import json
 import os
+import re
+import time
 from dotenv import load_dotenv
 
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain_groq import ChatGroq
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import RunnableLambda, RunnableParallel, RunnablePassthrough
+
+from answer_cache import AnswerCache, normalize_question
+from chunk_store import MmapVectorStore, current_generation
+from citation_index import CitationIndex, has_citation_index
+from context_builder import assemble_context
+import embedding_backends
+import llm_backends
+from embedding_backends import EMBEDDING_BACKEND, embedding_model_id
+from embedding_cache import CachedEmbeddings, cached_embeddings
+from llm_backends import LLM_BACKEND
+import metrics
+from metrics import span
+from k_selection import LOCAL_SELECTORS, select_k_by_score_gap, select_k_heuristic
+from lexical_index import LexicalIndex, has_lexical_index, reciprocal_rank_fusion
+from reranker import Reranker, fit_token_budget, load_cross_encoder
+from resources import ResourceManager
+from single_flight import SingleFlight
+from tokens import count_tokens
+from vector_index import DEFAULT_EF_SEARCH, DEFAULT_NPROBE
 
 
 # load environment variables from .env
 load_dotenv()
 
-# API key are read securely from environment
-GROQ_API_KEY = "GROQ_API_KEY"
-
 # Get the directory where this script is located
 RAG_DIR = os.path.dirname(os.path.abspath(__file__))
 
-# initialize embedding model (
-embeddings = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2"
-)
+# the embedding model, index, LLM client and chains are loaded on first use
+# (or by warm_up), so importing this module is fast
+resources = ResourceManager()
 
-# load FAISS vector database with absolute path
-vectorstore = FAISS.load_local(
-    os.path.join(RAG_DIR, "legal_faiss_db"),
-    embeddings,
-    allow_dangerous_deserialization=True
-)
 
-# initialize LLM
-llm = ChatGroq(
-    api_key=GROQ_API_KEY,
-    model="llama-3.1-8b-instant",
-    temperature=0,
-    max_tokens=256
-)
+def load_embeddings():
+    # EMBEDDING_BACKEND=onnx encodes with the int8 ONNX export instead of torch;
+    # repeated questions are served from the on-disk cache
+    return cached_embeddings(
+        embedding_backends.load_embeddings(EMBEDDING_BACKEND),
+        embedding_model_id(EMBEDDING_BACKEND)
+    )
+
+# index searched at query time: flat (exact), ivf_flat, hnsw or ivf_pq
+INDEX_TYPE = os.getenv("INDEX_TYPE", "flat")
+
+# query-time knobs for the approximate indexes, higher is slower but more exact
+NPROBE = int(os.getenv("FAISS_NPROBE", DEFAULT_NPROBE))
+EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", DEFAULT_EF_SEARCH))
+
+DB_DIR = os.path.join(RAG_DIR, "legal_faiss_db")
+
+# fuse BM25 hits from the prebuilt lexical index into the FAISS hits,
+# HYBRID_SEARCH=0 searches FAISS only
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") == "1"
+
+# BM25 hits taken into the fusion
+LEXICAL_DEPTH = 20
+
+# questions citing one section or chapter of a named Act ("section 43 of the
+# IT Act") read its rows directly, skipping planning and search;
+# CITATION_LOOKUP=0 sends them through retrieval like any other question
+CITATION_LOOKUP = os.getenv("CITATION_LOOKUP", "1") == "1"
+
+# RERANK=1 reorders retrieved chunks with a local cross-encoder and keeps
+# only those that fit RERANK_TOKEN_BUDGET prompt tokens; only the hits that
+# can be scored within RERANK_LATENCY_MS are reordered
+RERANK = os.getenv("RERANK", "0") == "1"
+RERANK_TOKEN_BUDGET = int(os.getenv("RERANK_TOKEN_BUDGET", "800"))
+RERANK_LATENCY_MS = float(os.getenv("RERANK_LATENCY_MS", "250"))
+
+
+def load_index():
+    """
+    (vectorstore, lexical, citations) of the current generation.
+
+    One resource, so a reload swaps all three at once and a query never mixes
+    FAISS rows of one generation with BM25 or citation rows of another.
+    """
+    # memory-map FAISS vector database with absolute path, workers share its pages
+    vectorstore = MmapVectorStore.load(
+        DB_DIR,
+        resources.get("embeddings"),
+        index_type=INDEX_TYPE,
+        nprobe=NPROBE,
+        ef_search=EF_SEARCH
+    )
+    # read from the same generation as the FAISS index
+    gen_dir = vectorstore.chunks.path
+    lexical = None
+    if HYBRID_SEARCH and has_lexical_index(gen_dir):
+        lexical = LexicalIndex(gen_dir)
+    citations = None
+    if CITATION_LOOKUP and has_citation_index(gen_dir):
+        citations = CitationIndex(gen_dir)
+    return vectorstore, lexical, citations
+
+
+def set_search_params(nprobe=None, ef_search=None):
+    """Change nprobe / efSearch of the index, now or when it is loaded."""
+    global NPROBE, EF_SEARCH
+    NPROBE = NPROBE if nprobe is None else nprobe
+    EF_SEARCH = EF_SEARCH if ef_search is None else ef_search
+    if resources.loaded("index"):
+        resources.get("index")[0].set_search_params(nprobe=NPROBE, ef_search=EF_SEARCH)
+
+
+def load_reranker():
+    if not RERANK:
+        return None
+    reranker = Reranker(load_cross_encoder())
+    # measure the per-pair cost the latency budget is enforced with
+    reranker.warm_up()
+    return reranker
+
+
+def load_llm():
+    # LLM_BACKEND=groq (default), openai for a local OpenAI-compatible server,
+    # or fake for offline load tests
+    return llm_backends.load_llm(LLM_BACKEND)
+
+
+resources.register("embeddings", load_embeddings)
+resources.register("index", load_index)
+resources.register("reranker", load_reranker)
+resources.register("llm", load_llm)
 
 # similarity distance cutoff for accepting answers
 SIMILARITY_THRESHOLD = 2.3
 
+# the answer when nothing relevant was retrieved
+NO_ANSWER = "I don't know"
+
+# prompt tokens of retrieved text, after overlapping chunks are merged
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+
+# how the retrieval query and k are planned before searching:
+#   parallel   - rewrite and k-selection calls run concurrently
+#   combined   - one structured call returns both
+#   sequential - k is chosen after, and for, the rewritten query
+PLAN_MODE = os.getenv("PLAN_MODE", "parallel")
+
+# chunks retrieved when the k decision cannot be parsed, and the upper bound
+DEFAULT_K = 5
+MAX_K = 20
+
+# answer cache in front of run_query, ANSWER_CACHE_SIZE=0 disables it
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+
+# cosine distance under which a new question citing the same sections and
+# Acts reuses a cached answer; 0 (default) keeps only exact (normalized) matches
+ANSWER_CACHE_MAX_DISTANCE = float(os.getenv("ANSWER_CACHE_MAX_DISTANCE", "0"))
+
+# seconds between checks of legal_faiss_db/CURRENT for a new generation
+GENERATION_CHECK_INTERVAL = 1.0
+
+_generation_checked_at = float("-inf")
+
+
+def index_generation():
+    """
+    Directory of the index generation being served.
+
+    When data_ingestion.py has published a newer one, the index resource
+    is dropped so the next query maps the new generation.
+    """
+    global _generation_checked_at
+    current = None
+    now = time.monotonic()
+    if now - _generation_checked_at >= GENERATION_CHECK_INTERVAL:
+        _generation_checked_at = now
+        current = current_generation(DB_DIR)
+        if resources.loaded("index") and resources.get("index")[0].chunks.path != current:
+            resources.reload("index")
+
+    if resources.loaded("index"):
+        return resources.get("index")[0].chunks.path
+    return current or current_generation(DB_DIR)
+
+
+def serving_index():
+    """
+    (vectorstore, lexical, citations) to answer one query from.
+
+    Read once per query and passed to every stage, so a reload by another
+    thread partway through the query does not change what it searches.
+    """
+    index_generation()
+    return resources.get("index")
+
+
+# keyed on the generation answers come from, so cleared when it changes
+answer_cache = None
+if ANSWER_CACHE_SIZE > 0:
+    answer_cache = AnswerCache(
+        embed=lambda question: resources.get("embeddings").embed_query(question),
+        fingerprint=index_generation,
+        max_entries=ANSWER_CACHE_SIZE,
+        ttl=ANSWER_CACHE_TTL,
+        max_distance=ANSWER_CACHE_MAX_DISTANCE
+    )
+
+# LLM calls in flight at once for run_queries, and the largest batch accepted
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "500"))
+
+# who decides k: "llm" asks chain("k"), "score_gap" cuts the top MAX_K hits at
+# their largest distance jump, "heuristic" uses question features
+K_SELECTOR = os.getenv("K_SELECTOR", "llm")
+
 
 # prompt to rewrite short or vague legal queries
 rewrite_prompt = ChatPromptTemplate.from_template(
@@ -59,9 +234,6 @@ User question:
 """
 )
 
-rewrite_chain = rewrite_prompt | llm | StrOutputParser()
-
-
 # prompt to dynamically decide how many chunks to retrieve
 k_prompt = ChatPromptTemplate.from_template(
     """
@@ -80,8 +252,25 @@ Return ONLY a single integer between 1 and 20.
 """
 )
 
-k_chain = k_prompt | llm | StrOutputParser()
+# prompt that plans the retrieval query and k in a single call
+plan_prompt = ChatPromptTemplate.from_template(
+    """
+You are planning a search over legal documents.
 
+Tasks:
+1. Rewrite the question as a search query. Expand acronyms and vague phrases into formal legal language (e.g., "LLC" -> "Limited Liability Company"). Do NOT invent laws, cases, or regulations. Do NOT answer the question.
+2. Decide how many legal document chunks are needed to answer it:
+- Simple factual questions -> 2-3 chunks
+- Moderate complexity -> 5-7 chunks
+- High complexity -> 10-15 chunks
+- Multi-part questions or rare topics -> 15-20 chunks
+
+User question:
+{question}
+
+Return ONLY a JSON object: {{"query": "<search query>", "k": <integer between 1 and 20>}}
+"""
+)
 
 # strict answering prompt to prevent hallucination
 answer_prompt = ChatPromptTemplate.from_template(
@@ -107,52 +296,754 @@ Question:
 )
 
 
-def run_query(user_question: str):
 
-    # rewrite query only if it is short or vague
-    if len(user_question.split()) <= 4:
-        retrieval_query = rewrite_chain.invoke(
-            {"question": user_question}
-        ).strip()
-    else:
-        retrieval_query = user_question
+def load_chains():
+    llm = resources.get("llm")
+    return {
+        "rewrite": rewrite_prompt | llm | StrOutputParser(),
+        "k": k_prompt | llm | StrOutputParser(),
+        "plan": plan_prompt | llm | StrOutputParser(),
+        # takes the context as input, so many answers can be batched
+        "answer": answer_prompt | llm | StrOutputParser(),
+    }
+
+
+resources.register("chains", load_chains)
+
+
+def chain(name):
+    return resources.get("chains")[name]
+
+
+# identical questions and chain calls in flight at the same time run once
+query_flights = SingleFlight()
+chain_flights = SingleFlight()
+
+
+# stage each chain call is timed as in rag_stage_seconds
+CHAIN_STAGES = {"rewrite": "rewrite", "k": "k_select", "plan": "plan", "answer": "generate"}
+
+
+def _flight_key(name, inputs):
+    return name, json.dumps(inputs, sort_keys=True)
+
+
+def invoke(name, inputs):
+    """chain(name).invoke(inputs), shared with an identical call in flight."""
+    with span(CHAIN_STAGES[name]):
+        return chain_flights.do(_flight_key(name, inputs), lambda: chain(name).invoke(inputs))
 
-    # decide how many chunks are required
+
+async def ainvoke(name, inputs):
+    with span(CHAIN_STAGES[name]):
+        return await chain_flights.ado(_flight_key(name, inputs), lambda: chain(name).ainvoke(inputs))
+
+
+def coalesced(name):
+    # invoke/ainvoke as a runnable, for RunnableParallel
+    return RunnableLambda(lambda inputs: invoke(name, inputs), afunc=lambda inputs: ainvoke(name, inputs))
+
+
+def coalescing_stats():
+    return {"queries": query_flights.stats(), "chain_calls": chain_flights.stats()}
+
+
+def warm_up(background=True):
+    """Load the model, index and LLM client now instead of on the first query."""
+    if background:
+        return resources.warm_up()
+    resources.load_all()
+
+
+def warm_up_status():
+    return resources.status()
+
+
+def needs_rewrite(user_question):
+    # only short or vague questions are rewritten
+    return len(user_question.split()) <= 4
+
+
+def parse_k(text):
     try:
-        k = int(k_chain.invoke({"question": retrieval_query}).strip())
+        k = int(text.strip())
     except ValueError:
-        k = 5
+        k = DEFAULT_K
 
     # keep k within safe bounds
-    k = max(1, min(k, 20))
+    return max(1, min(k, MAX_K))
+
+
+def parse_plan(text, user_question):
+    """Read the combined planning output, falling back field by field."""
+    match = re.search(r"\{.*\}", text, re.DOTALL)
+    try:
+        plan = json.loads(match.group(0)) if match else {}
+    except json.JSONDecodeError:
+        plan = {}
+    if not isinstance(plan, dict):
+        plan = {}
+
+    retrieval_query = str(plan.get("query") or "").strip() or user_question
+    return retrieval_query, parse_k(str(plan.get("k", "")))
+
+
+def plan_query(user_question: str):
+    """
+    Return (retrieval_query, k) for a question using PLAN_MODE.
+
+    With a local K_SELECTOR only the rewrite may reach the LLM; k is None
+    when it has to be read from the search scores.
+    """
+    inputs = {"question": user_question}
+
+    if K_SELECTOR in LOCAL_SELECTORS:
+        retrieval_query = user_question
+        if needs_rewrite(user_question):
+            retrieval_query = invoke("rewrite", inputs).strip()
+        if K_SELECTOR == "heuristic":
+            return retrieval_query, select_k_heuristic(retrieval_query, MAX_K)
+        return retrieval_query, None
+
+    if not needs_rewrite(user_question):
+        return user_question, parse_k(invoke("k", inputs))
+
+    if PLAN_MODE == "combined":
+        return parse_plan(invoke("plan", inputs), user_question)
+
+    if PLAN_MODE == "parallel":
+        plan = RunnableParallel(query=coalesced("rewrite"), k=coalesced("k")).invoke(inputs)
+        return plan["query"].strip(), parse_k(plan["k"])
+
+    retrieval_query = invoke("rewrite", inputs).strip()
+    return retrieval_query, parse_k(invoke("k", {"question": retrieval_query}))
+
+
+async def aplan_query(user_question: str):
+    """Async plan_query; in parallel mode both calls are awaited together."""
+    inputs = {"question": user_question}
+
+    if K_SELECTOR in LOCAL_SELECTORS:
+        retrieval_query = user_question
+        if needs_rewrite(user_question):
+            retrieval_query = (await ainvoke("rewrite", inputs)).strip()
+        if K_SELECTOR == "heuristic":
+            return retrieval_query, select_k_heuristic(retrieval_query, MAX_K)
+        return retrieval_query, None
+
+    if not needs_rewrite(user_question):
+        return user_question, parse_k(await ainvoke("k", inputs))
+
+    if PLAN_MODE == "combined":
+        return parse_plan(await ainvoke("plan", inputs), user_question)
+
+    if PLAN_MODE == "parallel":
+        rewritten, k_text = await asyncio.gather(
+            ainvoke("rewrite", inputs),
+            ainvoke("k", inputs)
+        )
+        return rewritten.strip(), parse_k(k_text)
+
+    retrieval_query = (await ainvoke("rewrite", inputs)).strip()
+    return retrieval_query, parse_k(await ainvoke("k", {"question": retrieval_query}))
+
+
+def search_depth(k, lexical):
+    # fusion and score-gap selection both need more FAISS hits than they keep
+    if k is None or lexical is not None:
+        return MAX_K
+    return k
+
+
+def fuse_lexical(results, lexical_hits, k, vector, vectorstore):
+    """Reciprocal rank fusion of the FAISS and BM25 hits, keeping the top k."""
+    found = {doc.metadata["row"]: (doc, score) for doc, score in results}
+    rows = reciprocal_rank_fusion([list(found), [row for row, _ in lexical_hits]])[:k]
+
+    # BM25-only hits get their exact distance, so SIMILARITY_THRESHOLD still applies
+    missing = [row for row in rows if row not in found]
+    if missing:
+        for row, distance in zip(missing, vectorstore.distances(vector, missing)):
+            found[row] = (vectorstore.chunks.document(row), distance)
+    return [found[row] for row in rows]
+
+
+def select_hits(results, k, retrieval_query, vector, index):
+    # score-gap selection keeps hits up to the largest distance jump
+    if k is None:
+        k = select_k_by_score_gap([score for _, score in results], default_k=DEFAULT_K)
+
+    vectorstore, lexical, _ = index
+    if lexical is None:
+        return rerank_hits(retrieval_query, results[:k])
+    with span("fuse"):
+        lexical_hits = lexical.search(retrieval_query, LEXICAL_DEPTH)
+        results = fuse_lexical(results, lexical_hits, k, vector, vectorstore)
+    return rerank_hits(retrieval_query, results)
+
+
+def rerank_hits(retrieval_query, results):
+    """Cross-encoder order of the hits, cut to RERANK_TOKEN_BUDGET."""
+    reranker = resources.get("reranker")
+    # build_context answers "I don't know" to these anyway
+    if reranker is None or not results or min(s for _, s in results) > SIMILARITY_THRESHOLD:
+        return results
+
+    with span("rerank"):
+        kept = reranker.rerank(retrieval_query, results, RERANK_TOKEN_BUDGET, RERANK_LATENCY_MS)
+    if min(s for _, s in kept) > SIMILARITY_THRESHOLD:
+        # the budget dropped every hit close enough to pass the cutoff,
+        # keep the retrieval order instead of turning this into "I don't know"
+        return fit_token_budget(results, RERANK_TOKEN_BUDGET)
+    return kept
+
+
+def rerank_stats():
+    if not resources.loaded("reranker") or resources.get("reranker") is None:
+        return {"enabled": RERANK}
+    return {"enabled": True, **resources.get("reranker").stats()}
+
+
+def retrieve(retrieval_query: str, k, index):
+    """Return the (Document, distance) hits for a planned query."""
+    with span("embed"):
+        vector = resources.get("embeddings").embed_query(retrieval_query)
 
     # retrieve similar chunks from FAISS
-    results = vectorstore.similarity_search_with_score(
-        retrieval_query,
-        k=k
-    )
+    vectorstore, lexical, _ = index
+    with span("search"):
+        results = vectorstore.similarity_search_with_score_by_vector(
+            vector,
+            k=search_depth(k, lexical)
+        )
+    return select_hits(results, k, retrieval_query, vector, index)
+
+
+def lookup_citation(user_question: str, index):
+    """
+    Return the (Document, 0.0) rows of the section or chapter the question
+    cites, or None when it cites none the citation index knows.
+    """
+    vectorstore, _, citations = index
+    if citations is None:
+        return None
+
+    with span("citation"):
+        found = citations.lookup(user_question)
+    if found is None:
+        return None
+    chunks = vectorstore.chunks
+    return [(chunks.document(row), 0.0) for row in found[3]]
+
+
+def search(user_question: str):
+    """Hits for a question: the cited rows, else planned retrieval."""
+    index = serving_index()
+    results = lookup_citation(user_question, index)
+    if results is None:
+        results = retrieve(*plan_query(user_question), index)
+    return results
+
+
+async def asearch(user_question: str):
+    index = await asyncio.to_thread(serving_index)
+    results = await asyncio.to_thread(lookup_citation, user_question, index)
+    if results is None:
+        retrieval_query, k = await aplan_query(user_question)
+        # query embedding and FAISS search are CPU work, keep them off the loop
+        results = await asyncio.to_thread(retrieve, retrieval_query, k, index)
+    return results
+
+
+def build_context(results):
+    """Return the prompt context, or None when nothing relevant was found."""
 
     # if nothing is retrieved, return no answer
     if not results:
-        return "I don't know"
+        return None
 
     # check similarity scores
     scores = [score for _, score in results]
     if min(scores) > SIMILARITY_THRESHOLD:
-        return "I don't know"
+        return None
 
-    # extracting text from Document objects
-    context = "\n\n".join(doc.page_content for doc, _ in results)
+    # merge neighbouring chunks, drop repeated text, keep it in budget
+    with span("context_build"):
+        return assemble_context(results, CONTEXT_TOKEN_BUDGET)
 
+
+def answer_chain(context: str):
     # generating answer using only retrieved context
-    rag_chain = (
+    return (
         {
             "context": lambda _: context,
             "question": RunnablePassthrough()
         }
-        | answer_prompt
-        | llm
-        | StrOutputParser()
+        | chain("answer")
     )
 
-    return rag_chain.invoke(user_question)
+
+def count_answer_tokens(context, user_question, answer):
+    """Approximate prompt and completion tokens of one answer call."""
+    prompt, completion = count_tokens(context) + count_tokens(user_question), count_tokens(answer)
+    metrics.prompt_tokens.observe(prompt)
+    metrics.completion_tokens.observe(completion)
+    metrics.note("prompt_tokens", prompt)
+    metrics.note("completion_tokens", completion)
+
+
+def finish_query(path, started, outcome):
+    """Count a query as answered, cached, no_context or error, and time it."""
+    metrics.query_seconds.observe(time.perf_counter() - started, path)
+    metrics.query_outcomes.inc(outcome)
+    metrics.note("outcome", outcome)
+
+
+def answer_outcome(answer):
+    return "no_context" if answer == NO_ANSWER else "answered"
+
+
+def run_query_uncached(user_question: str):
+
+    # read the cited section, or plan the search query and k and retrieve
+    context = build_context(search(user_question))
+    if context is None:
+        return NO_ANSWER
+
+    answer = invoke("answer", {"context": context, "question": user_question})
+    count_answer_tokens(context, user_question, answer)
+    return answer
+
+
+async def arun_query_uncached(user_question: str):
+    """
+    Async run_query: the LLM calls are awaited instead of blocking a thread,
+    so one event loop can keep many questions in flight.
+    """
+    context = build_context(await asearch(user_question))
+    if context is None:
+        return NO_ANSWER
+
+    answer = await ainvoke("answer", {"context": context, "question": user_question})
+    count_answer_tokens(context, user_question, answer)
+    return answer
+
+
+def answer_and_cache(user_question: str, vector):
+    started = time.perf_counter()
+    answer = run_query_uncached(user_question)
+    if answer_cache is not None:
+        answer_cache.put(user_question, answer, vector, time.perf_counter() - started)
+    return answer
+
+
+async def aanswer_and_cache(user_question: str, vector):
+    started = time.perf_counter()
+    answer = await arun_query_uncached(user_question)
+    if answer_cache is not None:
+        answer_cache.put(user_question, answer, vector, time.perf_counter() - started)
+    return answer
+
+
+def run_query(user_question: str):
+    started = time.perf_counter()
+    vector = None
+    try:
+        if answer_cache is not None:
+            with span("cache_lookup"):
+                answer, vector = answer_cache.get(user_question)
+            if answer is not None:
+                finish_query("sync", started, "cached")
+                return answer
+
+        # the same question asked again before the first answer is ready waits for it
+        answer = query_flights.do(
+            normalize_question(user_question),
+            lambda: answer_and_cache(user_question, vector)
+        )
+    except Exception:
+        finish_query("sync", started, "error")
+        raise
+    finish_query("sync", started, answer_outcome(answer))
+    return answer
+
+
+async def arun_query(user_question: str):
+    started = time.perf_counter()
+    vector = None
+    try:
+        if answer_cache is not None:
+            # the semantic lookup embeds the question, keep it off the loop
+            with span("cache_lookup"):
+                answer, vector = await asyncio.to_thread(answer_cache.get, user_question)
+            if answer is not None:
+                finish_query("async", started, "cached")
+                return answer
+
+        answer = await query_flights.ado(
+            normalize_question(user_question),
+            lambda: aanswer_and_cache(user_question, vector)
+        )
+    except Exception:
+        finish_query("async", started, "error")
+        raise
+    finish_query("async", started, answer_outcome(answer))
+    return answer
+
+
+def embed_queries(texts):
+    """Embed many questions with one forward pass of the model."""
+    embeddings = resources.get("embeddings")
+    with span("batch_embed"):
+        if isinstance(embeddings, CachedEmbeddings):
+            return embeddings.embed_queries(texts)
+        return embeddings.embed_documents(texts)
+
+
+# plan_query for batch()/abatch(), which run it with bounded concurrency
+query_planner = RunnableLambda(plan_query, afunc=aplan_query)
+
+
+def _start_batch(questions, started):
+    """
+    Validate and embed a batch, answering what the answer cache can.
+
+    Returns the per-question results, the indexes still to answer, their
+    question vectors, the normalized vectors to hand to answer_cache.put and
+    the serving_index() the whole batch is searched in.
+    """
+    results = [{"question": question} for question in questions]
+    pending = []
+    for i, question in enumerate(questions):
+        if isinstance(question, str) and question.strip():
+            pending.append(i)
+        else:
+            results[i]["error"] = "question must be a non-empty string"
+
+    if not pending:
+        return results, [], {}, {}, None
+    index = serving_index()
+
+    # one forward pass for every question in the batch
+    vectors = dict(zip(pending, embed_queries([questions[i] for i in pending])))
+
+    cache_vectors = {}
+    if answer_cache is not None:
+        misses = []
+        for i in pending:
+            answer, cache_vectors[i] = answer_cache.get(questions[i], vectors[i])
+            if answer is not None:
+                results[i]["answer"] = answer
+                finish_query("batch", started, "cached")
+            else:
+                misses.append(i)
+        pending = misses
+
+    return results, pending, vectors, cache_vectors, index
+
+
+def _cite_batch(questions, pending, index):
+    """
+    Split off the questions that cite a section or chapter.
+
+    Returns the indexes still to plan and {index: context} of the cited ones.
+    """
+    to_plan, contexts = [], {}
+    for i in pending:
+        results = lookup_citation(questions[i], index)
+        if results is None:
+            to_plan.append(i)
+        else:
+            contexts[i] = build_context(results)
+    return to_plan, contexts
+
+
+def _retrieve_batch(questions, pending, plans, vectors, results, index):
+    """
+    Search every planned question with one FAISS call.
+
+    Returns {index: context} for the questions that found relevant chunks;
+    the rest are answered "I don't know" here.
+    """
+    planned = [i for i, plan in zip(pending, plans) if not isinstance(plan, Exception)]
+    for i, plan in zip(pending, plans):
+        if isinstance(plan, Exception):
+            results[i]["error"] = str(plan)
+    if not planned:
+        return {}
+
+    plans = dict(zip(pending, plans))
+
+    # questions that were rewritten need their retrieval query embedded, again in one pass
+    rewritten = [i for i in planned if plans[i][0] != questions[i]]
+    query_vectors = {i: vectors[i] for i in planned}
+    if rewritten:
+        query_vectors.update(zip(rewritten, embed_queries([plans[i][0] for i in rewritten])))
+
+    # one matrix search deep enough for the largest k in the batch
+    vectorstore, lexical, _ = index
+    depth = max(search_depth(plans[i][1], lexical) for i in planned)
+    with span("batch_search"):
+        hits = vectorstore.similarity_search_with_score_by_vectors(
+            [query_vectors[i] for i in planned], k=depth
+        )
+
+    contexts = {}
+    for i, found in zip(planned, hits):
+        context = build_context(
+            select_hits(found, plans[i][1], plans[i][0], query_vectors[i], index)
+        )
+        if context is None:
+            results[i]["answer"] = NO_ANSWER
+        else:
+            contexts[i] = context
+    return contexts
+
+
+def _finish_batch(questions, pending, contexts, answers, cache_vectors, results, started):
+    for i, answer in zip(contexts, answers):
+        if isinstance(answer, Exception):
+            results[i]["error"] = str(answer)
+        else:
+            results[i]["answer"] = answer
+            count_answer_tokens(contexts[i], questions[i], answer)
+
+    # every question of the batch is answered when the batch is
+    for i in pending:
+        finish_query("batch", started, answer_outcome(results[i]["answer"]) if "answer" in results[i] else "error")
+
+    if answer_cache is not None:
+        seconds = (time.perf_counter() - started) / len(pending)
+        for i in pending:
+            if "answer" in results[i]:
+                answer_cache.put(questions[i], results[i]["answer"], cache_vectors.get(i), seconds)
+    return results
+
+
+def run_queries(questions, max_concurrency=BATCH_CONCURRENCY):
+    """
+    Answer many questions in one call, returning results in input order.
+
+    Each result is {"question", "answer"}, or {"question", "error"} when that
+    question failed. Questions are embedded in one forward pass and searched
+    as one FAISS query matrix; planning and answer calls go through batch()
+    with at most max_concurrency LLM calls in flight.
+    """
+    started = time.perf_counter()
+    config = {"max_concurrency": max(1, max_concurrency)}
+
+    results, pending, vectors, cache_vectors, index = _start_batch(questions, started)
+    if not pending:
+        return results
+
+    to_plan, contexts = _cite_batch(questions, pending, index)
+    plans = query_planner.batch(
+        [questions[i] for i in to_plan], config, return_exceptions=True
+    ) if to_plan else []
+    contexts.update(_retrieve_batch(questions, to_plan, plans, vectors, results, index))
+
+    with span("batch_generate"):
+        answers = chain("answer").batch(
+            [{"context": contexts[i], "question": questions[i]} for i in contexts],
+            config,
+            return_exceptions=True
+        ) if contexts else []
+
+    return _finish_batch(questions, pending, contexts, answers, cache_vectors, results, started)
+
+
+async def arun_queries(questions, max_concurrency=BATCH_CONCURRENCY):
+    """Async run_queries; embedding and search run off the event loop."""
+    started = time.perf_counter()
+    config = {"max_concurrency": max(1, max_concurrency)}
+
+    results, pending, vectors, cache_vectors, index = await asyncio.to_thread(_start_batch, questions, started)
+    if not pending:
+        return results
+
+    to_plan, contexts = await asyncio.to_thread(_cite_batch, questions, pending, index)
+    plans = await query_planner.abatch(
+        [questions[i] for i in to_plan], config, return_exceptions=True
+    ) if to_plan else []
+    contexts.update(await asyncio.to_thread(
+        _retrieve_batch, questions, to_plan, plans, vectors, results, index
+    ))
+
+    with span("batch_generate"):
+        answers = await chain("answer").abatch(
+            [{"context": contexts[i], "question": questions[i]} for i in contexts],
+            config,
+            return_exceptions=True
+        ) if contexts else []
+
+    return _finish_batch(questions, pending, contexts, answers, cache_vectors, results, started)
+
+
+def sources_of(results):
+    return [
+        {
+            "source": doc.metadata.get("source"),
+            "page": doc.metadata.get("page"),
+            "score": round(float(score), 4),
+        }
+        for doc, score in results
+    ]
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def stream_query(user_question: str):
+    """
+    Yield ("token", text) events while the answer is generated, then one
+    ("done", info) event with the full answer, sources and timing.
+    """
+    started = time.perf_counter()
+    try:
+        vector = None
+        if answer_cache is not None:
+            answer, vector = answer_cache.get(user_question)
+            if answer is not None:
+                yield "token", answer
+                finish_query("stream", started, "cached")
+                elapsed = time.perf_counter() - started
+                yield "done", {
+                    "answer": answer,
+                    "cached": True,
+                    "sources": [],
+                    "timing": {"time_to_first_token_ms": _ms(elapsed), "total_ms": _ms(elapsed)},
+                }
+                return
+
+        results = search(user_question)
+        retrieved = time.perf_counter()
+        context = build_context(results)
+        built = time.perf_counter()
+
+        parts = []
+        first_token = None
+        if context is None:
+            first_token = time.perf_counter()
+            parts.append(NO_ANSWER)
+            yield "token", parts[0]
+        else:
+            for token in answer_chain(context).stream(user_question):
+                if first_token is None:
+                    first_token = time.perf_counter()
+                parts.append(token)
+                yield "token", token
+
+        answer = "".join(parts)
+        finished = time.perf_counter()
+        if context is not None:
+            metrics.record("generate", finished - built)
+            count_answer_tokens(context, user_question, answer)
+    except Exception:
+        finish_query("stream", started, "error")
+        raise
+    finish_query("stream", started, answer_outcome(answer))
+    if answer_cache is not None:
+        answer_cache.put(user_question, answer, vector, finished - started)
+
+    yield "done", {
+        "answer": answer,
+        "cached": False,
+        "sources": sources_of(results) if context is not None else [],
+        "timing": {
+            "retrieval_ms": _ms(retrieved - started),
+            "time_to_first_token_ms": _ms(first_token - started if first_token else None),
+            "total_ms": _ms(finished - started),
+        },
+    }
+
+
+async def astream_query(user_question: str):
+    """Async stream_query built on astream."""
+    started = time.perf_counter()
+    try:
+        vector = None
+        if answer_cache is not None:
+            answer, vector = await asyncio.to_thread(answer_cache.get, user_question)
+            if answer is not None:
+                yield "token", answer
+                finish_query("stream", started, "cached")
+                elapsed = time.perf_counter() - started
+                yield "done", {
+                    "answer": answer,
+                    "cached": True,
+                    "sources": [],
+                    "timing": {"time_to_first_token_ms": _ms(elapsed), "total_ms": _ms(elapsed)},
+                }
+                return
+
+        results = await asearch(user_question)
+        retrieved = time.perf_counter()
+        context = build_context(results)
+        built = time.perf_counter()
+
+        parts = []
+        first_token = None
+        if context is None:
+            first_token = time.perf_counter()
+            parts.append(NO_ANSWER)
+            yield "token", parts[0]
+        else:
+            async for token in answer_chain(context).astream(user_question):
+                if first_token is None:
+                    first_token = time.perf_counter()
+                parts.append(token)
+                yield "token", token
+
+        answer = "".join(parts)
+        finished = time.perf_counter()
+        if context is not None:
+            metrics.record("generate", finished - built)
+            count_answer_tokens(context, user_question, answer)
+    except Exception:
+        finish_query("stream", started, "error")
+        raise
+    finish_query("stream", started, answer_outcome(answer))
+    if answer_cache is not None:
+        answer_cache.put(user_question, answer, vector, finished - started)
+
+    yield "done", {
+        "answer": answer,
+        "cached": False,
+        "sources": sources_of(results) if context is not None else [],
+        "timing": {
+            "retrieval_ms": _ms(retrieved - started),
+            "time_to_first_token_ms": _ms(first_token - started if first_token else None),
+            "total_ms": _ms(finished - started),
+        },
+    }
+
+
+def answer_cache_stats():
+    if answer_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **answer_cache.stats()}
+
+
+def metrics_lines():
+    """Answer cache and coalescing counters in the Prometheus text format."""
+    lines = []
+    if answer_cache is not None:
+        stats = answer_cache.stats()
+        lines += [
+            "# TYPE rag_answer_cache_entries gauge",
+            f"rag_answer_cache_entries {stats['entries']}",
+            "# TYPE rag_answer_cache_lookups_total counter",
+        ]
+        lines += [
+            f'rag_answer_cache_lookups_total{{result="{result}"}} {stats[key]}'
+            for result, key in (("exact", "exact_hits"), ("semantic", "semantic_hits"), ("miss", "misses"))
+        ]
+        lines += [
+            "# TYPE rag_answer_cache_saved_seconds_total counter",
+            f"rag_answer_cache_saved_seconds_total {stats['latency_saved_seconds']}",
+        ]
+    lines.append("# TYPE rag_coalesced_total counter")
+    for kind, stats in coalescing_stats().items():
+        lines.append(f'rag_coalesced_total{{kind="{kind}"}} {stats["coalesced"]}')
+    return lines
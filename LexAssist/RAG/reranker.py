@@ -0,0 +1,127 @@
+import os
+import time
+
+from tokens import count_tokens
+
+
+# small cross-encoder trained on MS MARCO passage ranking, about 90 MB
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+
+# (question, chunk) pairs scored per forward pass
+RERANK_BATCH_SIZE = 16
+
+# question and chunk together are truncated to this many word pieces
+RERANK_MAX_LENGTH = 512
+
+# seconds per pair assumed before warm_up() measures it, on the slow side of
+# MiniLM-L-6 on a laptop CPU, so the first request cannot overrun its budget
+DEFAULT_PAIR_SECONDS = 0.02
+
+
+def load_cross_encoder(model_name=RERANK_MODEL):
+    # sentence-transformers pulls in torch, only import it when reranking is on
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(model_name, device="cpu", max_length=RERANK_MAX_LENGTH)
+
+
+def fit_token_budget(results, token_budget):
+    """
+    Keep (Document, score) hits in order while their texts fit token_budget.
+
+    A hit too long for what is left is skipped, so a shorter one after it may
+    still fit; the first hit is always kept.
+    """
+    kept, used = [], 0
+    for doc, score in results:
+        tokens = count_tokens(doc.page_content)
+        if kept and used + tokens > token_budget:
+            continue
+        kept.append((doc, score))
+        used += tokens
+    return kept
+
+
+class Reranker:
+    """
+    Reorders retrieved chunks by cross-encoder relevance to the question.
+
+    Pairs are scored in batches on the CPU. The cost of one pair is tracked
+    (seeded by warm_up(), or a conservative default), and each batch is cut
+    to the pairs expected to finish before the deadline. Hits scored before
+    the deadline are reordered, the rest follow in retrieval order, so a slow
+    request never waits on the reranker for much longer than its latency
+    budget.
+    """
+
+    def __init__(self, model, batch_size=RERANK_BATCH_SIZE, pair_seconds=DEFAULT_PAIR_SECONDS):
+        self.model = model
+        self.batch_size = batch_size
+        # moving average of the seconds one pair takes
+        self.pair_seconds = pair_seconds
+        self.runs = 0
+        self.skipped = 0
+        self.partial = 0
+
+    def _predict(self, pairs):
+        started = time.perf_counter()
+        scores = [float(s) for s in self.model.predict(
+            pairs, batch_size=self.batch_size, show_progress_bar=False
+        )]
+        seconds = (time.perf_counter() - started) / len(pairs)
+        self.pair_seconds = 0.8 * self.pair_seconds + 0.2 * seconds
+        return scores
+
+    def warm_up(self, text="lorem ipsum " * 100):
+        """Score one full batch, so the first request starts from a measured cost."""
+        started = time.perf_counter()
+        self.model.predict(
+            [("warm up", text)] * self.batch_size, batch_size=self.batch_size, show_progress_bar=False
+        )
+        self.pair_seconds = (time.perf_counter() - started) / self.batch_size
+
+    def scores(self, question, texts, deadline=None):
+        """
+        Relevance scores of the first texts, as many as the deadline allows;
+        the list is shorter than texts when it cuts scoring short.
+        """
+        scores = []
+        while len(scores) < len(texts):
+            size = min(self.batch_size, len(texts) - len(scores))
+            if deadline is not None:
+                # only start the pairs expected to finish in time
+                size = min(size, int((deadline - time.perf_counter()) / self.pair_seconds))
+                if size <= 0:
+                    break
+            batch = texts[len(scores):len(scores) + size]
+            scores.extend(self._predict([(question, text) for text in batch]))
+        return scores
+
+    def rerank(self, question, results, token_budget, latency_ms=None):
+        """
+        Return the hits most relevant first, trimmed to token_budget.
+
+        Hits keep their retrieval distances, only their order changes.
+        """
+        self.runs += 1
+        deadline = None
+        if latency_ms is not None:
+            deadline = time.perf_counter() + latency_ms / 1000
+
+        scores = self.scores(question, [doc.page_content for doc, _ in results], deadline)
+        if not scores:
+            self.skipped += 1
+        elif len(scores) < len(results):
+            self.partial += 1
+
+        # scored hits, the best retrieved ones, first by score, then the rest as retrieved
+        order = sorted(range(len(scores)), key=lambda i: -scores[i])
+        results = [results[i] for i in order] + results[len(scores):]
+        return fit_token_budget(results, token_budget)
+
+    def stats(self):
+        return {
+            "runs": self.runs,
+            "skipped_over_budget": self.skipped,
+            "partial_over_budget": self.partial,
+            "ms_per_pair": round(self.pair_seconds * 1000, 3),
+        }
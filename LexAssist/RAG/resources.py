@@ -0,0 +1,92 @@
+import threading
+import time
+
+
+class ResourceManager:
+    """
+    Process-wide registry of expensive objects, each built on first use.
+
+    A loader runs once, under its own lock, the first time get() asks for its
+    resource; loaders may get() the resources they depend on. warm_up() runs
+    every loader on a background thread so a server can answer health checks
+    while the model and index load, and load_all() does the same in the
+    calling thread, e.g. in a gunicorn master before it forks its workers.
+    """
+
+    def __init__(self):
+        self._loaders = {}
+        self._locks = {}
+        self._values = {}
+        self._loading = set()
+        self._thread = None
+        self.seconds = {}
+        self.error = None
+
+    def register(self, name, loader):
+        self._loaders[name] = loader
+        self._locks[name] = threading.Lock()
+
+    def loaded(self, name):
+        return name in self._values
+
+    def get(self, name):
+        if name in self._values:
+            return self._values[name]
+
+        with self._locks[name]:
+            if name not in self._values:
+                self._loading.add(name)
+                started = time.perf_counter()
+                try:
+                    self._values[name] = self._loaders[name]()
+                finally:
+                    self._loading.discard(name)
+                self.seconds[name] = round(time.perf_counter() - started, 3)
+        return self._values[name]
+
+    def reload(self, *names):
+        """Drop loaded resources so the next get() builds them again."""
+        for name in names:
+            with self._locks[name]:
+                self._values.pop(name, None)
+                self.seconds.pop(name, None)
+
+    def load_all(self):
+        for name in self._loaders:
+            self.get(name)
+
+    def warm_up(self):
+        """Start loading every resource in a daemon thread and return it."""
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._warm_up, name="rag-warm-up", daemon=True
+            )
+            self._thread.start()
+        return self._thread
+
+    def _warm_up(self):
+        try:
+            self.load_all()
+        except Exception as e:
+            # the next get() retries the load and raises to its caller
+            self.error = f"{type(e).__name__}: {e}"
+
+    def status(self):
+        """Warm-up state for health checks; never triggers a load."""
+        loaded = [name for name in self._loaders if name in self._values]
+        if len(loaded) == len(self._loaders):
+            state = "ready"
+        elif self.error is not None:
+            state = "failed"
+        elif self._loading or (self._thread is not None and self._thread.is_alive()):
+            state = "warming"
+        else:
+            state = "cold"
+
+        return {
+            "state": state,
+            "loaded": loaded,
+            "loading": sorted(self._loading),
+            "seconds": dict(self.seconds),
+            "error": self.error,
+        }
@@ -0,0 +1,82 @@
+import asyncio
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Share one computation among identical calls that overlap in time.
+
+    The first caller of do(key, fn) runs fn; callers with the same key that
+    arrive before it returns wait and get its result, or its exception.
+    Nothing is kept once the call ends, so this never serves stale results.
+    ado() does the same for coroutines on one event loop. Calls in other
+    processes are not seen.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._tasks = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.value
+
+    async def ado(self, key, afn):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            task = self._tasks.get((loop, key))
+            if task is None:
+                task = asyncio.ensure_future(afn())
+                self._tasks[(loop, key)] = task
+                task.add_done_callback(lambda _: self._forget((loop, key), task))
+                self.calls += 1
+            else:
+                self.coalesced += 1
+        # one waiter being cancelled must not cancel the shared call
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        with self._lock:
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+
+    def stats(self):
+        total = self.calls + self.coalesced
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "coalesced_rate": round(self.coalesced / total, 4) if total else 0.0,
+        }
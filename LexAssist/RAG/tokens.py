@@ -0,0 +1,12 @@
+import re
+
+
+# Llama's BPE splits English into roughly one token per four characters of a
+# word, plus one per punctuation mark; close enough to budget prompts without
+# downloading its tokenizer
+TOKEN_PIECE = re.compile(r"\w{1,4}|[^\w\s]")
+
+
+def count_tokens(text):
+    """Approximate number of LLM tokens in text."""
+    return len(TOKEN_PIECE.findall(text))
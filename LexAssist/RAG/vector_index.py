@@ -0,0 +1,188 @@
+import math
+import os
+import time
+
+import faiss
+import numpy as np
+
+
+# index types that can be built next to the exact flat index
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+
+# defaults for build-time parameters
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+PQ_M = 48
+
+# defaults for query-time parameters
+DEFAULT_NPROBE = 16
+DEFAULT_EF_SEARCH = 64
+
+# IVF-PQ candidates fetched per requested hit before exact re-scoring
+PQ_REFINE_FACTOR = 4
+
+# training sample size and rows added per batch
+MAX_TRAIN_POINTS = 100_000
+ADD_BATCH = 65536
+
+
+def index_filename(index_type):
+    # the flat index is the canonical one every generation has
+    return "index.faiss" if index_type == "flat" else f"index.{index_type}.faiss"
+
+
+# k-means points FAISS wants per centroid before it warns
+MIN_POINTS_PER_CENTROID = 39
+
+
+def default_nlist(n):
+    # about 4 * sqrt(n) lists, with enough training points per list
+    return max(1, min(int(4 * math.sqrt(n)), n // MIN_POINTS_PER_CENTROID))
+
+
+def pq_nbits(n):
+    # 2 ** nbits centroids per sub-quantizer, trained on the n vectors
+    return max(1, min(8, int(math.log2(max(n // MIN_POINTS_PER_CENTROID, 2)))))
+
+
+def _sample(flat_index, limit, seed=0):
+    n = flat_index.ntotal
+    if n <= limit:
+        return flat_index.reconstruct_n(0, n)
+    rows = np.sort(np.random.default_rng(seed).choice(n, limit, replace=False))
+    return np.vstack([flat_index.reconstruct(int(row)) for row in rows])
+
+
+def build_index(flat_index, index_type, nlist=None, pq_m=PQ_M, hnsw_m=HNSW_M):
+    """
+    Build an approximate index holding the same rows, in the same order, as
+    flat_index, so search results still map directly to chunk store rows.
+    """
+    if index_type not in INDEX_TYPES or index_type == "flat":
+        raise ValueError(f"Unknown approximate index type: {index_type}")
+
+    n, dim = flat_index.ntotal, flat_index.d
+
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    else:
+        # an explicit nlist is capped the same way, small corpora cannot train it
+        nlist = min(nlist or default_nlist(n), default_nlist(n))
+        quantizer = faiss.IndexFlatL2(dim)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        else:
+            if dim % pq_m:
+                raise ValueError(f"pq_m={pq_m} must divide the embedding size {dim}")
+            # small corpora cannot train 256 centroids per sub-quantizer
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, pq_nbits(n))
+
+        started = time.perf_counter()
+        index.train(_sample(flat_index, MAX_TRAIN_POINTS))
+        print(f"Trained {index_type} ({nlist} lists) in {time.perf_counter() - started:.1f}s")
+
+    for first in range(0, n, ADD_BATCH):
+        index.add(flat_index.reconstruct_n(first, min(ADD_BATCH, n - first)))
+    return index
+
+
+def set_search_params(index, nprobe=DEFAULT_NPROBE, ef_search=DEFAULT_EF_SEARCH):
+    """Apply query-time knobs; parameters that do not apply are ignored."""
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search
+        return
+
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return
+    ivf.nprobe = min(nprobe, ivf.nlist)
+
+
+def is_pq(index):
+    # extract_index_ivf returns the IndexIVF base proxy, downcast to see the type
+    try:
+        return isinstance(faiss.downcast_index(faiss.extract_index_ivf(index)), faiss.IndexIVFPQ)
+    except RuntimeError:
+        return False
+
+
+def search(index, queries, k, exact_index=None):
+    """
+    Search index, re-scoring IVF-PQ candidates with exact L2 distances from
+    exact_index so scores stay on the same scale as the flat index.
+    """
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    if exact_index is None or not is_pq(index):
+        return index.search(queries, k)
+
+    _, candidates = index.search(queries, k * PQ_REFINE_FACTOR)
+    distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+    rows = np.full((len(queries), k), -1, dtype=np.int64)
+
+    for i, (query, found) in enumerate(zip(queries, candidates)):
+        found = found[found != -1]
+        if not len(found):
+            continue
+        vectors = np.vstack([exact_index.reconstruct(int(row)) for row in found])
+        exact = ((vectors - query) ** 2).sum(axis=1)
+        order = np.argsort(exact)[:k]
+        distances[i, :len(order)] = exact[order]
+        rows[i, :len(order)] = found[order]
+    return distances, rows
+
+
+def evaluate(flat_index, index, queries, k=10, threshold=None):
+    """
+    Compare index against the exact flat index.
+
+    Reports recall@k against the flat top-k, per-query latency, the shift of
+    the best distance, and how often an answer/refuse decision at threshold
+    would flip.
+    """
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    exact_d, exact_rows = flat_index.search(queries, k)
+
+    latencies = []
+    found_d, found_rows = [], []
+    for query in queries:
+        started = time.perf_counter()
+        d, rows = search(index, query[None, :], k, exact_index=flat_index)
+        latencies.append((time.perf_counter() - started) * 1000)
+        found_d.append(d[0])
+        found_rows.append(rows[0])
+
+    recall = np.mean([
+        len(set(exact[exact != -1]) & set(found[found != -1])) / max(1, (exact != -1).sum())
+        for exact, found in zip(exact_rows, found_rows)
+    ])
+    best_shift = np.mean([abs(f[0] - e[0]) for f, e in zip(found_d, exact_d)])
+
+    report = {
+        "queries": len(queries),
+        "k": k,
+        f"recall@{k}": round(float(recall), 4),
+        "latency_ms_mean": round(float(np.mean(latencies)), 4),
+        "latency_ms_p50": round(float(np.percentile(latencies, 50)), 4),
+        "latency_ms_p95": round(float(np.percentile(latencies, 95)), 4),
+        "top1_distance_shift": round(float(best_shift), 4),
+    }
+    if threshold is not None:
+        flips = [(f[0] > threshold) != (e[0] > threshold) for f, e in zip(found_d, exact_d)]
+        report["threshold_flips"] = round(float(np.mean(flips)), 4)
+    return report
+
+
+def sample_queries(flat_index, n=200, seed=1):
+    """Stored vectors with a little noise, so no query is an exact duplicate."""
+    queries = _sample(flat_index, n, seed)
+    noise = np.random.default_rng(seed).normal(0, 0.02, queries.shape).astype(np.float32)
+    return queries + noise
+
+
+def write_index(index, gen_dir, index_type):
+    path = os.path.join(gen_dir, index_filename(index_type))
+    faiss.write_index(index, path + ".tmp")
+    os.replace(path + ".tmp", path)
+    return path
@@ -1,15 +1,24 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
+import json
 from dotenv import load_dotenv
 import requests
+import hashlib
 import sqlite3
+import threading
+import time
 import uuid
+from collections import OrderedDict
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask import g
 import sys
 
+from config import config
+
 # Load environment variables
 load_dotenv()
 
@@ -17,6 +26,7 @@ app = Flask(__name__)
 CORS(app)
 
 # Configuration
+app.config.from_object(config.get(os.getenv('FLASK_ENV', 'production'), config['production']))
 app.config['JSON_SORT_KEYS'] = False
 
 # Add RAG directory to path for imports
@@ -24,28 +34,78 @@ rag_path = os.path.join(os.path.dirname(__file__), 'RAG')
 if rag_path not in sys.path:
     sys.path.insert(0, rag_path)
 
+# latency histograms and counters served at /metrics, per process
+import metrics
+
 # Import RAG query function
 try:
-    from query import run_query as rag_run_query
+    from query import (
+        run_query as rag_run_query,
+        arun_query as rag_arun_query,
+        stream_query as rag_stream_query,
+        astream_query as rag_astream_query,
+        run_queries as rag_run_queries,
+        arun_queries as rag_arun_queries,
+        answer_cache_stats,
+        coalescing_stats,
+        metrics_lines as rag_metrics_lines,
+        rerank_stats,
+        warm_up,
+        warm_up_status,
+        BATCH_MAX_QUESTIONS,
+    )
     RAG_AVAILABLE = True
 except ImportError as e:
     print(f"Warning: Could not import RAG module: {e}")
     RAG_AVAILABLE = False
 
+# when to load the embedding model, index and LLM client:
+#   background - on a thread at startup, health checks answer meanwhile
+#   eager      - before the app is served (gunicorn.conf.py uses this with preload_app)
+#   lazy       - on the first query
+RAG_WARMUP = os.getenv('RAG_WARMUP', 'background')
+
+if RAG_AVAILABLE:
+    if RAG_WARMUP == 'eager':
+        warm_up(background=False)
+    elif RAG_WARMUP == 'background':
+        warm_up()
+
 # Database configuration
 DB_PATH = os.getenv('DATABASE_PATH', 'startuplex_users.db')
 
 
+# one connection per thread, reused by every request that thread serves, so
+# connection setup and statement compilation are paid once per thread
+_db_local = threading.local()
+
+
 def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    conn = getattr(_db_local, 'conn', None)
+    # a connection opened before fork() (gunicorn preload_app) is not reused
+    if conn is None or _db_local.pid != os.getpid():
+        conn = sqlite3.connect(DB_PATH, timeout=30)
+        conn.row_factory = sqlite3.Row
+        # WAL lets readers run while a signup writes; NORMAL syncs at checkpoints only
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        _db_local.conn = conn
+        _db_local.pid = os.getpid()
     return conn
 
 
+@app.teardown_appcontext
+def release_db_connection(exception=None):
+    # the connection stays open for the thread's next request, but a failed
+    # request must not leave a transaction holding the write lock
+    conn = getattr(_db_local, 'conn', None)
+    if conn is not None and _db_local.pid == os.getpid() and conn.in_transaction:
+        conn.rollback()
+
+
 def create_users_table():
     conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
+    conn.execute(
         '''
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -57,54 +117,303 @@ def create_users_table():
         )
         '''
     )
+    # API keys are stored only as digests; key_hash is UNIQUE, so indexed
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS api_keys (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL REFERENCES users (id),
+            key_hash TEXT NOT NULL UNIQUE,
+            created_at TEXT,
+            expires_at TEXT
+        )
+        '''
+    )
+    columns = [row['name'] for row in conn.execute('PRAGMA table_info(api_keys)')]
+    if 'expires_at' not in columns:
+        conn.execute('ALTER TABLE api_keys ADD COLUMN expires_at TEXT')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_api_keys_user_id ON api_keys (user_id)')
     conn.commit()
-    conn.close()
+    migrate_plaintext_api_keys(conn)
+    with conn:
+        # keys issued before keys expired get a full lifetime from now
+        conn.execute('UPDATE api_keys SET expires_at = ? WHERE expires_at IS NULL', (api_key_expiry(),))
+        conn.execute('DELETE FROM api_keys WHERE expires_at <= ?', (datetime.now().isoformat(),))
+
+
+def migrate_plaintext_api_keys(conn):
+    # databases created before api_keys kept the raw key in users.api_key
+    with conn:
+        rows = conn.execute('SELECT id, api_key, created_at FROM users WHERE api_key IS NOT NULL').fetchall()
+        conn.executemany(
+            'INSERT OR IGNORE INTO api_keys (user_id, key_hash, created_at) VALUES (?, ?, ?)',
+            [(row['id'], hash_api_key(row['api_key']), row['created_at']) for row in rows]
+        )
+        conn.execute('UPDATE users SET api_key = NULL WHERE api_key IS NOT NULL')
+    if rows:
+        print(f'Moved {len(rows)} plaintext API keys to hashed storage')
 
 
-def create_user(name, email, password):
-    password_hash = generate_password_hash(password)
+# days an API key stays valid, and the most keys a user keeps: each sign-in
+# issues a key, the oldest beyond API_KEYS_PER_USER are retired
+API_KEY_TTL_DAYS = float(os.getenv('API_KEY_TTL_DAYS', '30'))
+API_KEYS_PER_USER = int(os.getenv('API_KEYS_PER_USER', '10'))
+
+
+def api_key_expiry():
+    return (datetime.now() + timedelta(days=API_KEY_TTL_DAYS)).isoformat()
+
+
+def hash_api_key(api_key):
+    # keys are random uuid4s, so a plain (unsalted, fast) digest is enough
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+
+
+def create_api_key(conn, user_id):
+    """Store a new key for user_id and return it; only its digest is kept."""
     api_key = str(uuid.uuid4())
+    conn.execute(
+        'INSERT INTO api_keys (user_id, key_hash, created_at, expires_at) VALUES (?, ?, ?, ?)',
+        (user_id, hash_api_key(api_key), datetime.now().isoformat(), api_key_expiry())
+    )
+    return api_key
+
+
+def retire_api_keys(conn, user_id):
+    """Delete the expired keys of user_id and the oldest beyond API_KEYS_PER_USER; returns their digests."""
+    rows = conn.execute(
+        'SELECT key_hash, expires_at FROM api_keys WHERE user_id = ? ORDER BY id DESC', (user_id,)
+    ).fetchall()
+    now = datetime.now().isoformat()
+    retired = [
+        row['key_hash'] for i, row in enumerate(rows)
+        if i >= API_KEYS_PER_USER or row['expires_at'] <= now
+    ]
+    conn.executemany('DELETE FROM api_keys WHERE key_hash = ?', [(h,) for h in retired])
+    return retired
+
+
+class PasswordHashingBusy(Exception):
+    """The password KDF pool is saturated (429) or too far behind (503)."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class PasswordHasher:
+    """
+    Runs the password KDF on a few dedicated threads.
+
+    scrypt and PBKDF2 release the GIL, so a burst of signins keeps at most
+    `workers` cores busy and the threads serving /api/query keep running.
+    At most workers + queue hashes are accepted at once; beyond that
+    run() fails fast with 429 instead of piling up blocked request threads.
+    """
+
+    def __init__(self, workers, queue, timeout):
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(self.workers + max(0, queue))
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        # worker threads do not survive fork(), each process starts its own
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix='password-kdf')
+                self._pid = os.getpid()
+            return self._pool
+
+    def run(self, fn, *args, **kwargs):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHashingBusy(429, 'Too many sign-in attempts in progress, retry shortly')
+        try:
+            future = self._executor().submit(fn, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # the hash still finishes (and frees its slot), nobody waits for it
+            raise PasswordHashingBusy(503, 'Sign-in is temporarily overloaded, retry shortly')
+
+
+password_hasher = PasswordHasher(
+    app.config['PASSWORD_HASH_WORKERS'],
+    app.config['PASSWORD_HASH_QUEUE'],
+    app.config['PASSWORD_HASH_TIMEOUT']
+)
+
+
+def hash_password(password):
+    return password_hasher.run(
+        generate_password_hash, password, method=app.config['PASSWORD_HASH_METHOD']
+    )
+
+
+def busy_response(error):
+    return jsonify({'error': str(error)}), error.status, {'Retry-After': '1'}
+
+
+def create_user(name, email, password):
+    password_hash = hash_password(password)
     created_at = datetime.now().isoformat()
     conn = get_db_connection()
-    cur = conn.cursor()
     try:
-        cur.execute(
-            'INSERT INTO users (name, email, password_hash, api_key, created_at) VALUES (?, ?, ?, ?, ?)',
-            (name, email, password_hash, api_key, created_at)
-        )
-        conn.commit()
-        user_id = cur.lastrowid
+        # commits, or rolls back on error, as one transaction
+        with conn:
+            cur = conn.execute(
+                'INSERT INTO users (name, email, password_hash, created_at) VALUES (?, ?, ?, ?)',
+                (name, email, password_hash, created_at)
+            )
+            user_id = cur.lastrowid
+            api_key = create_api_key(conn, user_id)
     except sqlite3.IntegrityError:
-        conn.close()
         return None
-    conn.close()
     return {'id': user_id, 'name': name, 'email': email, 'api_key': api_key, 'created_at': created_at}
 
 
 def get_user_by_email(email):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('SELECT * FROM users WHERE email = ?', (email,))
-    row = cur.fetchone()
-    conn.close()
+    row = get_db_connection().execute('SELECT * FROM users WHERE email = ?', (email,)).fetchone()
     return dict(row) if row else None
 
 
 def get_user_by_api_key(api_key):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('SELECT * FROM users WHERE api_key = ?', (api_key,))
-    row = cur.fetchone()
-    conn.close()
+    return get_user_by_key_hash(hash_api_key(api_key))
+
+
+def get_user_by_key_hash(key_hash):
+    # the key's expiry comes along, so auth_cache never outlives the key
+    row = get_db_connection().execute(
+        'SELECT users.*, api_keys.expires_at AS key_expires_at '
+        'FROM api_keys JOIN users ON users.id = api_keys.user_id '
+        'WHERE api_keys.key_hash = ? AND api_keys.expires_at > ?',
+        (key_hash, datetime.now().isoformat())
+    ).fetchone()
     return dict(row) if row else None
 
 
+def issue_api_key(user_id):
+    conn = get_db_connection()
+    with conn:
+        api_key = create_api_key(conn, user_id)
+        retired = retire_api_keys(conn, user_id)
+    for h in retired:
+        auth_cache.invalidate(h)
+    return api_key
+
+
+def revoke_api_keys(user_id, key_hash=None):
+    """Delete one key of user_id, or all of them, and drop them from auth_cache."""
+    conn = get_db_connection()
+    with conn:
+        if key_hash is None:
+            hashes = [row['key_hash'] for row in conn.execute(
+                'SELECT key_hash FROM api_keys WHERE user_id = ?', (user_id,)
+            )]
+        else:
+            hashes = [key_hash]
+        conn.executemany(
+            'DELETE FROM api_keys WHERE user_id = ? AND key_hash = ?',
+            [(user_id, h) for h in hashes]
+        )
+    for h in hashes:
+        auth_cache.invalidate(h)
+    return len(hashes)
+
+
+class AuthCache:
+    """
+    Bounded LRU of key digest -> user in front of get_user_by_key_hash.
+
+    Entries expire after ttl seconds, or when their API key expires if that
+    is sooner. Revocation invalidates the entry in this process; other worker
+    processes drop theirs when it expires.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # bumped by every invalidation, see get()
+        self._generation = 0
+
+    def get(self, key_hash):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key_hash)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key_hash)
+                return entry[1]
+            generation = self._generation
+
+        user = get_user_by_key_hash(key_hash)
+        # unknown keys are not cached, a flood of them cannot evict real users
+        if user is not None and self.max_entries > 0:
+            with self._lock:
+                # a revocation during the lookup may have made user stale,
+                # caching it would undo the revocation for ttl seconds
+                if self._generation != generation:
+                    return user
+                self._entries[key_hash] = (now + self.lifetime(user), user)
+                self._entries.move_to_end(key_hash)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return user
+
+    def lifetime(self, user):
+        """Seconds to cache user for: ttl, capped at the expiry of its key."""
+        expires_at = user.get('key_expires_at')
+        if expires_at is None:
+            return self.ttl
+        left = (datetime.fromisoformat(expires_at) - datetime.now()).total_seconds()
+        return min(self.ttl, max(0.0, left))
+
+    def invalidate(self, key_hash):
+        with self._lock:
+            self._entries.pop(key_hash, None)
+            self._generation += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+
+# authenticated users kept in memory, AUTH_CACHE_SIZE=0 disables the cache
+AUTH_CACHE_SIZE = int(os.getenv('AUTH_CACHE_SIZE', '10000'))
+AUTH_CACHE_TTL = float(os.getenv('AUTH_CACHE_TTL', '60'))
+auth_cache = AuthCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+
+
 def verify_password(stored_hash, password):
-    return check_password_hash(stored_hash, password)
+    return password_hasher.run(check_password_hash, stored_hash, password)
 
 # Initialize DB table
 create_users_table()
 
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def observe_request(response):
+    # a streamed response has only sent its headers here, stream_answer times
+    # it once the last event is out
+    started = g.pop('request_started', None)
+    if started is not None and not response.is_streamed:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.http_seconds.observe(time.perf_counter() - started, route, str(response.status_code))
+    return response
+
 # Routes
 
 @app.route('/', methods=['GET'])
@@ -114,6 +423,8 @@ def health_check():
         'status': 'active',
         'service': 'StartupLex Backend',
         'rag_available': RAG_AVAILABLE,
+        'rag_warmup': warm_up_status() if RAG_AVAILABLE else None,
+        'rerank': rerank_stats() if RAG_AVAILABLE else None,
         'timestamp': datetime.now().isoformat()
     }), 200
 
@@ -123,6 +434,7 @@ def handle_query():
     """
     Handle legal queries from the frontend using RAG model
     Expected JSON: { "question": "user question" }
+    ?timings=1 or "timings": true adds per-stage milliseconds and token counts
     """
     try:
         data = request.get_json()
@@ -135,8 +447,13 @@ def handle_query():
         if not RAG_AVAILABLE:
             return jsonify({'error': 'RAG model not available. Check if RAG module is properly configured.'}), 503
         
+        if request.args.get('stream') == '1':
+            return stream_answer(question)
+        
         # Get response from RAG model
-        answer = rag_run_query(question)
+        traced = request.args.get('timings') == '1' or data.get('timings') is True
+        with metrics.trace() if traced else nullcontext() as timings:
+            answer = rag_run_query(question)
         
         response = {
             'status': 'success',
@@ -144,6 +461,8 @@ def handle_query():
             'answer': answer,
             'timestamp': datetime.now().isoformat()
         }
+        if timings is not None:
+            response['timings'] = timings
         
         return jsonify(response), 200
     
@@ -151,6 +470,115 @@ def handle_query():
         return jsonify({'error': str(e)}), 500
 
 
+def read_batch(data):
+    """Return the questions of a batch request, or an error message"""
+    questions = data.get('questions') if isinstance(data, dict) else None
+    if not isinstance(questions, list) or not questions:
+        return None, 'Missing required field: questions (a non-empty list)'
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        return None, f'Too many questions: at most {BATCH_MAX_QUESTIONS} per batch'
+    return questions, None
+
+
+def batch_response(results):
+    return {
+        'status': 'success',
+        'count': len(results),
+        'failed': sum('error' in result for result in results),
+        'results': results,
+        'timestamp': datetime.now().isoformat()
+    }
+
+
+@app.route('/api/query/batch', methods=['POST'])
+def handle_query_batch():
+    """
+    Answer many legal questions in one call
+    Expected JSON: { "questions": ["question", ...] }
+    Results keep the input order; a failed question gets an "error" instead of an "answer"
+    """
+    try:
+        if not RAG_AVAILABLE:
+            return jsonify({'error': 'RAG model not available. Check if RAG module is properly configured.'}), 503
+
+        questions, error = read_batch(request.get_json(silent=True))
+        if error:
+            return jsonify({'error': error}), 400
+
+        return jsonify(batch_response(rag_run_queries(questions))), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def sse_event(event, data):
+    """Format one Server-Sent Event"""
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+def stream_answer(question):
+    """Stream answer tokens as SSE, then a final event with sources and timing"""
+    started = g.get('request_started', time.perf_counter())
+    route = request.url_rule.rule
+
+    def generate():
+        try:
+            for event, payload in rag_stream_query(question):
+                if event == 'token':
+                    yield sse_event('token', {'text': payload})
+                else:
+                    payload.update({'status': 'success', 'question': question, 'timestamp': datetime.now().isoformat()})
+                    yield sse_event('done', payload)
+        except Exception as e:
+            yield sse_event('error', {'error': str(e)})
+        finally:
+            # also runs when the client disconnects mid-stream
+            metrics.http_seconds.observe(time.perf_counter() - started, route, '200')
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@app.route('/api/query/stream', methods=['POST'])
+def handle_query_stream():
+    """
+    Stream a legal answer token by token using Server-Sent Events
+    Expected JSON: { "question": "user question" }
+    Events: token {"text"}, then done {"answer", "sources", "timing"} or error {"error"}
+    """
+    data = request.get_json(silent=True)
+
+    if not data or 'question' not in data:
+        return jsonify({'error': 'Missing required field: question'}), 400
+
+    if not RAG_AVAILABLE:
+        return jsonify({'error': 'RAG model not available. Check if RAG module is properly configured.'}), 503
+
+    return stream_answer(data.get('question'))
+
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """Answer cache hit rate, latency saved and coalesced LLM calls"""
+    if not RAG_AVAILABLE:
+        return jsonify({'error': 'RAG model not available. Check if RAG module is properly configured.'}), 503
+    return jsonify({
+        'status': 'success',
+        'answer_cache': answer_cache_stats(),
+        'coalescing': coalescing_stats(),
+    }), 200
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Stage, query and HTTP latency histograms, token counts and cache counters for Prometheus"""
+    extra = rag_metrics_lines() if RAG_AVAILABLE else []
+    return Response(metrics.render(extra), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 def _extract_api_key_from_header():
     auth = request.headers.get('Authorization', '')
     if not auth:
@@ -169,10 +597,12 @@ def auth_required(f):
         api_key = _extract_api_key_from_header()
         if not api_key:
             return jsonify({'error': 'Missing Authorization header'}), 401
-        user = get_user_by_api_key(api_key)
+        key_hash = hash_api_key(api_key)
+        user = auth_cache.get(key_hash)
         if not user:
             return jsonify({'error': 'Invalid API token'}), 401
         g.current_user = user
+        g.api_key_hash = key_hash
         return f(*args, **kwargs)
 
     return decorated
@@ -198,6 +628,8 @@ def signup():
             return jsonify({'error': 'Failed to create user'}), 500
 
         return jsonify({'status': 'success', 'user': {'id': user['id'], 'name': user['name'], 'email': user['email']}, 'api_key': user['api_key']}), 201
+    except PasswordHashingBusy as e:
+        return busy_response(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -219,12 +651,26 @@ def signin():
         if not verify_password(user['password_hash'], password):
             return jsonify({'error': 'Invalid credentials'}), 401
 
-        # Return existing API key
-        return jsonify({'status': 'success', 'user': {'id': user['id'], 'name': user['name'], 'email': user['email']}, 'api_key': user['api_key']}), 200
+        # only digests are stored, so each sign-in issues a new key and
+        # retires expired ones and the oldest past API_KEYS_PER_USER
+        api_key = issue_api_key(user['id'])
+        return jsonify({'status': 'success', 'user': {'id': user['id'], 'name': user['name'], 'email': user['email']}, 'api_key': api_key}), 200
+    except PasswordHashingBusy as e:
+        return busy_response(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/auth/revoke', methods=['POST'])
+@auth_required
+def revoke():
+    """Revoke the API key of this request, or with {"all": true} every key of the user"""
+    data = request.get_json(silent=True) or {}
+    user = g.current_user
+    revoked = revoke_api_keys(user['id'], None if data.get('all') else g.api_key_hash)
+    return jsonify({'status': 'success', 'revoked': revoked}), 200
+
+
 @app.route('/api/auth/me', methods=['GET'])
 @auth_required
 def me():
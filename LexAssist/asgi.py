@@ -0,0 +1,182 @@
+"""
+ASGI entry point for the StartupLex backend.
+
+/api/query, /api/query/stream and /api/query/batch are answered on the event
+loop with the async RAG pipeline, so a worker waiting on Groq does not pin a thread and one
+process can keep hundreds of queries in flight. Every other route is served by the Flask app
+unchanged through asgiref's WSGI adapter.
+
+Run with:
+    uvicorn asgi:application --host 0.0.0.0 --port 5000 --workers 4
+"""
+
+import json
+import time
+from contextlib import nullcontext
+from datetime import datetime
+
+from asgiref.wsgi import WsgiToAsgi
+
+import app as backend
+# importable once app has put RAG/ on sys.path
+import metrics
+
+flask_asgi = WsgiToAsgi(backend.app)
+
+# routes answered on the event loop, everything else goes to Flask
+ASYNC_ROUTES = ('/api/query', '/api/query/stream', '/api/query/batch')
+
+# largest request body accepted by the async endpoint
+MAX_BODY_BYTES = 1024 * 1024
+
+
+async def read_json(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if len(body) > MAX_BODY_BYTES:
+            return None
+        if not message.get('more_body'):
+            break
+    try:
+        return json.loads(body or b'null')
+    except ValueError:
+        return None
+
+
+async def send_json(send, status, payload):
+    body = json.dumps(payload).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+            # same policy as flask_cors' CORS(app)
+            (b'access-control-allow-origin', b'*'),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def stream_answer(send, question):
+    """Send answer tokens as Server-Sent Events, ending with a done or error event"""
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+            (b'access-control-allow-origin', b'*'),
+        ],
+    })
+
+    async def emit(event, data):
+        chunk = backend.sse_event(event, data).encode('utf-8')
+        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+
+    try:
+        async for event, payload in backend.rag_astream_query(question):
+            if event == 'token':
+                await emit('token', {'text': payload})
+            else:
+                payload.update({'status': 'success', 'question': question, 'timestamp': datetime.now().isoformat()})
+                await emit('done', payload)
+    except Exception as e:
+        await emit('error', {'error': str(e)})
+
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def handle_query_batch(scope, receive, send):
+    """Async twin of app.handle_query_batch"""
+    try:
+        if not backend.RAG_AVAILABLE:
+            return await send_json(send, 503, {'error': 'RAG model not available. Check if RAG module is properly configured.'})
+
+        questions, error = backend.read_batch(await read_json(receive))
+        if error:
+            return await send_json(send, 400, {'error': error})
+
+        results = await backend.rag_arun_queries(questions)
+        return await send_json(send, 200, backend.batch_response(results))
+
+    except Exception as e:
+        return await send_json(send, 500, {'error': str(e)})
+
+
+async def handle_query(scope, receive, send):
+    """Async twin of app.handle_query with the same request and response shape"""
+    try:
+        data = await read_json(receive)
+
+        if not isinstance(data, dict) or 'question' not in data:
+            return await send_json(send, 400, {'error': 'Missing required field: question'})
+
+        question = data.get('question')
+
+        if not backend.RAG_AVAILABLE:
+            return await send_json(send, 503, {'error': 'RAG model not available. Check if RAG module is properly configured.'})
+
+        if scope['path'] == '/api/query/stream' or b'stream=1' in scope.get('query_string', b'').split(b'&'):
+            return await stream_answer(send, question)
+
+        # Get response from RAG model without blocking the event loop
+        traced = b'timings=1' in scope.get('query_string', b'').split(b'&') or data.get('timings') is True
+        with metrics.trace() if traced else nullcontext() as timings:
+            answer = await backend.rag_arun_query(question)
+
+        response = {
+            'status': 'success',
+            'question': question,
+            'answer': answer,
+            'timestamp': datetime.now().isoformat()
+        }
+        if timings is not None:
+            response['timings'] = timings
+
+        return await send_json(send, 200, response)
+
+    except Exception as e:
+        return await send_json(send, 500, {'error': str(e)})
+
+
+def observed(send, route):
+    """Wrap send to time the response like app.observe_request, to its last byte"""
+    started = time.perf_counter()
+    status = None
+
+    async def send_observed(message):
+        nonlocal status
+        await send(message)
+        if message['type'] == 'http.response.start':
+            status = str(message['status'])
+        elif message['type'] == 'http.response.body' and not message.get('more_body', False):
+            metrics.http_seconds.observe(time.perf_counter() - started, route, status)
+
+    return send_observed
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+
+    if scope['type'] == 'http' and scope['path'] in ASYNC_ROUTES and scope['method'] == 'POST':
+        send = observed(send, scope['path'])
+        if scope['path'] == '/api/query/batch':
+            return await handle_query_batch(scope, receive, send)
+        return await handle_query(scope, receive, send)
+
+    return await flask_asgi(scope, receive, send)
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+"""
+Encode latency, memory and retrieval agreement of the torch and int8 ONNX
+embedding backends.
+
+Each backend runs in its own process so its import cost and RSS are measured
+in isolation. The ONNX vectors are then compared with the torch ones, and
+both are searched against the exact index of the current legal_faiss_db
+generation. Export the ONNX model first, then run from the LexAssist
+directory:
+
+    python RAG/embedding_backends.py --export
+    python benchmarks/bench_embeddings.py --output embeddings_report.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+from common import RAG_DIR, questions
+
+from chunk_store import INDEX_FILE, ChunkStore, current_generation
+
+# distance cutoff used by query.py
+SIMILARITY_THRESHOLD = 2.3
+
+
+def rss_mb():
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return round(psutil.Process().memory_info().rss / 2 ** 20, 1)
+
+
+def run_worker(backend, questions, documents, repeats, vectors_path):
+    """Load one backend, time it and save its query vectors."""
+    rss_before = rss_mb()
+    started = time.perf_counter()
+    from embedding_backends import load_embeddings
+    embeddings = load_embeddings(backend)
+    embeddings.embed_query('warm up')
+    load_seconds = time.perf_counter() - started
+
+    latencies = []
+    for _ in range(repeats):
+        for question in questions:
+            started = time.perf_counter()
+            embeddings.embed_query(question)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    embeddings.embed_documents(documents)
+    batch_seconds = time.perf_counter() - started
+
+    np.save(vectors_path, np.array([embeddings.embed_query(q) for q in questions], dtype=np.float32))
+    return {
+        'backend': backend,
+        'load_seconds': round(load_seconds, 3),
+        'query_ms_p50': round(float(np.percentile(latencies, 50)), 3),
+        'query_ms_p95': round(float(np.percentile(latencies, 95)), 3),
+        'documents_per_second': round(len(documents) / batch_seconds, 1),
+        'rss_mb_before_load': rss_before,
+        'rss_mb': rss_mb(),
+    }
+
+
+def retrieval_agreement(flat, reference, candidate, k):
+    """How often candidate vectors retrieve what the reference vectors do."""
+    ref_d, ref_rows = flat.search(reference, k)
+    cand_d, cand_rows = flat.search(candidate, k)
+    overlap = [
+        len(set(r[r != -1]) & set(c[c != -1])) / max(1, (r != -1).sum())
+        for r, c in zip(ref_rows, cand_rows)
+    ]
+    flips = [
+        (r[0] > SIMILARITY_THRESHOLD) != (c[0] > SIMILARITY_THRESHOLD)
+        for r, c in zip(ref_d, cand_d)
+    ]
+    return {
+        f'overlap@{k}': round(float(np.mean(overlap)), 4),
+        'top1_agreement': round(float(np.mean(ref_rows[:, 0] == cand_rows[:, 0])), 4),
+        'threshold_flips': round(float(np.mean(flips)), 4),
+    }
+
+
+def load_documents(db_dir, n):
+    """Chunk texts from the current generation, for the batch throughput test."""
+    gen_dir = current_generation(db_dir)
+    if gen_dir is None:
+        return [], None
+
+    store = ChunkStore(gen_dir)
+    documents = [store.text(row) for row in range(min(n, len(store)))]
+    store.close()
+    return documents, faiss.read_index(os.path.join(gen_dir, INDEX_FILE))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--backends', default='torch,onnx', help='comma separated, the first is the reference')
+    parser.add_argument('--db-dir', default=os.path.join(RAG_DIR, 'legal_faiss_db'))
+    parser.add_argument('--documents', type=int, default=256, help='chunks encoded for the throughput test')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--output', help='write the report as JSON to this file')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--vectors', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    asked = questions()
+    documents, flat = load_documents(args.db_dir, args.documents)
+    documents = documents or asked * 8
+
+    if args.worker:
+        result = run_worker(args.worker, asked, documents, args.repeats, args.vectors)
+        print(json.dumps(result))
+        return
+
+    backends = args.backends.split(',')
+    results, vectors = [], {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in backends:
+            path = os.path.join(tmp, f'{backend}.npy')
+            done = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--worker', backend,
+                 '--vectors', path, '--db-dir', args.db_dir,
+                 '--documents', str(args.documents), '--repeats', str(args.repeats)],
+                capture_output=True, text=True
+            )
+            if done.returncode:
+                sys.exit(f'{backend} backend failed:\n{done.stderr}')
+            results.append(json.loads(done.stdout.strip().splitlines()[-1]))
+            vectors[backend] = np.load(path)
+
+    reference = backends[0]
+    for row in results[1:]:
+        cosine = (vectors[row['backend']] * vectors[reference]).sum(axis=1)
+        row['cosine_vs_' + reference] = {
+            'mean': round(float(cosine.mean()), 5),
+            'min': round(float(cosine.min()), 5),
+        }
+        if flat is not None:
+            row['retrieval_vs_' + reference] = retrieval_agreement(
+                flat, vectors[reference], vectors[row['backend']], args.k
+            )
+
+    print(f"{'backend':<8} {'load s':>7} {'p50 ms':>8} {'p95 ms':>8} {'docs/s':>8} {'RSS MB':>8} {'cosine':>8} {'overlap':>8}")
+    for row in results:
+        cosine = row.get('cosine_vs_' + reference, {}).get('mean', '-')
+        overlap = row.get('retrieval_vs_' + reference, {}).get(f'overlap@{args.k}', '-')
+        print(
+            f"{row['backend']:<8} {row['load_seconds']:>7} {row['query_ms_p50']:>8} "
+            f"{row['query_ms_p95']:>8} {row['documents_per_second']:>8} "
+            f"{str(row['rss_mb']):>8} {cosine:>8} {overlap:>8}"
+        )
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'questions': len(asked),
+                'documents': len(documents),
+                'results': results,
+            }, f, indent=2)
+        print(f'Report written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+"""
+HTTP load test of POST /api/query at rising concurrency.
+
+Each level runs `concurrency` clients, each with its own keep-alive
+connection, sending questions back to back for --duration seconds. It
+reports throughput and p50/p95/p99 latency of successful requests, and the
+error count.
+
+Point it at a running server with --url, or let it start one with --serve
+flask|uvicorn: that server uses the fake LLM, no answer cache and a scratch
+user database, so the numbers are this codebase's own overhead. Run from the
+LexAssist directory:
+
+    python benchmarks/bench_http.py --serve flask --concurrency 1,4,16,64 --output http.json
+"""
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+from common import LEXASSIST_DIR, percentiles, questions, write_report
+
+
+def start_server(kind, port, env):
+    if kind == 'uvicorn':
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:application',
+                   '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning']
+    else:
+        command = [sys.executable, '-c',
+                   f"import app; app.app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    server = subprocess.Popen(
+        command, cwd=LEXASSIST_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+    )
+
+    # RAG_WARMUP=eager: the port opens once the model and index are loaded
+    deadline = time.monotonic() + 300
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f'Server exited:\n{server.stderr.read()}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise SystemExit('Server did not start within 300s')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def client(url, asked, offset, stop_at, latencies, errors, lock):
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=120)
+    path = parts.path.rstrip('/') + '/api/query'
+    i = offset
+    while time.perf_counter() < stop_at:
+        question = asked[i % len(asked)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            ok = post_query(conn, path, question) == 200
+        except (OSError, http.client.HTTPException):
+            ok = False
+            conn.close()
+            conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=120)
+        ms = (time.perf_counter() - started) * 1000
+        with lock:
+            if ok:
+                latencies.append(ms)
+            else:
+                errors.append(ms)
+    conn.close()
+
+
+def post_query(conn, path, question):
+    conn.request('POST', path, json.dumps({'question': question}), {'Content-Type': 'application/json'})
+    response = conn.getresponse()
+    response.read()
+    return response.status
+
+
+def warm_up(url, asked):
+    # first requests pay for lazy imports and caches, keep them out of the numbers
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=120)
+    for question in asked:
+        post_query(conn, parts.path.rstrip('/') + '/api/query', question)
+    conn.close()
+
+
+def run_level(url, asked, concurrency, duration):
+    latencies, errors, lock = [], [], threading.Lock()
+    started = time.perf_counter()
+    stop_at = started + duration
+    threads = [
+        threading.Thread(target=client, args=(url, asked, i, stop_at, latencies, errors, lock))
+        for i in range(concurrency)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies) + len(errors),
+        'errors': len(errors),
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(len(latencies) / elapsed, 2),
+        **{f'latency_ms_{p}': v for p, v in percentiles(latencies).items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--serve', choices=['flask', 'uvicorn'], help='start a fake-LLM server for the run')
+    parser.add_argument('--concurrency', default='1,2,4,8,16,32')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per concurrency level')
+    parser.add_argument('--warm-up', type=int, default=4, help='requests sent before measuring')
+    parser.add_argument('--output', help='write the report as JSON to this file')
+    args = parser.parse_args()
+
+    server, scratch = None, None
+    if args.serve:
+        scratch = tempfile.TemporaryDirectory()
+        port = free_port()
+        env = dict(
+            os.environ,
+            LLM_BACKEND=os.getenv('LLM_BACKEND', 'fake'),
+            ANSWER_CACHE_SIZE='0',
+            RAG_WARMUP='eager',
+            DATABASE_PATH=os.path.join(scratch.name, 'users.db'),
+        )
+        server = start_server(args.serve, port, env)
+        args.url = f'http://127.0.0.1:{port}'
+
+    asked = questions()
+    try:
+        warm_up(args.url, asked[:args.warm_up])
+
+        results = []
+        for concurrency in [int(c) for c in args.concurrency.split(',')]:
+            row = run_level(args.url, asked, concurrency, args.duration)
+            results.append(row)
+            print(
+                f"c={row['concurrency']:<4} {row['requests_per_second']:>8} req/s  "
+                f"p50 {row['latency_ms_p50']} ms  p95 {row['latency_ms_p95']} ms  "
+                f"p99 {row['latency_ms_p99']} ms  errors {row['errors']}"
+            )
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+            scratch.cleanup()
+
+    if args.output:
+        write_report(
+            args.output, 'http', results,
+            url=args.url, server=args.serve, duration=args.duration,
+            llm_backend=os.getenv('LLM_BACKEND', 'fake') if args.serve else None,
+        )
+
+
+if __name__ == '__main__':
+    main()
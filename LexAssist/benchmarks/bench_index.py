@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""
+Recall versus latency of the approximate FAISS index types against the exact
+flat index of the current legal_faiss_db generation.
+
+Run from the LexAssist directory after data_ingestion.py:
+
+    python benchmarks/bench_index.py --output index_report.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import faiss
+
+# Add RAG directory to path for imports
+RAG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'RAG')
+if RAG_DIR not in sys.path:
+    sys.path.insert(0, RAG_DIR)
+
+from chunk_store import INDEX_FILE, current_generation
+from vector_index import build_index, evaluate, sample_queries, set_search_params
+
+# distance cutoff used by query.py
+SIMILARITY_THRESHOLD = 2.3
+
+# query-time settings swept for each index type
+SWEEPS = {
+    'ivf_flat': [{'nprobe': n} for n in (1, 4, 16, 64)],
+    'hnsw': [{'ef_search': ef} for ef in (16, 32, 64, 128)],
+    'ivf_pq': [{'nprobe': n} for n in (1, 4, 16, 64)],
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--db-dir', default=os.path.join(RAG_DIR, 'legal_faiss_db'))
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--output', help='write the report as JSON to this file')
+    args = parser.parse_args()
+
+    gen_dir = current_generation(args.db_dir)
+    if gen_dir is None:
+        sys.exit(f'No index in {args.db_dir}, run data_ingestion.py first')
+
+    flat = faiss.read_index(os.path.join(gen_dir, INDEX_FILE))
+    queries = sample_queries(flat, args.queries)
+    print(f'{flat.ntotal} vectors, {len(queries)} queries, k={args.k}')
+
+    results = [{'index_type': 'flat', **evaluate(flat, flat, queries, args.k, SIMILARITY_THRESHOLD)}]
+    for index_type, settings in SWEEPS.items():
+        started = time.perf_counter()
+        index = build_index(flat, index_type)
+        build_seconds = time.perf_counter() - started
+
+        for params in settings:
+            set_search_params(index, **params)
+            report = evaluate(flat, index, queries, args.k, SIMILARITY_THRESHOLD)
+            results.append({
+                'index_type': index_type,
+                **params,
+                'build_seconds': round(build_seconds, 3),
+                **report,
+            })
+
+    print(f"{'index':<10} {'param':<14} {'recall':>8} {'p50 ms':>8} {'p95 ms':>8} {'flips':>7}")
+    for row in results:
+        param = ', '.join(f'{key}={row[key]}' for key in ('nprobe', 'ef_search') if key in row)
+        print(
+            f"{row['index_type']:<10} {param:<14} {row[f'recall@{args.k}']:>8.3f} "
+            f"{row['latency_ms_p50']:>8.3f} {row['latency_ms_p95']:>8.3f} "
+            f"{row['threshold_flips']:>7.3f}"
+        )
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'vectors': flat.ntotal, 'results': results}, f, indent=2)
+        print(f'Report written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""
+Ingestion throughput: pages, chunks and embeddings per second of a full
+build of the corpus into a scratch index directory.
+
+The embedding cache is bypassed unless --cache is given, so every chunk is
+embedded. The live legal_faiss_db is not touched. Run from the LexAssist
+directory:
+
+    python benchmarks/bench_ingestion.py --workers 1,4 --output ingestion.json
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from common import RAG_DIR, write_report
+
+from data_ingestion import DATA_DIR, DEFAULT_BATCH_SIZE, ingest, scan_pdfs
+
+
+def count_pages(data_dir):
+    import pymupdf
+
+    pages = 0
+    for rel_path in scan_pdfs(data_dir):
+        with pymupdf.open(os.path.join(data_dir, rel_path)) as pdf:
+            pages += pdf.page_count
+    return pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--workers', default='1', help='comma separated parser process counts')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--cache', action='store_true', help='read and write the embedding cache')
+    parser.add_argument('--output', help='write the report as JSON to this file')
+    args = parser.parse_args()
+
+    pages = count_pages(args.data_dir)
+    results = []
+    for workers in [int(w) for w in args.workers.split(',')]:
+        db_dir = tempfile.mkdtemp(prefix='bench_ingestion_', dir=RAG_DIR)
+        try:
+            started = time.perf_counter()
+            stats = ingest(
+                data_dir=args.data_dir, db_dir=db_dir, full=True, workers=workers,
+                batch_size=args.batch_size, use_cache=args.cache
+            )
+            seconds = time.perf_counter() - started
+        finally:
+            shutil.rmtree(db_dir, ignore_errors=True)
+
+        if stats is None:
+            raise SystemExit(f'No chunks were indexed from {args.data_dir}')
+        results.append({
+            'workers': workers,
+            'batch_size': args.batch_size,
+            'pages': pages,
+            'chunks': stats['chunks'],
+            'embedded': stats['embedded'],
+            'seconds': round(seconds, 3),
+            'embed_seconds': stats['embed_seconds'],
+            'pages_per_second': round(pages / seconds, 2),
+            'chunks_per_second': round(stats['chunks'] / seconds, 2),
+            'embeddings_per_second': round(stats['embedded'] / max(stats['embed_seconds'], 1e-9), 2),
+        })
+
+    print(f"{'workers':>7} {'seconds':>8} {'pages/s':>8} {'chunks/s':>9} {'embeds/s':>9}")
+    for row in results:
+        print(
+            f"{row['workers']:>7} {row['seconds']:>8} {row['pages_per_second']:>8} "
+            f"{row['chunks_per_second']:>9} {row['embeddings_per_second']:>9}"
+        )
+
+    if args.output:
+        write_report(args.output, 'ingestion', results, data_dir=args.data_dir, cache=args.cache)
+
+
+if __name__ == '__main__':
+    main()
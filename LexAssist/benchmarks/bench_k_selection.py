@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""
+Compare the LLM k-selector (the k chain) with the local score-gap and heuristic
+selectors on latency and on the chunks they end up retrieving.
+
+Latency is the cost of the k decision alone. Score-gap selection replaces the
+normal search with a top-MAX_K one, which costs about the same, so that
+search is not counted.
+
+The LLM selector needs GROQ_API_KEY; pass --skip-llm to time only the local
+selectors. Run from the LexAssist directory:
+
+    python benchmarks/bench_k_selection.py --output k_selection.json
+"""
+
+import argparse
+import json
+import statistics
+import time
+
+from common import questions
+
+import query
+from k_selection import select_k_by_score_gap, select_k_heuristic
+
+
+def timed(fn):
+    started = time.perf_counter()
+    value = fn()
+    return value, (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--skip-llm', action='store_true', help='do not call the k chain')
+    parser.add_argument('--output', help='write the report as JSON to this file')
+    args = parser.parse_args()
+
+    asked = questions()
+    selectors = ['heuristic', 'score_gap'] + ([] if args.skip_llm else ['llm'])
+    rows = {name: [] for name in selectors}
+
+    vectorstore = query.serving_index()[0]
+    for question in asked:
+        # one shared top-MAX_K search, each selector decides where to cut it
+        hits = vectorstore.similarity_search_with_score(question, k=query.MAX_K)
+        ranked = [doc.metadata['row'] for doc, _ in hits]
+        distances = [score for _, score in hits]
+
+        decisions = {}
+        decisions['heuristic'] = timed(lambda: select_k_heuristic(question, query.MAX_K))
+        decisions['score_gap'] = timed(
+            lambda: select_k_by_score_gap(distances, default_k=query.DEFAULT_K)
+        )
+        if not args.skip_llm:
+            decisions['llm'] = timed(
+                lambda: query.parse_k(query.chain('k').invoke({'question': question}))
+            )
+
+        reference = set(ranked[:decisions['llm'][0]]) if 'llm' in decisions else None
+        for name, (k, ms) in decisions.items():
+            row = {'question': question, 'k': k, 'latency_ms': round(ms, 3)}
+            if reference:
+                row['recall_vs_llm'] = round(len(set(ranked[:k]) & reference) / len(reference), 4)
+            rows[name].append(row)
+
+    summary = {}
+    for name, results in rows.items():
+        summary[name] = {
+            'mean_k': round(statistics.mean(r['k'] for r in results), 2),
+            'latency_ms_mean': round(statistics.mean(r['latency_ms'] for r in results), 3),
+            'latency_ms_p50': round(statistics.median(r['latency_ms'] for r in results), 3),
+        }
+        if results and 'recall_vs_llm' in results[0]:
+            summary[name]['recall_vs_llm'] = round(
+                statistics.mean(r['recall_vs_llm'] for r in results), 4
+            )
+
+    print(f"{'selector':<10} {'mean k':>7} {'mean ms':>9} {'p50 ms':>9} {'recall vs llm':>14}")
+    for name, s in summary.items():
+        recall = s.get('recall_vs_llm')
+        recall = f'{recall:.3f}' if recall is not None else '-'
+        print(f"{name:<10} {s['mean_k']:>7} {s['latency_ms_mean']:>9} {s['latency_ms_p50']:>9} {recall:>14}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'summary': summary, 'questions': rows}, f, indent=2)
+        print(f'Report written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
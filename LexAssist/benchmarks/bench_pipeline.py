@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"""
+run_query latency broken down by stage, with the fake LLM backend.
+
+Each question goes through the same steps as run_query_uncached, timed one
+by one: citation lookup, planning (LLM), query embedding, FAISS search, hit
+selection (BM25 fusion, reranking), context assembly and the answer call
+(LLM). "own" is everything except the two LLM stages, the overhead this
+codebase adds. A plain run_query pass is timed as well, so the
+breakdown can be checked against the real call.
+
+The fake LLM's latency is set with FAKE_LLM_* (see llm_backends.py); pass
+--llm groq to measure the real service instead. Run from the LexAssist
+directory:
+
+    python benchmarks/bench_pipeline.py --repeats 3 --output pipeline.json
+"""
+
+import argparse
+import os
+import time
+
+from common import percentiles, questions, write_report
+
+STAGES = ['citation', 'plan', 'embed', 'search', 'select', 'context', 'answer']
+LLM_STAGES = {'plan', 'answer'}
+
+
+def timed_query(query, question):
+    """Run one question stage by stage and return {stage: ms}."""
+    times = {}
+
+    def clock(stage, fn, *args):
+        started = time.perf_counter()
+        value = fn(*args)
+        times[stage] = (time.perf_counter() - started) * 1000
+        return value
+
+    index = query.serving_index()
+    vectorstore, lexical, _ = index
+    results = clock('citation', query.lookup_citation, question, index)
+    if results is None:
+        retrieval_query, k = clock('plan', query.plan_query, question)
+        vector = clock('embed', query.resources.get('embeddings').embed_query, retrieval_query)
+        found = clock(
+            'search', vectorstore.similarity_search_with_score_by_vector,
+            vector, query.search_depth(k, lexical)
+        )
+        results = clock('select', query.select_hits, found, k, retrieval_query, vector, index)
+
+    context = clock('context', query.build_context, results)
+    if context is not None:
+        clock('answer', query.invoke, 'answer', {'context': context, 'question': question})
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--llm', default='fake', help='LLM_BACKEND to use (default fake)')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--output', help='write the report as JSON to this file')
+    args = parser.parse_args()
+
+    # before query.py reads them; the answer cache would hide the pipeline
+    os.environ['LLM_BACKEND'] = args.llm
+    os.environ['ANSWER_CACHE_SIZE'] = '0'
+    import query
+
+    started = time.perf_counter()
+    query.warm_up(background=False)
+    load_seconds = time.perf_counter() - started
+
+    asked = questions()
+    stage_ms = {stage: [] for stage in STAGES}
+    own_ms, total_ms, run_query_ms = [], [], []
+    for _ in range(args.repeats):
+        for question in asked:
+            times = timed_query(query, question)
+            for stage, ms in times.items():
+                stage_ms[stage].append(ms)
+            total_ms.append(sum(times.values()))
+            own_ms.append(sum(ms for stage, ms in times.items() if stage not in LLM_STAGES))
+
+            started = time.perf_counter()
+            query.run_query(question)
+            run_query_ms.append((time.perf_counter() - started) * 1000)
+
+    results = {
+        stage: {'calls': len(values), **percentiles(values)}
+        for stage, values in stage_ms.items() if values
+    }
+    results['own'] = {'calls': len(own_ms), **percentiles(own_ms)}
+    results['total'] = {'calls': len(total_ms), **percentiles(total_ms)}
+    results['run_query'] = {'calls': len(run_query_ms), **percentiles(run_query_ms)}
+
+    print(f'{len(asked)} questions x {args.repeats}, llm={args.llm}, warm-up {load_seconds:.1f}s')
+    print(f"{'stage':<10} {'calls':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for stage, row in results.items():
+        print(f"{stage:<10} {row['calls']:>6} {row['p50']:>9} {row['p95']:>9} {row['p99']:>9}")
+
+    if args.output:
+        write_report(
+            args.output, 'pipeline', results,
+            llm_backend=args.llm, questions=len(asked), repeats=args.repeats,
+            warm_up_seconds=round(load_seconds, 3),
+            settings={
+                'plan_mode': query.PLAN_MODE,
+                'k_selector': query.K_SELECTOR,
+                'hybrid_search': query.HYBRID_SEARCH,
+                'rerank': query.RERANK,
+                'index_type': query.INDEX_TYPE,
+            },
+        )
+
+
+if __name__ == '__main__':
+    main()
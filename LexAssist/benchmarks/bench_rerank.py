@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+"""
+Prompt tokens saved by cross-encoder reranking, against what the prompt
+context still covers and, optionally, the answers it produces.
+
+Every question is retrieved the way run_query does without reranking, with
+the question as its own retrieval query and k fixed at --k. The hits are then
+reranked and trimmed to each token budget. Quality is measured two ways:
+
+- coverage: share of the reference answer's terms (sample_rag_response of
+  TEST_QUERIES) that still appear in the context, and of the full context's
+  terms, for every question;
+- with --answers, the answer chain runs on the full and on each trimmed
+  context, and the answers are compared by token F1 with the reference and
+  with the full-context answer. This needs GROQ_API_KEY.
+
+Run from the LexAssist directory:
+
+    python benchmarks/bench_rerank.py --budgets 400,800,1200 --output rerank.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+LEXASSIST_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RAG_DIR = os.path.join(LEXASSIST_DIR, 'RAG')
+for path in (LEXASSIST_DIR, RAG_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import query
+from lexical_index import tokenize
+from reranker import RERANK_MODEL, Reranker, load_cross_encoder
+from test_queries import TEST_QUERIES
+from tokens import count_tokens
+
+# legal questions answerable from the bundled Acts, on top of TEST_QUERIES
+LEGAL_QUESTIONS = [
+    'What is a valid contract?',
+    'When is an agreement void?',
+    'What is the penalty for hacking under the IT Act?',
+    'What are the exceptions to the rule that an agreement without consideration is void?',
+    'Compare void and voidable contracts and list when each arises',
+    'What are the duties of a certifying authority?',
+]
+
+
+def context_of(results):
+    return '\n\n'.join(doc.page_content for doc, _ in results)
+
+
+def coverage(reference, context):
+    terms = set(tokenize(reference))
+    if not terms:
+        return None
+    return len(terms & set(tokenize(context))) / len(terms)
+
+
+def token_f1(answer, reference):
+    answer, reference = tokenize(answer), tokenize(reference)
+    common = sum(min(answer.count(t), reference.count(t)) for t in set(answer))
+    if not common:
+        return 0.0
+    precision, recall = common / len(answer), common / len(reference)
+    return 2 * precision * recall / (precision + recall)
+
+
+def mean(values):
+    values = [v for v in values if v is not None]
+    return round(statistics.mean(values), 4) if values else None
+
+
+def answer(question, context):
+    return query.chain('answer').invoke({'context': context, 'question': question})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--budgets', default='400,800,1200', help='comma separated token budgets')
+    parser.add_argument('--k', type=int, default=query.MAX_K, help='chunks retrieved before reranking')
+    parser.add_argument('--latency-ms', type=float, default=query.RERANK_LATENCY_MS)
+    parser.add_argument('--model', default=RERANK_MODEL)
+    parser.add_argument('--answers', action='store_true', help='also compare LLM answers (needs GROQ_API_KEY)')
+    parser.add_argument('--output', help='write the report as JSON to this file')
+    args = parser.parse_args()
+
+    budgets = [int(b) for b in args.budgets.split(',')]
+    references = {q['question']: q.get('sample_rag_response') for q in TEST_QUERIES}
+    questions = list(references) + LEGAL_QUESTIONS
+
+    started = time.perf_counter()
+    reranker = Reranker(load_cross_encoder(args.model))
+    reranker.warm_up()
+    load_seconds = time.perf_counter() - started
+
+    rows = []
+    for question in questions:
+        full = query.retrieve(question, args.k, query.serving_index())
+        full_context = context_of(full)
+        row = {
+            'question': question,
+            'chunks': len(full),
+            'tokens': count_tokens(full_context),
+            'passes_threshold': bool(full) and min(s for _, s in full) <= query.SIMILARITY_THRESHOLD,
+            'budgets': {},
+        }
+        reference = references.get(question)
+        if reference:
+            row['reference_coverage'] = coverage(reference, full_context)
+        if args.answers:
+            row['answer'] = answer(question, full_context)
+
+        for budget in budgets:
+            skipped, partial = reranker.skipped, reranker.partial
+            started = time.perf_counter()
+            kept = reranker.rerank(question, full, budget, args.latency_ms)
+            ms = (time.perf_counter() - started) * 1000
+            context = context_of(kept)
+
+            result = {
+                'chunks': len(kept),
+                'tokens': count_tokens(context),
+                'rerank_ms': round(ms, 2),
+                'skipped': reranker.skipped > skipped,
+                'partial': reranker.partial > partial,
+                'full_context_coverage': coverage(full_context, context),
+            }
+            if reference:
+                result['reference_coverage'] = coverage(reference, context)
+            if args.answers:
+                result['answer'] = answer(question, context)
+                result['f1_vs_full_answer'] = round(token_f1(result['answer'], row['answer']), 4)
+                if reference:
+                    result['f1_vs_reference'] = round(token_f1(result['answer'], reference), 4)
+            row['budgets'][str(budget)] = result
+
+        if args.answers and reference:
+            row['f1_vs_reference'] = round(token_f1(row['answer'], reference), 4)
+        rows.append(row)
+
+    full_tokens = mean(r['tokens'] for r in rows)
+    summary = {'full': {
+        'tokens': full_tokens,
+        'reference_coverage': mean(r.get('reference_coverage') for r in rows),
+        'f1_vs_reference': mean(r.get('f1_vs_reference') for r in rows),
+    }}
+    for budget in budgets:
+        results = [r['budgets'][str(budget)] for r in rows]
+        latencies = sorted(r['rerank_ms'] for r in results)
+        summary[str(budget)] = {
+            'tokens': mean(r['tokens'] for r in results),
+            'token_reduction': round(1 - mean(r['tokens'] for r in results) / full_tokens, 4) if full_tokens else None,
+            'reference_coverage': mean(r.get('reference_coverage') for r in results),
+            'full_context_coverage': mean(r['full_context_coverage'] for r in results),
+            'f1_vs_reference': mean(r.get('f1_vs_reference') for r in results),
+            'f1_vs_full_answer': mean(r.get('f1_vs_full_answer') for r in results),
+            'rerank_ms_p50': round(statistics.median(latencies), 2),
+            'rerank_ms_p95': round(latencies[int(0.95 * (len(latencies) - 1))], 2),
+            'skipped': sum(r['skipped'] for r in results),
+        }
+
+    print(f'{len(questions)} questions, k={args.k}, {args.model} loaded in {load_seconds:.1f}s')
+    print(f"{'budget':<8} {'tokens':>8} {'saved':>7} {'ref cov':>8} {'ctx cov':>8} {'F1 ref':>7} {'p50 ms':>8} {'p95 ms':>8} {'skipped':>8}")
+    for name, s in summary.items():
+        def show(key):
+            value = s.get(key)
+            return '-' if value is None else value
+        print(
+            f"{name:<8} {show('tokens'):>8} {show('token_reduction'):>7} {show('reference_coverage'):>8} "
+            f"{show('full_context_coverage'):>8} {show('f1_vs_reference'):>7} {show('rerank_ms_p50'):>8} "
+            f"{show('rerank_ms_p95'):>8} {show('skipped'):>8}"
+        )
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'model': args.model, 'k': args.k, 'summary': summary, 'questions': rows}, f, indent=2)
+        print(f'Report written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
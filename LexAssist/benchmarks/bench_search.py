@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+"""
+FAISS search latency and recall across index sizes, k values, index types and
+their query-time settings.
+
+Every IVF index is swept over --nprobe and every HNSW index over --ef-search,
+and each point reports recall@k against the exact flat top-k, so a latency
+win can be read next to what it costs in results.
+
+The corpus vectors of the current legal_faiss_db generation are tiled with a
+little noise up to each --sizes entry, so larger indexes keep the real
+distribution. Single-query latency is what run_query pays; batch throughput
+is what run_queries gets from one query matrix. Run from the LexAssist
+directory:
+
+    python benchmarks/bench_search.py --sizes 1000,10000,100000 --output search.json
+"""
+
+import argparse
+import os
+import time
+
+import faiss
+import numpy as np
+
+from common import RAG_DIR, percentiles, write_report
+
+from chunk_store import INDEX_FILE, current_generation
+from vector_index import build_index, sample_queries, search, set_search_params
+
+
+def tiled(base, size, seed=0):
+    """size vectors: base repeated, each copy after the first jittered."""
+    copies = -(-size // len(base))
+    rng = np.random.default_rng(seed)
+    parts = [base] + [
+        base + rng.normal(0, 0.02, base.shape).astype(np.float32) for _ in range(copies - 1)
+    ]
+    return np.ascontiguousarray(np.vstack(parts)[:size], dtype=np.float32)
+
+
+def sweep(index_type, nprobes, ef_searches):
+    """Query-time settings to try for index_type; flat has none."""
+    if index_type == 'hnsw':
+        return [{'ef_search': ef} for ef in ef_searches]
+    if index_type in ('ivf_flat', 'ivf_pq'):
+        return [{'nprobe': n} for n in nprobes]
+    return [{}]
+
+
+def recall(exact_rows, found_rows):
+    """Mean share of the exact top-k rows that the index also returned."""
+    return float(np.mean([
+        len(set(exact[exact != -1]) & set(found[found != -1])) / max(1, (exact != -1).sum())
+        for exact, found in zip(exact_rows, found_rows)
+    ]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--db-dir', default=os.path.join(RAG_DIR, 'legal_faiss_db'))
+    parser.add_argument('--sizes', default='1000,10000,100000', help='comma separated vector counts')
+    parser.add_argument('--k', default='1,5,10,20', help='comma separated k values')
+    parser.add_argument('--index-types', default='flat,ivf_flat,hnsw')
+    parser.add_argument('--nprobe', default='1,4,16,64', help='comma separated IVF nprobe values')
+    parser.add_argument('--ef-search', default='16,32,64,128', help='comma separated HNSW efSearch values')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--output', help='write the report as JSON to this file')
+    args = parser.parse_args()
+
+    gen_dir = current_generation(args.db_dir)
+    if gen_dir is None:
+        raise SystemExit(f'No index in {args.db_dir}, run data_ingestion.py first')
+    corpus = faiss.read_index(os.path.join(gen_dir, INDEX_FILE))
+    base = corpus.reconstruct_n(0, corpus.ntotal)
+    queries = sample_queries(corpus, args.queries)
+    ks = [int(k) for k in args.k.split(',')]
+    nprobes = [int(n) for n in args.nprobe.split(',')]
+    ef_searches = [int(ef) for ef in args.ef_search.split(',')]
+
+    results = []
+    for size in [int(s) for s in args.sizes.split(',')]:
+        flat = faiss.IndexFlatL2(base.shape[1])
+        flat.add(tiled(base, size))
+        exact = {k: flat.search(queries, k)[1] for k in ks}
+
+        for index_type in args.index_types.split(','):
+            started = time.perf_counter()
+            index = flat if index_type == 'flat' else build_index(flat, index_type)
+            build_seconds = time.perf_counter() - started
+
+            for params in sweep(index_type, nprobes, ef_searches):
+                set_search_params(index, **params)
+                for k in ks:
+                    latencies = []
+                    for query in queries:
+                        started = time.perf_counter()
+                        search(index, query[None, :], k, exact_index=flat)
+                        latencies.append((time.perf_counter() - started) * 1000)
+
+                    started = time.perf_counter()
+                    _, rows = search(index, queries, k, exact_index=flat)
+                    batch_seconds = time.perf_counter() - started
+
+                    results.append({
+                        'size': size,
+                        'index_type': index_type,
+                        **params,
+                        'k': k,
+                        'build_seconds': round(build_seconds, 3),
+                        'recall': round(recall(exact[k], rows), 4),
+                        **{f'latency_ms_{p}': v for p, v in percentiles(latencies).items()},
+                        'batch_queries_per_second': round(len(queries) / max(batch_seconds, 1e-9), 1),
+                    })
+
+    print(
+        f"{'size':>8} {'index':<9} {'param':<14} {'k':>3} {'recall':>7} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'batch q/s':>10}"
+    )
+    for row in results:
+        param = ', '.join(f'{key}={row[key]}' for key in ('nprobe', 'ef_search') if key in row)
+        print(
+            f"{row['size']:>8} {row['index_type']:<9} {param:<14} {row['k']:>3} {row['recall']:>7.3f} "
+            f"{row['latency_ms_p50']:>8} {row['latency_ms_p95']:>8} {row['latency_ms_p99']:>8} "
+            f"{row['batch_queries_per_second']:>10}"
+        )
+
+    if args.output:
+        write_report(args.output, 'search', results, dimension=int(base.shape[1]), queries=len(queries))
+
+
+if __name__ == '__main__':
+    main()
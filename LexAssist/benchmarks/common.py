@@ -0,0 +1,71 @@
+"""
+Helpers shared by the benchmark suite: import paths, question sets,
+percentiles and the JSON report layout.
+"""
+
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+
+LEXASSIST_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RAG_DIR = os.path.join(LEXASSIST_DIR, 'RAG')
+for path in (LEXASSIST_DIR, RAG_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from test_queries import TEST_QUERIES
+
+# legal questions answerable from the bundled Acts, on top of TEST_QUERIES
+LEGAL_QUESTIONS = [
+    'What is a valid contract?',
+    'When is an agreement void?',
+    'What is the penalty for hacking under the IT Act?',
+    'What are the exceptions to the rule that an agreement without consideration is void?',
+    'Compare void and voidable contracts and list when each arises',
+    'What does section 43 of the IT Act say?',
+]
+
+
+def questions():
+    return [q['question'] for q in TEST_QUERIES] + LEGAL_QUESTIONS
+
+
+def percentiles(values, points=(50, 95, 99)):
+    """Nearest-rank percentiles of values in milliseconds, rounded for reports."""
+    values = sorted(values)
+    if not values:
+        return {f'p{p}': None for p in points}
+    return {
+        f'p{p}': round(values[min(len(values) - 1, max(0, -(-p * len(values) // 100) - 1))], 3)
+        for p in points
+    }
+
+
+def environment():
+    """What a report was measured on, so runs can be compared fairly."""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=LEXASSIST_DIR, capture_output=True, text=True
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def write_report(path, name, results, **extra):
+    """Write {benchmark, environment, ..., results} as JSON to path."""
+    report = {'benchmark': name, 'environment': environment(), **extra, 'results': results}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f'Report written to {path}')
+    return report
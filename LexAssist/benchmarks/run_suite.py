@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""
+Run the end-to-end benchmark suite and write one JSON report.
+
+Runs bench_ingestion, bench_search, bench_pipeline (fake LLM) and bench_http
+(a fake-LLM server it starts itself), each in its own process, and collects
+their reports under one file. With --compare, numbers that moved by more than
+--threshold against an earlier report are printed. Run from the LexAssist
+directory:
+
+    python benchmarks/run_suite.py --output suite.json
+    python benchmarks/run_suite.py --quick --output new.json --compare suite.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from common import environment
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SUITE = {
+    'ingestion': ['bench_ingestion.py'],
+    'search': ['bench_search.py'],
+    'pipeline': ['bench_pipeline.py'],
+    'http': ['bench_http.py', '--serve', 'flask'],
+}
+
+# smaller sweeps for a quick check before a commit
+QUICK = {
+    'search': ['--sizes', '1000,10000', '--k', '5,20', '--queries', '50', '--nprobe', '4,16', '--ef-search', '32,64'],
+    'pipeline': ['--repeats', '1'],
+    'http': ['--concurrency', '1,8', '--duration', '3'],
+}
+
+
+# fields that say which sweep point a result row is, rather than measure it
+ROW_KEYS = ('workers', 'size', 'index_type', 'nprobe', 'ef_search', 'k', 'concurrency')
+
+
+def row_label(i, row):
+    if not isinstance(row, dict):
+        return str(i)
+    label = ','.join(f'{key}={row[key]}' for key in ROW_KEYS if key in row)
+    return f'[{label}]' if label else str(i)
+
+
+def flatten(value, prefix=''):
+    """{"a": [{"k": 1, "ms": 2}]} -> {"a.[k=1].ms": 2}, measured numbers only."""
+    if isinstance(value, bool):
+        return {}
+    if isinstance(value, (int, float)):
+        return {prefix: value}
+    if isinstance(value, dict):
+        items = [(key, item) for key, item in value.items() if key not in ROW_KEYS]
+    elif isinstance(value, list):
+        items = [(row_label(i, row), row) for i, row in enumerate(value)]
+    else:
+        items = []
+    flat = {}
+    for key, item in items:
+        flat.update(flatten(item, f'{prefix}.{key}' if prefix else str(key)))
+    return flat
+
+
+def compare(old, new, threshold):
+    old_values = flatten({name: report.get('results') for name, report in old['benchmarks'].items()})
+    new_values = flatten({name: report.get('results') for name, report in new['benchmarks'].items()})
+    changed = []
+    for key in sorted(old_values.keys() & new_values.keys()):
+        before, after = old_values[key], new_values[key]
+        if before and abs(after - before) / abs(before) > threshold:
+            changed.append((key, before, after, (after - before) / abs(before)))
+
+    print(f"\n{len(changed)} of {len(old_values.keys() & new_values.keys())} numbers moved by more than {threshold:.0%}")
+    for key, before, after, change in changed:
+        print(f'{key:<72} {before:>12} -> {after:<12} {change:+.1%}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--only', help='comma separated subset of: ' + ', '.join(SUITE))
+    parser.add_argument('--quick', action='store_true', help='smaller sweeps')
+    parser.add_argument('--output', required=True, help='write the combined report to this file')
+    parser.add_argument('--compare', help='earlier suite report to diff against')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative change worth reporting')
+    args = parser.parse_args()
+
+    names = args.only.split(',') if args.only else list(SUITE)
+    reports = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in names:
+            path = os.path.join(tmp, f'{name}.json')
+            command = [sys.executable, os.path.join(BENCH_DIR, SUITE[name][0]), *SUITE[name][1:]]
+            if args.quick:
+                command += QUICK.get(name, [])
+            print(f'== {name}', flush=True)
+            done = subprocess.run(command + ['--output', path])
+            if done.returncode:
+                reports[name] = {'error': f'exit code {done.returncode}'}
+                continue
+            with open(path, encoding='utf-8') as f:
+                reports[name] = json.load(f)
+
+    suite = {'suite': 'lexassist', 'quick': args.quick, 'environment': environment(), 'benchmarks': reports}
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(suite, f, indent=2)
+    print(f'Suite report written to {args.output}')
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(json.load(f), suite, args.threshold)
+
+    if any('error' in report for report in reports.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -7,6 +7,15 @@ class Config:
     JSON_SORT_KEYS = False
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
 
+    # password KDF, as a werkzeug method string: scrypt:N:r:p or pbkdf2:sha256:iterations;
+    # existing hashes keep verifying with the parameters they were made with
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    # threads that run the KDF, and hashes allowed to wait for one before
+    # signup / signin answer 429; a queued hash older than the timeout gets 503
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', '2'))
+    PASSWORD_HASH_QUEUE = int(os.getenv('PASSWORD_HASH_QUEUE', '16'))
+    PASSWORD_HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', '5'))
+
 
 class DevelopmentConfig(Config):
     """Development configuration"""
@@ -0,0 +1,21 @@
+"""
+Gunicorn settings for the StartupLex backend.
+
+    gunicorn -c gunicorn.conf.py app:app
+
+preload_app imports app.py once in the master, and RAG_WARMUP=eager makes
+that import load the embedding model, FAISS index and LLM client. Workers are
+forked afterwards and share those pages copy-on-write instead of each loading
+its own copy.
+"""
+
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('GUNICORN_WORKERS', '4'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+
+preload_app = True
+
+# load in the master itself, a background warm-up thread would not survive fork
+os.environ.setdefault('RAG_WARMUP', 'eager')
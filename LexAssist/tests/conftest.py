@@ -0,0 +1,34 @@
+import importlib
+import os
+import sys
+import tempfile
+
+import pytest
+
+# the RAG modules import each other by name, as when run from RAG/
+LEXASSIST_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RAG_DIR = os.path.join(LEXASSIST_DIR, 'RAG')
+if RAG_DIR not in sys.path:
+    sys.path.insert(0, RAG_DIR)
+
+
+def import_server(name):
+    # LexAssist/app.py and asgi.py, not the older RAG/app.py
+    sys.path.insert(0, LEXASSIST_DIR)
+    try:
+        return importlib.import_module(name)
+    finally:
+        sys.path.remove(LEXASSIST_DIR)
+
+
+@pytest.fixture(scope='session')
+def backend():
+    # a throwaway user database, and no RAG warm-up
+    os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(), 'users.db')
+    os.environ['RAG_WARMUP'] = 'lazy'
+    return import_server('app')
+
+
+@pytest.fixture(scope='session')
+def asgi_app(backend):
+    return import_server('asgi')
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+import answer_cache
+from answer_cache import AnswerCache, key_terms, normalize_question
+
+# every question embeds to the same vector: only key terms tell them apart
+SAME_VECTOR = [1.0, 0.0, 0.0]
+
+
+def make_cache(max_distance=0.05, fingerprint=lambda: 'gen-1', **kwargs):
+    return AnswerCache(embed=lambda question: SAME_VECTOR, fingerprint=fingerprint,
+                       max_distance=max_distance, **kwargs)
+
+
+def test_normalize_question():
+    assert normalize_question('  What is  a Contract?? ') == 'what is a contract'
+
+
+@pytest.mark.parametrize('question, terms', [
+    ('What does section 43 of the IT Act say?', {'43', 'it'}),
+    ('Explain section 66A', {'66a'}),
+    ('What is a valid contract?', set()),
+    ('Penalty under the contract act', {'contract'}),
+])
+def test_key_terms(question, terms):
+    assert key_terms(question) == terms
+
+
+def test_exact_hit():
+    cache = make_cache(max_distance=0)
+    cache.put('What is a contract?', 'An agreement.')
+    assert cache.get('what is a contract')[0] == 'An agreement.'
+    assert cache.stats()['exact_hits'] == 1
+
+
+def test_semantic_hit_needs_same_terms():
+    cache = make_cache()
+    answer, vector = cache.get('What does section 43 of the IT Act say?')
+    assert answer is None
+    cache.put('What does section 43 of the IT Act say?', 'Section 43 answer', vector)
+
+    assert cache.get('Explain section 43 of the IT Act')[0] == 'Section 43 answer'
+    assert cache.get('What does section 44 of the IT Act say?')[0] is None
+    assert cache.get('What does section 43 of the contract Act say?')[0] is None
+    assert cache.get('What does section 66B of the IT Act say?')[0] is None
+    assert cache.stats()['semantic_hits'] == 1
+
+
+def test_zero_distance_skips_embedding():
+    def embed(question):
+        raise AssertionError('embedded with the semantic layer off')
+
+    cache = AnswerCache(embed=embed, fingerprint=lambda: 'gen-1', max_distance=0)
+    assert cache.get('What is a contract?') == (None, None)
+
+
+def test_new_fingerprint_clears(monkeypatch):
+    monkeypatch.setattr(answer_cache, 'FINGERPRINT_INTERVAL', 0)
+    generation = ['gen-1']
+    cache = make_cache(max_distance=0, fingerprint=lambda: generation[0])
+    cache.put('What is a contract?', 'An agreement.')
+
+    generation[0] = 'gen-2'
+    assert cache.get('What is a contract?')[0] is None
+    assert cache.stats()['invalidations'] == 1
+
+
+def test_ttl_and_lru(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(answer_cache.time, 'monotonic', lambda: now[0])
+    cache = make_cache(max_distance=0, max_entries=2, ttl=10)
+    for question in ('a', 'b', 'c'):
+        cache.put(question, question.upper())
+    assert cache.get('a')[0] is None
+    assert cache.get('c')[0] == 'C'
+
+    now[0] += 11
+    assert cache.get('c')[0] is None
+
+
+def test_put_keeps_vector_normalized():
+    cache = make_cache()
+    _, vector = cache.get('What is a contract?')
+    assert np.linalg.norm(vector) == pytest.approx(1.0)
@@ -0,0 +1,92 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+
+@pytest.fixture
+def client(backend):
+    backend.auth_cache.clear()
+    return backend.app.test_client()
+
+
+def sign_up(client, email):
+    response = client.post('/api/auth/signup', json={'name': 'A', 'email': email, 'password': 'secret'})
+    assert response.status_code == 201
+    return response.get_json()['api_key']
+
+
+def me(client, api_key):
+    return client.get('/api/auth/me', headers={'Authorization': f'Bearer {api_key}'}).status_code
+
+
+def test_cached_lookup_and_revoke(client, backend):
+    api_key = sign_up(client, 'revoke@example.com')
+    assert me(client, api_key) == 200
+    assert me(client, api_key) == 200
+
+    response = client.post('/api/auth/revoke', headers={'Authorization': f'Bearer {api_key}'})
+    assert response.get_json()['revoked'] == 1
+    assert me(client, api_key) == 401
+
+
+def test_revoke_during_lookup_is_not_cached(client, backend, monkeypatch):
+    api_key = sign_up(client, 'race@example.com')
+    key_hash = backend.hash_api_key(api_key)
+    lookup = backend.get_user_by_key_hash
+
+    def lookup_then_revoke(digest):
+        user = lookup(digest)
+        # the key is revoked after the lookup read it, before get() caches it
+        backend.revoke_api_keys(user['id'], digest)
+        return user
+
+    monkeypatch.setattr(backend, 'get_user_by_key_hash', lookup_then_revoke)
+    assert backend.auth_cache.get(key_hash) is not None
+    monkeypatch.setattr(backend, 'get_user_by_key_hash', lookup)
+    assert backend.auth_cache.get(key_hash) is None
+
+
+def test_sign_in_retires_old_keys(client, backend, monkeypatch):
+    monkeypatch.setattr(backend, 'API_KEYS_PER_USER', 3)
+    first = sign_up(client, 'many@example.com')
+    assert me(client, first) == 200
+
+    keys = [
+        client.post('/api/auth/signin', json={'email': 'many@example.com', 'password': 'secret'}).get_json()['api_key']
+        for _ in range(5)
+    ]
+    count = backend.get_db_connection().execute(
+        "SELECT COUNT(*) FROM api_keys JOIN users ON users.id = api_keys.user_id WHERE users.email = 'many@example.com'"
+    ).fetchone()[0]
+    assert count == 3
+    assert me(client, first) == 401
+    assert [me(client, key) for key in keys] == [401, 401, 200, 200, 200]
+
+
+def test_expired_key_is_rejected(client, backend):
+    api_key = sign_up(client, 'expired@example.com')
+    conn = backend.get_db_connection()
+    with conn:
+        conn.execute(
+            "UPDATE api_keys SET expires_at = '2000-01-01T00:00:00' WHERE key_hash = ?",
+            (backend.hash_api_key(api_key),)
+        )
+    assert me(client, api_key) == 401
+
+
+def test_cached_key_is_rejected_once_it_expires(client, backend):
+    api_key = sign_up(client, 'expiring@example.com')
+    key_hash = backend.hash_api_key(api_key)
+    conn = backend.get_db_connection()
+    with conn:
+        conn.execute(
+            'UPDATE api_keys SET expires_at = ? WHERE key_hash = ?',
+            ((datetime.now() + timedelta(seconds=0.3)).isoformat(), key_hash)
+        )
+    # cached while valid, well inside AUTH_CACHE_TTL
+    assert me(client, api_key) == 200
+    assert key_hash in backend.auth_cache._entries
+
+    time.sleep(0.4)
+    assert me(client, api_key) == 401
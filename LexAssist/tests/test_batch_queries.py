@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableLambda
+
+import metrics
+import query
+from answer_cache import AnswerCache
+from resources import ResourceManager
+
+
+class Embeddings:
+    def embed_documents(self, texts):
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class VectorStore:
+    """One close hit per question, its row the question length"""
+
+    def similarity_search_with_score_by_vectors(self, vectors, k=4):
+        return [
+            [(Document(page_content=f'chunk {int(v[0])}', metadata={'row': int(v[0]), 'source': 'a.pdf', 'page': 0}), 0.1)]
+            for v in vectors
+        ]
+
+
+def plan(question):
+    if 'unplannable' in question:
+        raise ValueError('planning failed')
+    return question, 2
+
+
+@pytest.fixture
+def batch(monkeypatch):
+    """Answered questions, in the order the answer chain saw them"""
+    answered = []
+
+    def answer(inputs):
+        if 'fail' in inputs['question']:
+            raise RuntimeError('LLM unavailable')
+        answered.append(inputs['question'])
+        return f"answer to {inputs['question']}"
+
+    resources = ResourceManager()
+    resources.register('embeddings', Embeddings)
+    resources.register('index', lambda: (VectorStore(), None, None))
+    resources.register('reranker', lambda: None)
+    resources.register('chains', lambda: {'answer': RunnableLambda(answer)})
+    monkeypatch.setattr(query, 'resources', resources)
+    monkeypatch.setattr(query, 'index_generation', lambda: 'gen-1')
+    monkeypatch.setattr(query, 'query_planner', RunnableLambda(plan))
+    monkeypatch.setattr(query, 'answer_cache', AnswerCache(
+        embed=Embeddings().embed_query, fingerprint=lambda: 'gen-1', max_distance=0
+    ))
+    return answered
+
+
+QUESTIONS = ['what is bail', '', 'please fail', 'what is a contract', 'unplannable question', 7]
+
+
+def check(results):
+    assert [r['question'] for r in results] == QUESTIONS
+    assert results[0] == {'question': 'what is bail', 'answer': 'answer to what is bail'}
+    assert results[3]['answer'] == 'answer to what is a contract'
+    assert results[1]['error'] == results[5]['error'] == 'question must be a non-empty string'
+    assert results[2]['error'] == 'LLM unavailable'
+    assert results[4]['error'] == 'planning failed'
+
+
+def test_results_keep_input_order_with_per_question_errors(batch):
+    check(query.run_queries(QUESTIONS))
+
+
+def test_async_batch_matches(batch):
+    check(asyncio.run(query.arun_queries(QUESTIONS)))
+
+
+def test_cached_questions_are_not_answered_again(batch):
+    query.run_queries(['what is bail', 'what is a contract'])
+    results = query.run_queries(['What is bail?', 'what is theft'])
+
+    assert batch == ['what is bail', 'what is a contract', 'what is theft']
+    assert [r['answer'] for r in results] == ['answer to what is bail', 'answer to what is theft']
+
+
+def test_every_answered_question_is_timed(batch):
+    query.run_queries(['what is bail'])
+
+    def counts():
+        _, _, timed = metrics.query_seconds._series.get(('batch',), [None, 0.0, 0])
+        return timed, sum(metrics.query_outcomes._values.values())
+
+    before = counts()
+    # one cached, one answered, one error and one invalid
+    query.run_queries(['what is bail', 'what is theft', 'please fail', ''])
+    timed, outcomes = counts()
+    assert timed - before[0] == outcomes - before[1] == 3
@@ -0,0 +1,108 @@
+import json
+
+import pytest
+
+from chunk_store import ChunkStoreWriter
+from citation_index import (
+    CITATIONS_FILE,
+    CitationIndex,
+    act_aliases,
+    build_citation_index,
+    roman_to_int,
+)
+
+IT_ACT = 'data/IT ACT(2000).pdf'
+CONTRACT_ACT = 'data/contract-act (1972).pdf'
+
+
+@pytest.fixture
+def index(tmp_path):
+    """Two Acts: 2, 3, 43 and 66A in the IT Act; 2, 3, 10 and 150 in the Contract Act"""
+    acts = [
+        {'source': IT_ACT, 'title': 'INFORMATION TECHNOLOGY',
+         'aliases': act_aliases(IT_ACT, 'INFORMATION TECHNOLOGY')},
+        {'source': CONTRACT_ACT, 'title': 'INDIAN CONTRACT',
+         'aliases': act_aliases(CONTRACT_ACT, 'INDIAN CONTRACT')},
+    ]
+    sections = {
+        '0:2': [1, 2], '0:3': [3, 3], '0:43': [10, 12], '0:66A': [20, 21],
+        '1:2': [101, 102], '1:3': [103, 103], '1:10': [110, 111], '1:150': [150, 151],
+    }
+    chapters = {'0:9': [30, 40], '1:9': [160, 170]}
+    with open(tmp_path / CITATIONS_FILE, 'w', encoding='utf-8') as f:
+        json.dump({'acts': acts, 'sections': sections, 'chapters': chapters}, f)
+    return CitationIndex(str(tmp_path))
+
+
+@pytest.mark.parametrize('question, expected', [
+    ('What does section 43 of the IT Act say?', ('INFORMATION TECHNOLOGY', 'section', '43', 10)),
+    ('Explain Section 66A of the Information Technology Act', ('INFORMATION TECHNOLOGY', 'section', '66A', 20)),
+    ('sec. 43 of the IT act', ('INFORMATION TECHNOLOGY', 'section', '43', 10)),
+    ('s. 10 of the contract act', ('INDIAN CONTRACT', 'section', '10', 110)),
+    ('What does section 150 say?', ('INDIAN CONTRACT', 'section', '150', 150)),
+    ('Chapter IX of the Indian Contract Act', ('INDIAN CONTRACT', 'chapter', '9', 160)),
+])
+def test_citations(index, question, expected):
+    title, kind, number, rows = index.lookup(question)
+    assert (title, kind, number, rows[0]) == expected
+
+
+@pytest.mark.parametrize('question', [
+    # possessives are not section abbreviations
+    "What are a firm's 3 partners liable for under the contract act?",
+    "Can a company's 2 directors be punished under the IT act?",
+    'Can a firm’s 3 partners sue under the contract act?',
+    # abbreviations without their dot
+    'sec 43 of the IT act',
+    # the Act named is not in the index, even if another Act has the number
+    'What does section 150 of the Companies Act say?',
+    'What does section 43 of the Companies Act, 2013 say?',
+    # the named Act has no such section
+    'What does section 150 of the IT Act say?',
+    # numbered in both Acts and no Act named
+    'What does section 2 of the act say?',
+    # more than one citation
+    'Compare section 2 and section 3 of the IT Act',
+    'What is a valid contract?',
+])
+def test_not_citations(index, question):
+    assert index.lookup(question) is None
+
+
+def test_roman_to_int():
+    assert [roman_to_int(n) for n in ('ix', 'XIV', 'xl', '12')] == [9, 14, 40, 12]
+
+
+def test_build_skips_contents_and_footnotes(tmp_path):
+    rows = [
+        'THE INFORMATION TECHNOLOGY ACT, 2000',
+        # arrangement of sections, many headings per row
+        *['\n'.join(f'{n}. Heading {n}.' for n in range(first, first + 3)) for first in range(1, 40, 3)],
+        'CHAPTER I',
+        '1. Short title, extent and commencement.',
+        '2. Definitions. In this Act',
+        '3. Subs. by Act 10 of 2009',
+        '3. Authentication of electronic records.',
+        'CHAPTER II',
+        '43. Penalty and compensation for damage to computer.',
+        '1[66A. Punishment for sending offensive messages.',
+    ]
+    writer = ChunkStoreWriter(str(tmp_path))
+    for row in rows:
+        writer.append(row, {'source': IT_ACT, 'page': 0})
+    writer.close()
+
+    build_citation_index(str(tmp_path))
+    with open(tmp_path / CITATIONS_FILE, encoding='utf-8') as f:
+        data = json.load(f)
+
+    body = rows.index('CHAPTER I')
+    assert data['sections'] == {
+        '0:1': [body + 1, body + 2],
+        '0:2': [body + 2, body + 4],
+        '0:3': [body + 4, body + 6],
+        '0:43': [body + 6, body + 7],
+        '0:66A': [body + 7, body + 7],
+    }
+    assert data['chapters']['0:1'][0] == body
+    assert data['acts'][0]['title'] == 'INFORMATION TECHNOLOGY'
@@ -0,0 +1,84 @@
+from langchain_core.documents import Document
+
+from context_builder import assemble_context, overlap_length, truncate
+from tokens import count_tokens
+
+
+def hit(text, row, source='contract.pdf', page=0, distance=0.5):
+    return Document(page_content=text, metadata={'source': source, 'page': page, 'row': row}), distance
+
+
+def test_overlap_length():
+    assert overlap_length('all agreements are contracts if made by free consent', 'made by free consent of parties') == 20
+    # shorter shared text is a coincidence, not splitter overlap
+    assert overlap_length('hello world', 'world peace') == 0
+    assert overlap_length('abc', 'xyz') == 0
+
+
+def test_adjacent_rows_merge_without_their_overlap():
+    results = [
+        hit('made by free consent of parties competent to contract', 2),
+        hit('All agreements are contracts if made by free consent', 1),
+    ]
+    assert assemble_context(results, 1000) == (
+        'All agreements are contracts if made by free consent of parties competent to contract'
+    )
+
+
+def test_rows_of_other_pages_or_gaps_stay_apart_in_document_order():
+    results = [
+        hit('Section 73 compensation for loss or damage caused by breach', 9),
+        hit('Section 2 interpretation clause of the act', 1),
+        hit('Section 3 communication of proposals and acceptances', 2, page=1),
+    ]
+    context = assemble_context(results, 1000)
+    assert context.split('\n\n') == [
+        'Section 2 interpretation clause of the act',
+        'Section 3 communication of proposals and acceptances',
+        'Section 73 compensation for loss or damage caused by breach',
+    ]
+
+
+def test_documents_are_ordered_by_their_best_hit():
+    results = [
+        hit('Section 43 penalty for damage to computer system', 5, source='it.pdf'),
+        hit('Section 10 what agreements are contracts', 3),
+    ]
+    assert assemble_context(results, 1000).startswith('Section 43')
+
+
+def test_repeated_rows_and_near_duplicates_are_dropped():
+    clause = 'an agreement made without consideration is void unless it is in writing and registered'
+    results = [
+        hit(clause, 4),
+        # the same row again, as FAISS and BM25 fusion can return it
+        hit(clause, 4),
+        # the same clause quoted in another Act
+        hit(clause + ' under this act', 30, source='other.pdf'),
+        hit('Section 25 exceptions to the rule above', 40, source='other.pdf'),
+    ]
+    assert assemble_context(results, 1000).split('\n\n') == [clause, 'Section 25 exceptions to the rule above']
+
+
+def test_passages_are_kept_by_rank_within_the_budget():
+    long = ' '.join(['consideration'] * 40)
+    results = [
+        hit('Section 2 definitions of the act', 1),
+        hit(long, 10),
+        hit('Section 7 acceptance must be absolute', 20),
+    ]
+    budget = count_tokens('Section 2 definitions of the act') + count_tokens('Section 7 acceptance must be absolute')
+    # the long passage does not fit after the first, the shorter third still does
+    assert assemble_context(results, budget).split('\n\n') == [
+        'Section 2 definitions of the act',
+        'Section 7 acceptance must be absolute',
+    ]
+
+
+def test_first_passage_over_budget_is_truncated():
+    text = 'first line of the section\nsecond line of the section\nthird line'
+    context = assemble_context([hit(text, 1)], count_tokens('first line of the section') + 1)
+    assert context == 'first line of the section'
+
+    words = ' '.join(['consideration'] * 40)
+    assert 0 < count_tokens(truncate(words, 10)) <= 10
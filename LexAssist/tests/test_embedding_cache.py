@@ -0,0 +1,114 @@
+import time
+
+import numpy as np
+
+import embedding_cache
+from embedding_cache import CachedEmbeddings, EmbeddingCache
+
+
+class CountingEmbeddings:
+    """Embeds a text as [len, first char], counting the texts it computes"""
+
+    def __init__(self):
+        self.computed = []
+
+    def embed_documents(self, texts):
+        self.computed += texts
+        return [[float(len(text)), float(ord(text[0]))] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def cached(tmp_path, max_bytes=1 << 20, model='m'):
+    underlying = CountingEmbeddings()
+    cache = EmbeddingCache(str(tmp_path / 'cache.sqlite3'), max_bytes=max_bytes)
+    return underlying, CachedEmbeddings(underlying, model, cache)
+
+
+def test_each_text_is_embedded_once(tmp_path):
+    underlying, embeddings = cached(tmp_path)
+
+    first = embeddings.embed_documents(['contract', 'offer', 'contract'])
+    assert underlying.computed == ['contract', 'offer']
+    assert embeddings.embed_documents(['offer', 'contract']) == [first[1], first[0]]
+    assert underlying.computed == ['contract', 'offer']
+    assert embeddings.cache.stats()['hits'] == 2
+
+
+def test_cache_persists_across_instances(tmp_path):
+    _, embeddings = cached(tmp_path)
+    vector = embeddings.embed_documents(['consideration'])[0]
+    embeddings.cache.close()
+
+    underlying, embeddings = cached(tmp_path)
+    assert embeddings.embed_documents(['consideration'])[0] == vector
+    assert underlying.computed == []
+
+
+def test_queries_models_and_documents_are_kept_apart(tmp_path):
+    underlying, embeddings = cached(tmp_path)
+    embeddings.embed_documents(['bail'])
+    embeddings.embed_query('bail')
+    assert embeddings.embed_queries(['bail', 'bail']) == [[4.0, 98.0]] * 2
+    assert underlying.computed == ['bail', 'bail']
+
+    other = CachedEmbeddings(underlying, 'other', embeddings.cache)
+    other.embed_documents(['bail'])
+    assert underlying.computed == ['bail', 'bail', 'bail']
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_cache, 'TOUCH_SECONDS', 0)
+    # room for about four 2-dimensional float32 vectors
+    _, embeddings = cached(tmp_path, max_bytes=32)
+    cache = embeddings.cache
+    keys = [EmbeddingCache.key('n', str(i)) for i in range(5)]
+    for key in keys[:4]:
+        cache.put_many([(key, np.ones(2))])
+        time.sleep(0.002)
+    cache.get_many([keys[0]])
+    time.sleep(0.002)
+
+    cache.put_many([(keys[4], np.ones(2))])
+    assert cache.stats()['bytes'] <= 32
+    assert set(cache.get_many(keys)) >= {keys[0], keys[4]}
+    assert keys[1] not in cache.get_many(keys)
+
+
+def last_used(cache, key):
+    return cache._conn.execute('SELECT last_used FROM embeddings WHERE key = ?', (key,)).fetchone()[0]
+
+
+def test_hits_are_written_with_the_next_put(tmp_path):
+    _, embeddings = cached(tmp_path)
+    cache = embeddings.cache
+    old, new = EmbeddingCache.key('n', 'old'), EmbeddingCache.key('n', 'new')
+    cache.put_many([(old, np.ones(2)), (new, np.ones(2))])
+    cache._conn.execute('UPDATE embeddings SET last_used = 0 WHERE key = ?', (old,))
+    cache._conn.commit()
+    fresh = last_used(cache, new)
+
+    cache.get_many([old, new])
+    assert last_used(cache, old) == 0
+
+    cache.put_many([(EmbeddingCache.key('n', 'other'), np.ones(2))])
+    assert last_used(cache, old) > 0
+    # used within TOUCH_SECONDS, so not written again
+    assert last_used(cache, new) == fresh
+
+
+def test_touches_are_flushed_in_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_cache, 'TOUCH_SECONDS', 0)
+    monkeypatch.setattr(embedding_cache, 'TOUCH_BATCH', 2)
+    _, embeddings = cached(tmp_path)
+    cache = embeddings.cache
+    keys = [EmbeddingCache.key('n', str(i)) for i in range(2)]
+    cache.put_many([(key, np.ones(2)) for key in keys])
+    cache._conn.execute('UPDATE embeddings SET last_used = 0')
+    cache._conn.commit()
+
+    cache.get_many(keys[:1])
+    assert last_used(cache, keys[0]) == 0
+    cache.get_many(keys[1:])
+    assert min(last_used(cache, key) for key in keys) > 0
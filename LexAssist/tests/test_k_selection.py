@@ -0,0 +1,43 @@
+import pytest
+
+from k_selection import question_features, select_k_by_score_gap, select_k_heuristic
+
+
+def test_question_features():
+    assert question_features('Compare void and voidable contracts, and list when each arises') == {
+        'words': 10, 'clauses': 4, 'broad': 2, 'narrow': 0,
+    }
+
+
+@pytest.mark.parametrize('question, k', [
+    # one definition
+    ('What is bail?', 3),
+    ('What are the conditions for a valid contract', 6),
+    ('List the steps to file a complaint', 12),
+    # several provisions to compare
+    ('Compare void and voidable contracts and list when each arises', 18),
+])
+def test_heuristic_grows_with_the_question(question, k):
+    assert select_k_heuristic(question) == k
+
+
+def test_heuristic_respects_max_k():
+    assert select_k_heuristic('Compare void and voidable contracts and list when each arises', max_k=10) == 10
+    assert select_k_heuristic('What is bail?', max_k=1) == 1
+
+
+def test_score_gap_cuts_at_the_largest_jump():
+    assert select_k_by_score_gap([0.1, 0.12, 0.13, 0.6, 0.62]) == 3
+
+
+def test_score_gap_keeps_at_least_min_k():
+    # the jump after the first hit is before min_k, the next largest wins
+    assert select_k_by_score_gap([0.1, 0.9, 0.95, 1.0, 1.4]) == 4
+    assert select_k_by_score_gap([0.1, 0.9]) == 2
+    assert select_k_by_score_gap([]) == 0
+
+
+def test_score_gap_falls_back_to_default_k_when_evenly_spread():
+    even = [0.1 + 0.02 * i for i in range(8)]
+    assert select_k_by_score_gap(even, default_k=5) == 5
+    assert select_k_by_score_gap(even[:4], default_k=5) == 4
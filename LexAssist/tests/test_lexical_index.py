@@ -0,0 +1,23 @@
+from chunk_store import ChunkStoreWriter
+from lexical_index import LexicalIndex, build_lexical_index, reciprocal_rank_fusion, tokenize
+
+
+def test_tokenize_keeps_section_numbers_and_it():
+    assert tokenize('What does Section 66A of the IT Act say?') == ['section', '66a', 'it', 'act']
+
+
+def test_search_ranks_exact_terms(tmp_path):
+    writer = ChunkStoreWriter(str(tmp_path))
+    for text in ('The Indian Contract Act, 1872.', 'The IT Act, 2000. Section 66A.', 'Consideration is needed.'):
+        writer.append(text, {'source': 'acts.pdf', 'page': 0})
+    writer.close()
+    build_lexical_index(str(tmp_path))
+
+    index = LexicalIndex(str(tmp_path))
+    assert index.search('penalty under the IT Act', 2)[0][0] == 1
+    assert index.search('section 66A', 2)[0][0] == 1
+    assert index.search('unrelated words', 2) == []
+
+
+def test_reciprocal_rank_fusion():
+    assert reciprocal_rank_fusion([[1, 2, 3], [3, 1]]) == [1, 3, 2]
@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+from llm_backends import FakeChatModel
+
+ANSWER_PROMPT = (
+    'Context:\n'
+    'Section 302 of the IPC: punishment for murder.  Whoever commits murder shall be punished.\n\n'
+    'Question:\nWhat is section 302?\n'
+)
+PROMPTS = [
+    ANSWER_PROMPT,
+    'Context:\n\nQuestion:\nanything\n',
+    'Reply with a single integer.\nQuestion:\nWhat is the punishment for theft?\n',
+    'Reply with a JSON object.\nQuestion:\nbail   under  section 437\n',
+]
+
+
+def fake():
+    return FakeChatModel(latency_ms=0, latency_sigma=0, tokens_per_second=0)
+
+
+@pytest.mark.parametrize('prompt', PROMPTS)
+def test_stream_joins_to_invoke(prompt):
+    model = fake()
+    reply = model.invoke(prompt).content
+    assert ''.join(chunk.content for chunk in model.stream(prompt)) == reply
+
+
+@pytest.mark.parametrize('prompt', PROMPTS)
+def test_astream_joins_to_ainvoke(prompt):
+    model = fake()
+
+    async def main():
+        chunks = [chunk.content async for chunk in model.astream(prompt)]
+        return ''.join(chunks), (await model.ainvoke(prompt)).content
+
+    streamed, reply = asyncio.run(main())
+    assert streamed == reply
+
+
+def test_stream_is_word_by_word():
+    pieces = [chunk.content for chunk in fake().stream(ANSWER_PROMPT)]
+    assert len(pieces) > 1
+    assert not pieces[-1].endswith(' ')
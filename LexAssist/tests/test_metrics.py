@@ -0,0 +1,90 @@
+import asyncio
+import time
+
+import pytest
+
+import metrics
+import query
+
+
+def outcomes(outcome):
+    return metrics.query_outcomes._values.get((outcome,), 0)
+
+
+def http_seconds(route, status='200'):
+    # (total seconds, requests) observed for route
+    _, total, count = metrics.http_seconds._series.get((route, status), [None, 0.0, 0])
+    return total, count
+
+
+def slow_stream(question, seconds=0.05):
+    for word in ('three', 'slow', 'tokens'):
+        time.sleep(seconds)
+        yield 'token', word + ' '
+    yield 'done', {'answer': 'three slow tokens '}
+
+
+def failing_search(*args, **kwargs):
+    raise RuntimeError('index unavailable')
+
+
+async def failing_asearch(*args, **kwargs):
+    raise RuntimeError('index unavailable')
+
+
+def test_stream_error_is_counted(monkeypatch):
+    monkeypatch.setattr(query, 'answer_cache', None)
+    monkeypatch.setattr(query, 'search', failing_search)
+    before = outcomes('error')
+
+    with pytest.raises(RuntimeError):
+        list(query.stream_query('What is a valid contract?'))
+    assert outcomes('error') == before + 1
+
+
+def test_astream_error_is_counted(monkeypatch):
+    monkeypatch.setattr(query, 'answer_cache', None)
+    monkeypatch.setattr(query, 'asearch', failing_asearch)
+    before = outcomes('error')
+
+    async def main():
+        return [event async for event in query.astream_query('What is a valid contract?')]
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(main())
+    assert outcomes('error') == before + 1
+
+
+def test_flask_stream_is_timed_to_its_last_event(backend, monkeypatch):
+    monkeypatch.setattr(backend, 'RAG_AVAILABLE', True)
+    monkeypatch.setattr(backend, 'rag_stream_query', slow_stream)
+    total, count = http_seconds('/api/query/stream')
+
+    response = backend.app.test_client().post('/api/query/stream', json={'question': 'q'})
+    assert b'event: done' in response.get_data()
+    response.close()
+
+    after_total, after_count = http_seconds('/api/query/stream')
+    assert after_count == count + 1
+    assert after_total - total >= 0.15
+
+
+def test_asgi_stream_is_timed_to_its_last_event(asgi_app):
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    async def main():
+        send_observed = asgi_app.observed(send, '/test/stream')
+        await send_observed({'type': 'http.response.start', 'status': 200, 'headers': []})
+        await asyncio.sleep(0.05)
+        await send_observed({'type': 'http.response.body', 'body': b'a', 'more_body': True})
+        assert http_seconds('/test/stream') == (0.0, 0)
+        await asyncio.sleep(0.05)
+        await send_observed({'type': 'http.response.body', 'body': b''})
+
+    asyncio.run(main())
+    total, count = http_seconds('/test/stream')
+    assert count == 1 and total >= 0.1
+    assert len(sent) == 3
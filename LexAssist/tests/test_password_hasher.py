@@ -0,0 +1,64 @@
+import threading
+import time
+
+import pytest
+
+
+def blocked(release):
+    def fn():
+        release.wait(5)
+        return threading.current_thread().name
+    return fn
+
+
+def test_hashes_run_on_the_pool(backend):
+    hasher = backend.PasswordHasher(workers=2, queue=0, timeout=5)
+    assert hasher.run(lambda x: x * 2, 21) == 42
+    assert hasher.run(lambda: threading.current_thread().name).startswith('password-kdf')
+
+
+def test_full_pool_sheds_with_429_and_recovers(backend):
+    hasher = backend.PasswordHasher(workers=1, queue=1, timeout=5)
+    release = threading.Event()
+    waiting = [threading.Thread(target=hasher.run, args=(blocked(release),)) for _ in range(2)]
+    for thread in waiting:
+        thread.start()
+    time.sleep(0.05)
+
+    with pytest.raises(backend.PasswordHashingBusy) as busy:
+        hasher.run(lambda: None)
+    assert busy.value.status == 429
+
+    release.set()
+    for thread in waiting:
+        thread.join()
+    assert hasher.run(lambda: 'ok') == 'ok'
+
+
+def test_slow_hash_times_out_with_503_and_frees_its_slot(backend):
+    hasher = backend.PasswordHasher(workers=1, queue=0, timeout=0.05)
+    with pytest.raises(backend.PasswordHashingBusy) as busy:
+        hasher.run(time.sleep, 0.2)
+    assert busy.value.status == 503
+
+    # the abandoned hash still holds the only slot until it finishes
+    with pytest.raises(backend.PasswordHashingBusy):
+        hasher.run(lambda: None)
+    time.sleep(0.3)
+    assert hasher.run(lambda: 'ok') == 'ok'
+
+
+def test_overloaded_signup_is_503_with_retry_after(backend, monkeypatch):
+    def slow_hash(password, method=None):
+        time.sleep(0.2)
+        return 'hash'
+
+    monkeypatch.setattr(backend, 'password_hasher', backend.PasswordHasher(workers=1, queue=0, timeout=0.05))
+    monkeypatch.setattr(backend, 'generate_password_hash', slow_hash)
+
+    response = backend.app.test_client().post(
+        '/api/auth/signup', json={'name': 'A', 'email': 'busy@example.com', 'password': 'secret'}
+    )
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert backend.get_user_by_email('busy@example.com') is None
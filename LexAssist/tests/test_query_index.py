@@ -0,0 +1,58 @@
+import query
+from langchain_core.documents import Document
+from resources import ResourceManager
+
+
+class Chunks:
+    def __init__(self, gen):
+        self.path = gen
+
+    def document(self, row):
+        return Document(page_content=self.path, metadata={'row': row})
+
+
+class VectorStore:
+    """Every row of generation `gen` reads as the text `gen`"""
+
+    def __init__(self, gen):
+        self.chunks = Chunks(gen)
+
+    def similarity_search_with_score_by_vector(self, vector, k=4):
+        return [(self.chunks.document(row), 0.1 * row) for row in range(3)]
+
+    def distances(self, vector, rows):
+        return [0.5 for _ in rows]
+
+
+class Lexical:
+    def search(self, query, k=10):
+        # rows FAISS did not return, read from the vectorstore by the fusion
+        return [(7, 2.0), (8, 1.0)]
+
+
+class Embeddings:
+    def embed_query(self, text):
+        return [0.0, 1.0]
+
+
+def test_reload_during_a_query_keeps_its_generation(monkeypatch):
+    generations = ['gen-1']
+    resources = ResourceManager()
+    resources.register('embeddings', Embeddings)
+    resources.register('index', lambda: (VectorStore(generations[-1]), Lexical(), None))
+    resources.register('reranker', lambda: None)
+    monkeypatch.setattr(query, 'resources', resources)
+    monkeypatch.setattr(query, 'index_generation', lambda: None)
+
+    def plan_and_publish(question):
+        # another thread picks up a new generation while this query plans
+        generations.append('gen-2')
+        resources.reload('index')
+        return question, 5
+
+    monkeypatch.setattr(query, 'plan_query', plan_and_publish)
+    results = query.search('What is a valid contract?')
+
+    assert {doc.metadata['row'] for doc, _ in results} >= {7, 8}
+    assert {doc.page_content for doc, _ in results} == {'gen-1'}
+    assert resources.get('index')[0].chunks.path == 'gen-2'
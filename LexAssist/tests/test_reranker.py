@@ -0,0 +1,72 @@
+import time
+
+from langchain_core.documents import Document
+
+from reranker import Reranker, fit_token_budget
+
+
+class SlowModel:
+    """Scores a pair by the number in its text, taking `seconds` per pair"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.pairs = 0
+
+    def predict(self, pairs, batch_size=None, show_progress_bar=False):
+        time.sleep(self.seconds * len(pairs))
+        self.pairs += len(pairs)
+        return [float(text.split()[-1]) if text[-1].isdigit() else 0.0 for _, text in pairs]
+
+
+def hits(n):
+    # retrieval order is 0, 1, 2, ...; relevance grows with the number
+    return [(Document(page_content=f'chunk {i}'), float(i)) for i in range(n)]
+
+
+def numbers(results):
+    return [int(doc.page_content.split()[-1]) for doc, _ in results]
+
+
+def test_rerank_orders_by_score():
+    reranker = Reranker(SlowModel(0), pair_seconds=0.001)
+    assert numbers(reranker.rerank('q', hits(5), 10_000)) == [4, 3, 2, 1, 0]
+
+
+def test_first_request_respects_budget():
+    # no warm-up: the default cost estimate must still bound the first call
+    model = SlowModel(0.01)
+    reranker = Reranker(model, batch_size=16)
+    started = time.perf_counter()
+    reranker.rerank('q', hits(40), 10_000, latency_ms=50)
+    assert time.perf_counter() - started < 0.1
+    assert model.pairs < 40
+
+
+def test_partial_scores_are_kept():
+    model = SlowModel(0.01)
+    reranker = Reranker(model, batch_size=4, pair_seconds=0.01)
+    kept = numbers(reranker.rerank('q', hits(20), 10_000, latency_ms=45))
+
+    scored = model.pairs
+    assert 0 < scored < 20
+    # the scored prefix is reordered, the rest keeps retrieval order
+    assert kept[:scored] == sorted(range(scored), reverse=True)
+    assert kept[scored:] == list(range(scored, 20))
+    assert reranker.stats()['partial_over_budget'] == 1
+
+
+def test_over_budget_keeps_retrieval_order():
+    reranker = Reranker(SlowModel(0.01), pair_seconds=1.0)
+    assert numbers(reranker.rerank('q', hits(5), 10_000, latency_ms=50)) == [0, 1, 2, 3, 4]
+    assert reranker.stats()['skipped_over_budget'] == 1
+
+
+def test_warm_up_measures_cost():
+    reranker = Reranker(SlowModel(0.002), batch_size=4)
+    reranker.warm_up()
+    assert 0.0015 < reranker.pair_seconds < 0.02
+
+
+def test_fit_token_budget_skips_long_hits():
+    results = [(Document(page_content=text), 0.0) for text in ('a b', 'c ' * 50, 'd e')]
+    assert [doc.page_content for doc, _ in fit_token_budget(results, 5)] == ['a b', 'd e']
@@ -0,0 +1,20 @@
+from resources import ResourceManager
+
+
+def test_loads_once_and_reloads():
+    calls = []
+    resources = ResourceManager()
+    resources.register('index', lambda: calls.append(1) or len(calls))
+
+    assert resources.get('index') == 1
+    assert resources.get('index') == 1
+
+    resources.reload('index')
+    assert not resources.loaded('index')
+    assert resources.get('index') == 2
+
+
+def test_status_never_loads():
+    resources = ResourceManager()
+    resources.register('index', lambda: 1 / 0)
+    assert resources.status()['state'] == 'cold'
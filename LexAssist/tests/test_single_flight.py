@@ -0,0 +1,91 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def test_overlapping_calls_share_one_run():
+    flights = SingleFlight()
+    runs = []
+    release = threading.Event()
+
+    def compute():
+        runs.append(1)
+        release.wait(5)
+        return 'answer'
+
+    with ThreadPoolExecutor(8) as pool:
+        futures = [pool.submit(flights.do, 'q', compute) for _ in range(8)]
+        # let every caller join the flight before the leader returns
+        while flights.calls + flights.coalesced < 8:
+            time.sleep(0.001)
+        release.set()
+        results = [f.result() for f in futures]
+
+    assert results == ['answer'] * 8
+    assert len(runs) == 1
+    assert flights.stats() == {'calls': 1, 'coalesced': 7, 'coalesced_rate': 0.875}
+
+
+def test_error_reaches_every_waiter_and_is_not_kept():
+    flights = SingleFlight()
+    release = threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise ValueError('boom')
+
+    with ThreadPoolExecutor(3) as pool:
+        futures = [pool.submit(flights.do, 'q', fail) for _ in range(3)]
+        while flights.calls + flights.coalesced < 3:
+            time.sleep(0.001)
+        release.set()
+        for future in futures:
+            with pytest.raises(ValueError):
+                future.result()
+
+    # nothing is cached once the call has ended
+    assert flights.do('q', lambda: 'fresh') == 'fresh'
+
+
+def test_different_keys_do_not_coalesce():
+    flights = SingleFlight()
+    assert [flights.do(key, lambda key=key: key) for key in 'abc'] == ['a', 'b', 'c']
+    assert flights.coalesced == 0
+
+
+def test_ado_shares_one_coroutine():
+    flights = SingleFlight()
+    runs = []
+
+    async def compute():
+        runs.append(1)
+        await asyncio.sleep(0.01)
+        return 'answer'
+
+    async def main():
+        return await asyncio.gather(*(flights.ado('q', compute) for _ in range(5)))
+
+    assert asyncio.run(main()) == ['answer'] * 5
+    assert len(runs) == 1
+
+
+def test_ado_cancelled_waiter_does_not_cancel_others():
+    flights = SingleFlight()
+
+    async def compute():
+        await asyncio.sleep(0.02)
+        return 'answer'
+
+    async def main():
+        first = asyncio.ensure_future(flights.ado('q', compute))
+        second = asyncio.ensure_future(flights.ado('q', compute))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == 'answer'
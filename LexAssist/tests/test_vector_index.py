@@ -0,0 +1,77 @@
+import faiss
+import numpy as np
+import pytest
+
+from chunk_store import FlatIndexWriter, read_index_mmap
+from vector_index import build_index, is_pq, pq_nbits, search, set_search_params, write_index
+
+
+@pytest.fixture(scope='module')
+def flat():
+    vectors = np.random.default_rng(0).normal(size=(2000, 32)).astype(np.float32)
+    index = faiss.IndexFlatL2(32)
+    index.add(vectors)
+    return index
+
+
+@pytest.fixture(scope='module')
+def ivf_pq(flat):
+    index = build_index(flat, 'ivf_pq', pq_m=8)
+    set_search_params(index)
+    return index
+
+
+def test_is_pq(flat, ivf_pq, tmp_path):
+    assert is_pq(ivf_pq)
+    assert not is_pq(flat)
+    assert not is_pq(build_index(flat, 'ivf_flat'))
+
+    # the type must also be seen on an index read back from disk
+    assert is_pq(read_index_mmap(write_index(ivf_pq, str(tmp_path), 'ivf_pq')))
+
+
+def test_pq_distances_are_rescored_exactly(flat, ivf_pq):
+    queries = flat.reconstruct_n(0, 20) + 0.01
+    distances, rows = search(ivf_pq, queries, 10, exact_index=flat)
+
+    for query, found, found_d in zip(queries, rows, distances):
+        exact = ((flat.reconstruct_n(0, flat.ntotal)[found] - query) ** 2).sum(axis=1)
+        np.testing.assert_allclose(found_d, exact, rtol=1e-5)
+
+
+def test_stored_vector_finds_itself_at_zero(flat, ivf_pq):
+    distances, rows = search(ivf_pq, flat.reconstruct_n(5, 1), 1, exact_index=flat)
+    assert rows[0, 0] == 5
+    assert distances[0, 0] == pytest.approx(0.0, abs=1e-5)
+
+
+def test_small_corpus_caps_centroids():
+    # 1,511 chunks cannot train 256 centroids per sub-quantizer
+    assert 2 ** pq_nbits(1511) * 39 <= 1511
+    assert pq_nbits(10 ** 6) == 8
+    assert pq_nbits(10) == 1
+
+
+def test_explicit_nlist_is_capped(flat):
+    index = build_index(flat, 'ivf_flat', nlist=4096)
+    assert faiss.extract_index_ivf(index).nlist <= flat.ntotal // 39
+
+
+def test_flat_index_writer_matches_faiss(flat, tmp_path):
+    path = str(tmp_path / 'index.faiss')
+    writer = FlatIndexWriter(path)
+    vectors = flat.reconstruct_n(0, flat.ntotal)
+    writer.append(vectors[:700])
+    writer.append(vectors[700:])
+    np.testing.assert_array_equal(writer.vector(1234), vectors[1234])
+    assert writer.close()
+
+    written = faiss.read_index(path)
+    assert written.ntotal == flat.ntotal
+    np.testing.assert_array_equal(written.reconstruct_n(0, written.ntotal), vectors)
+
+
+def test_flat_index_writer_empty(tmp_path):
+    writer = FlatIndexWriter(str(tmp_path / 'index.faiss'))
+    assert not writer.close()
+    assert not list(tmp_path.iterdir())